@@ -12,12 +12,17 @@ from alerta.exceptions import ExceptionHandlers
 from alerta.models.alarms import AlarmModel
 from alerta.models.enums import Scope
 from alerta.utils.audit import AuditTrail
+from alerta.utils.auth import AuthCache
+from alerta.utils.blackout import BlackoutIndex
+from alerta.utils.cache import ResponseCache
 from alerta.utils.config import Config
 from alerta.utils.hooks import HookTrigger
-from alerta.utils.key import ApiKeyHelper
+from alerta.utils.key import ApiKeyCache, ApiKeyHelper
 from alerta.utils.logging import Logger
 from alerta.utils.mailer import Mailer
-from alerta.utils.plugin import Plugins
+from alerta.utils.plugin import PluginExecutor, Plugins
+from alerta.utils.scheduler import HousekeepingScheduler
+from alerta.utils.stream import AlertStream
 from alerta.utils.tracing import Tracing
 from alerta.utils.webhook import CustomWebhooks
 from alerta.version import __version__
@@ -36,13 +41,20 @@ cors = CORS()
 compress = Compress()
 handlers = ExceptionHandlers()
 key_helper = ApiKeyHelper()
+key_cache = ApiKeyCache()
+auth_cache = AuthCache()
 
 db = Database()
 qb = QueryBuilder()
+blackout_index = BlackoutIndex()
+response_cache = ResponseCache()
 
 mailer = Mailer()
 plugins = Plugins()
+plugin_executor = PluginExecutor()
 custom_webhooks = CustomWebhooks()
+scheduler = HousekeepingScheduler()
+alert_stream = AlertStream()
 
 
 def create_app(config_override: Dict[str, Any] = None, environment: str = None) -> Flask:
@@ -66,13 +78,20 @@ def create_app(config_override: Dict[str, Any] = None, environment: str = None)
     compress.init_app(app)
     handlers.register(app)
     key_helper.init_app(app)
+    key_cache.init_app(app)
+    auth_cache.init_app(app)
 
     db.init_db(app)
     qb.init_app(app)
+    blackout_index.init_app(app)
+    response_cache.init_app(app)
 
     mailer.register(app)
     plugins.register(app)
+    plugin_executor.init_app(app)
     custom_webhooks.register(app)
+    scheduler.init_app(app)
+    alert_stream.init_app(app)
 
     from alerta.utils.format import AlertaJsonProvider
     app.json_provider_class = AlertaJsonProvider
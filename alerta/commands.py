@@ -1,4 +1,5 @@
 import sys
+import time
 from datetime import datetime, timedelta
 from typing import Any, Dict
 
@@ -6,7 +7,7 @@ import click
 from flask import Flask, current_app
 from flask.cli import FlaskGroup, ScriptInfo, with_appcontext
 
-from alerta.app import config, create_app, db, key_helper, qb
+from alerta.app import config, create_app, db, key_helper, qb, scheduler
 from alerta.auth.utils import generate_password_hash
 from alerta.models.enums import Scope
 from alerta.models.key import ApiKey
@@ -34,8 +35,8 @@ def cli(ctx):
     """
     Management command-line tool for Alerta server.
     """
-    if ctx.invoked_subcommand in ['routes', 'run', 'shell']:
-        # Load HTTP endpoints for standard Flask commands
+    if ctx.invoked_subcommand in ['routes', 'run', 'shell', 'housekeeping']:
+        # Load HTTP endpoints for standard Flask commands, and plugins for housekeeping
         ctx.obj = ScriptInfo(create_app=create_app)
     else:
         # Do not load HTTP endpoints for management commands
@@ -215,3 +216,94 @@ def users():
         else:
             if user:
                 click.echo(f'{user.id} {user.login}')
+
+
+@cli.command('history', short_help='Move alert history to history table')
+@click.option('--batch-size', default=1000, type=int, help='Number of alerts moved in each transaction')
+@with_appcontext
+def history(batch_size):
+    """
+    Move alert history from the history array of every alert to the alert
+    history table used when HISTORY_TABLE is set (Postgres only). Run it after
+    stopping the API servers and before restarting them with HISTORY_TABLE set.
+    """
+    total = 0
+    try:
+        while True:
+            count = db.migrate_history(batch_size)
+            if not count:
+                break
+            total += count
+    except NotImplementedError as e:
+        raise click.UsageError(str(e))
+    except Exception as e:
+        click.echo(f'ERROR: {e}')
+        sys.exit(1)
+    click.echo(f'Moved history of {total} alerts')
+
+
+@cli.command('summary', short_help='Rebuild alert summary table')
+@with_appcontext
+def summary():
+    """
+    Recount alerts by customer, environment, service, severity and status in the
+    alert summary table used when ALERT_SUMMARY is set (Postgres only). It is
+    rebuilt when ALERT_SUMMARY is first set, so only run it if counts are wrong.
+    """
+    try:
+        count = db.rebuild_summary()
+    except NotImplementedError as e:
+        raise click.UsageError(str(e))
+    except Exception as e:
+        click.echo(f'ERROR: {e}')
+        sys.exit(1)
+    click.echo(f'Rebuilt alert summary with {count} groups')
+
+
+@cli.command('triggers', short_help='Drop alert triggers of a disabled feature')
+@click.option('--drop', 'feature', required=True, type=click.Choice(['stream', 'etag', 'summary']), help='Feature to drop triggers for')
+@with_appcontext
+def triggers(feature):
+    """
+    Drop the alert table triggers used by STREAM_ENABLED, ETAG_ENABLED or
+    ALERT_SUMMARY (Postgres only). Triggers are created at startup when a feature
+    is enabled but never dropped, so run this once the feature is disabled on all
+    instances sharing the database. Re-enabling the summary rebuilds it.
+    """
+    try:
+        count = db.drop_triggers(feature)
+    except NotImplementedError as e:
+        raise click.UsageError(str(e))
+    except Exception as e:
+        click.echo(f'ERROR: {e}')
+        sys.exit(1)
+    click.echo(f'Dropped {count} {feature} triggers')
+
+
+@cli.command('housekeeping', short_help='Expire, unshelve and unack alerts')
+@click.option('--interval', metavar='SECONDS', type=int, default=0, help='Run every x seconds (default=run once)')
+@with_appcontext
+def housekeeping(interval):
+    """
+    Delete old closed, expired and informational alerts, and expire, unshelve
+    and unack timed out alerts. Only one process runs housekeeping at a time so
+    it is safe to run it on more than one node, or with HOUSEKEEPING_INTERVAL set.
+    """
+    while True:
+        try:
+            result = scheduler.run_once()
+        except Exception as e:
+            click.echo(f'ERROR: {e}')
+            if not interval:
+                sys.exit(1)
+        else:
+            if result is None:
+                click.echo('Housekeeping already running')
+            else:
+                expired, unshelved, unacked, errors = result
+                for error in errors:
+                    click.echo(f'ERROR: {error}')
+                click.echo(f'Expired {len(expired)}, unshelved {len(unshelved)} and unacked {len(unacked)} alerts')
+        if not interval:
+            break
+        time.sleep(interval)
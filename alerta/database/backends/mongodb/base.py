@@ -1,9 +1,17 @@
+import json
+import logging
+import os
+import socket
+import threading
 from collections import defaultdict
 from datetime import datetime, timedelta
+from typing import List  # noqa
 
+from bson import json_util
 from flask import current_app
-from pymongo import ASCENDING, TEXT, MongoClient, ReturnDocument
-from pymongo.errors import ConnectionFailure
+from pymongo import (ASCENDING, TEXT, InsertOne, MongoClient, ReturnDocument,
+                     UpdateOne, monitoring)
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
 
 from alerta.app import alarm_model
 from alerta.database.base import Database
@@ -13,6 +21,84 @@ from alerta.models.heartbeat import HeartbeatStatus
 
 from .utils import Query
 
+HISTORY_FIELDS = {
+    'resource': 1,
+    'event': 1,
+    'environment': 1,
+    'customer': 1,
+    'service': 1,
+    'group': 1,
+    'tags': 1,
+    'attributes': 1,
+    'origin': 1,
+    'user': 1,
+    'timeout': 1,
+    'type': 1,
+    'history': 1
+}
+
+# clients created before a fork must not be used or closed by the child
+# process, so they are kept here instead of being garbage collected
+_inherited_clients = []  # type: List[MongoClient]
+_client_lock = threading.Lock()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Count connection pool events of the shared client.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.size = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.created = 0
+        self.recycled = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self.lock:
+            self.size += 1
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.size -= 1
+            self.recycled += 1
+
+    def connection_check_out_started(self, event):
+        with self.lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.waiting -= 1
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.waiting -= 1
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+
 # See https://github.com/MongoEngine/flask-mongoengine/blob/master/flask_mongoengine/__init__.py
 # See https://github.com/dcrosta/flask-pymongo/blob/master/flask_pymongo/__init__.py
 
@@ -23,6 +109,18 @@ class Backend(Database):
         self.uri = uri
         self.dbname = dbname
 
+        self._reset_client()
+        self.client_options = dict(
+            minPoolSize=app.config['DATABASE_POOL_MIN_SIZE'],
+            maxPoolSize=app.config['DATABASE_POOL_MAX_SIZE'],
+            waitQueueTimeoutMS=app.config['DATABASE_POOL_TIMEOUT'] * 1000,
+            connectTimeoutMS=app.config['DATABASE_CONNECT_TIMEOUT'] * 1000,
+            serverSelectionTimeoutMS=app.config['DATABASE_SERVER_SELECTION_TIMEOUT'] * 1000,
+            socketTimeoutMS=app.config['DATABASE_SOCKET_TIMEOUT'] * 1000 or None,
+            readPreference=app.config['DATABASE_READ_PREFERENCE'],
+            **app.config['DATABASE_WRITE_CONCERN']
+        )
+
         db = self.connect()
 
         try:
@@ -39,12 +137,43 @@ class Backend(Database):
                 raise
             app.logger.warning(e)
 
+        try:
+            self._update_status_expire_times(db, app.config['ACK_TIMEOUT'], app.config['SHELVE_TIMEOUT'])
+        except Exception as e:
+            if raise_on_error:
+                raise
+            app.logger.warning(e)
+
+        self.close(db)
+
+    def _reset_client(self):
+        client = getattr(self, 'client', None)
+        if client:
+            if self.client_pid == os.getpid():
+                client.close()
+            else:
+                _inherited_clients.append(client)
+        self.client = None
+        self.client_pid = None
+        self.pool_stats = None
+
     def connect(self):
-        self.client = MongoClient(self.uri)
+        if not self.client_options['maxPoolSize']:
+            client = MongoClient(self.uri, **dict(self.client_options, maxPoolSize=None))
+        else:
+            if not self.client or self.client_pid != os.getpid():
+                with _client_lock:
+                    if not self.client or self.client_pid != os.getpid():
+                        self._reset_client()
+                        self.pool_stats = PoolStats()
+                        self.client = MongoClient(self.uri, event_listeners=[self.pool_stats], **self.client_options)
+                        self.client_pid = os.getpid()
+                        logging.getLogger('alerta.database').info('Database client created (pid=%s)', os.getpid())
+            client = self.client
         if self.dbname:
-            return self.client[self.dbname]
+            return client[self.dbname]
         else:
-            return self.client.get_database()
+            return client.get_database()
 
     @staticmethod
     def _create_indexes(db):
@@ -53,6 +182,11 @@ class Backend(Database):
             unique=True
         )
         db.alerts.create_index([('$**', TEXT)])
+        db.alerts.create_index([('updateTime', ASCENDING)])
+        db.alerts.create_index([('lastReceiveTime', ASCENDING)])
+        db.alerts.create_index([('statusExpireTime', ASCENDING)],
+                               partialFilterExpression={'statusExpireTime': {'$type': 'date'}})
+        db.tombstones.create_index([('deleteTime', ASCENDING)])
         db.customers.drop_indexes()  # FIXME: should only drop customers index if it's unique (ie. the old one)
         db.customers.create_index([('match', ASCENDING)])
         db.heartbeats.create_index([('origin', ASCENDING), ('customer', ASCENDING)], unique=True)
@@ -66,6 +200,26 @@ class Backend(Database):
         db.groups.create_index([('name', ASCENDING)], unique=True)
         db.metrics.create_index([('group', ASCENDING), ('name', ASCENDING)], unique=True)
 
+    @staticmethod
+    def _update_status_expire_times(db, ack_timeout, shelve_timeout):
+        # one-off update of acked and shelved alerts created before status expire times were stored
+        actions = {'ack': ('ack', ack_timeout), 'shelved': ('shelve', shelve_timeout)}
+        query = {'status': {'$in': list(actions)}, 'statusExpireTime': {'$exists': False}}
+        for doc in db.alerts.find(query, {'status': 1, 'history': 1}):
+            action, default_timeout = actions[doc['status']]
+            history = doc.get('history', [])
+            update = {'previousStatus': None, 'previousTimeout': None, 'statusExpireTime': None}
+            for i, h in enumerate(history):
+                if h.get('type') == action and h.get('status') == doc['status']:
+                    if i + 1 < len(history):
+                        update['previousStatus'] = history[i + 1].get('status')
+                        update['previousTimeout'] = history[i + 1].get('timeout')
+                    timeout = h.get('timeout', default_timeout)
+                    if timeout:
+                        update['statusExpireTime'] = h['updateTime'] + timedelta(seconds=timeout)
+                    break
+            db.alerts.update_one({'_id': doc['_id']}, {'$set': update})
+
     @staticmethod
     def _update_lookups(db):
         for severity, code in alarm_model.Severity.items():
@@ -98,11 +252,29 @@ class Backend(Database):
         return True
 
     def close(self, db):
-        self.client.close()
+        if db.client is not self.client:
+            db.client.close()
+
+    def get_pool_stats(self):
+        if not self.client or self.client_pid != os.getpid():
+            return dict()
+        servers = [s for s in self.client.topology_description.server_descriptions().values() if s.is_server_type_known]
+        rtts = [s.round_trip_time for s in servers if s.round_trip_time is not None]
+        with self.pool_stats.lock:
+            return {
+                'size': self.pool_stats.size,
+                'checkedOut': self.pool_stats.checked_out,
+                'waiting': self.pool_stats.waiting,
+                'created': self.pool_stats.created,
+                'recycled': self.pool_stats.recycled,
+                'servers': len(servers),
+                'roundTripTime': min(rtts, default=0) * 1000
+            }
 
     def destroy(self):
         db = self.connect()
-        self.client.drop_database(db.name)
+        db.client.drop_database(db.name)
+        self.close(db)
 
     # ALERTS
 
@@ -211,6 +383,146 @@ class Backend(Database):
             'customer': alert.customer
         }
 
+        response = self.get_db().alerts.find_one_and_update(
+            query,
+            update=self._dedup_update(alert, history),
+            return_document=ReturnDocument.AFTER
+        )
+        self._count_changes([alert.customer])
+        return response
+
+    def correlate_alert(self, alert, history):
+        """
+        Update alert key attributes, reset duplicate count and set repeat=False, keep track of last
+        receive id and time, appending all to history. Append to history again if status changes.
+        """
+        query = {
+            'environment': alert.environment,
+            'resource': alert.resource,
+            '$or': [
+                {
+                    'event': alert.event,
+                    'severity': {'$ne': alert.severity}
+                },
+                {
+                    'event': {'$ne': alert.event},
+                    'correlate': alert.event
+                }],
+            'customer': alert.customer
+        }
+
+        response = self.get_db().alerts.find_one_and_update(
+            query,
+            update=self._correlate_update(alert, history),
+            return_document=ReturnDocument.AFTER
+        )
+        self._count_changes([alert.customer])
+        return response
+
+    def create_alert(self, alert):
+        data = self._alert_document(alert)
+        if self.get_db().alerts.insert_one(data).inserted_id == alert.id:
+            self._count_changes([alert.customer])
+            return data
+
+    def get_ingest_matches(self, alerts):
+        """
+        Return the duplicate or correlated alert, type of match and history info for each
+        alert in a batch (or None if there is no match) using a single query.
+        """
+        query = {
+            '$or': [
+                {
+                    'environment': alert.environment,
+                    'resource': alert.resource,
+                    '$or': [{'event': alert.event}, {'correlate': alert.event}],
+                    'customer': alert.customer
+                } for alert in alerts
+            ]
+        }
+        candidates = defaultdict(list)
+        for doc in self.get_db().alerts.find(query):
+            candidates[(doc['environment'], doc['resource'], doc.get('customer'))].append(doc)
+
+        matches = []
+        for alert in alerts:
+            docs = [
+                doc for doc in candidates[(alert.environment, alert.resource, alert.customer)]
+                if doc['event'] == alert.event or alert.event in doc.get('correlate', [])
+            ]
+            if not docs:
+                matches.append(None)
+                continue
+            doc = max(docs, key=lambda d: (d['event'] == alert.event and d['severity'] == alert.severity, d['event'] == alert.event))
+            match = 'duplicate' if doc['event'] == alert.event and doc['severity'] == alert.severity else 'correlated'
+
+            history = sorted([
+                h for h in doc.get('history', [])[:current_app.config['HISTORY_LIMIT']]
+                if h.get('event') == alert.event or alert.event in doc.get('correlate', [])
+            ], key=lambda h: h['updateTime'], reverse=True)
+            hist_info = (
+                history[0].get('status') if history else None,
+                history[0].get('value') if history else None,
+                history[1].get('status') if len(history) > 1 else None,
+                history[1].get('timeout') if len(history) > 1 else None
+            )
+            matches.append((match, doc, hist_info))
+        return matches
+
+    def ingest_alerts(self, duplicates, correlated, new):
+        """
+        Write a batch of de-duplicated (id, alert, history), correlated (id, alert, history) and new alerts
+        using a single unordered bulk write and return all written alerts. New alerts that conflict with
+        an alert created concurrently are skipped.
+        """
+        requests = [UpdateOne({'_id': id}, self._dedup_update(alert, history)) for id, alert, history in duplicates]
+        requests += [UpdateOne({'_id': id}, self._correlate_update(alert, history)) for id, alert, history in correlated]
+        requests += [InsertOne(self._alert_document(alert)) for alert in new]
+
+        try:
+            self.get_db().alerts.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            if any(err['code'] != 11000 for err in e.details['writeErrors']) or e.details.get('writeConcernErrors'):
+                raise
+
+        self._count_changes([alert.customer for _, alert, _ in duplicates + correlated] + [alert.customer for alert in new])
+
+        ids = [id for id, _, _ in duplicates + correlated] + [alert.id for alert in new]
+        return list(self.get_db().alerts.find({'_id': {'$in': ids}}))
+
+    def _alert_document(self, alert):
+        return {
+            '_id': alert.id,
+            'resource': alert.resource,
+            'event': alert.event,
+            'environment': alert.environment,
+            'severity': alert.severity,
+            'correlate': alert.correlate,
+            'status': alert.status,
+            'service': alert.service,
+            'group': alert.group,
+            'value': alert.value,
+            'text': alert.text,
+            'tags': alert.tags,
+            'attributes': alert.attributes,
+            'origin': alert.origin,
+            'type': alert.event_type,
+            'createTime': alert.create_time,
+            'timeout': alert.timeout,
+            'rawData': alert.raw_data,
+            'customer': alert.customer,
+            'duplicateCount': alert.duplicate_count,
+            'repeat': alert.repeat,
+            'previousSeverity': alert.previous_severity,
+            'trendIndication': alert.trend_indication,
+            'receiveTime': alert.receive_time,
+            'lastReceiveId': alert.last_receive_id,
+            'lastReceiveTime': alert.last_receive_time,
+            'updateTime': alert.update_time,
+            'history': [h.serialize for h in alert.history]
+        }
+
+    def _dedup_update(self, alert, history):
         now = datetime.utcnow()
         update = {
             '$set': {
@@ -222,7 +534,10 @@ class Backend(Database):
                 'rawData': alert.raw_data,
                 'repeat': True,
                 'lastReceiveId': alert.id,
-                'lastReceiveTime': now
+                'lastReceiveTime': now,
+                'previousStatus': alert.previous_status,
+                'previousTimeout': alert.previous_timeout,
+                'statusExpireTime': alert.status_expire_time
             },
             '$addToSet': {'tags': {'$each': alert.tags}},
             '$inc': {'duplicateCount': 1}
@@ -244,32 +559,9 @@ class Backend(Database):
                 }
             }
 
-        return self.get_db().alerts.find_one_and_update(
-            query,
-            update=update,
-            return_document=ReturnDocument.AFTER
-        )
-
-    def correlate_alert(self, alert, history):
-        """
-        Update alert key attributes, reset duplicate count and set repeat=False, keep track of last
-        receive id and time, appending all to history. Append to history again if status changes.
-        """
-        query = {
-            'environment': alert.environment,
-            'resource': alert.resource,
-            '$or': [
-                {
-                    'event': alert.event,
-                    'severity': {'$ne': alert.severity}
-                },
-                {
-                    'event': {'$ne': alert.event},
-                    'correlate': alert.event
-                }],
-            'customer': alert.customer
-        }
+        return update
 
+    def _correlate_update(self, alert, history):
         update = {
             '$set': {
                 'event': alert.event,
@@ -287,7 +579,10 @@ class Backend(Database):
                 'trendIndication': alert.trend_indication,
                 'receiveTime': alert.receive_time,
                 'lastReceiveId': alert.last_receive_id,
-                'lastReceiveTime': alert.last_receive_time
+                'lastReceiveTime': alert.last_receive_time,
+                'previousStatus': alert.previous_status,
+                'previousTimeout': alert.previous_timeout,
+                'statusExpireTime': alert.status_expire_time
             },
             '$addToSet': {'tags': {'$each': alert.tags}},
             '$push': {
@@ -306,47 +601,10 @@ class Backend(Database):
         if alert.update_time:
             update['$set']['updateTime'] = alert.update_time
 
-        return self.get_db().alerts.find_one_and_update(
-            query,
-            update=update,
-            return_document=ReturnDocument.AFTER
-        )
-
-    def create_alert(self, alert):
-        data = {
-            '_id': alert.id,
-            'resource': alert.resource,
-            'event': alert.event,
-            'environment': alert.environment,
-            'severity': alert.severity,
-            'correlate': alert.correlate,
-            'status': alert.status,
-            'service': alert.service,
-            'group': alert.group,
-            'value': alert.value,
-            'text': alert.text,
-            'tags': alert.tags,
-            'attributes': alert.attributes,
-            'origin': alert.origin,
-            'type': alert.event_type,
-            'createTime': alert.create_time,
-            'timeout': alert.timeout,
-            'rawData': alert.raw_data,
-            'customer': alert.customer,
-            'duplicateCount': alert.duplicate_count,
-            'repeat': alert.repeat,
-            'previousSeverity': alert.previous_severity,
-            'trendIndication': alert.trend_indication,
-            'receiveTime': alert.receive_time,
-            'lastReceiveId': alert.last_receive_id,
-            'lastReceiveTime': alert.last_receive_time,
-            'updateTime': alert.update_time,
-            'history': [h.serialize for h in alert.history]
-        }
-        if self.get_db().alerts.insert_one(data).inserted_id == alert.id:
-            return data
+        return update
 
-    def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None):
+    def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None,
+                  previous_status=None, previous_timeout=None, status_expire_time=None):
         query = {'_id': {'$regex': '^' + id}}
 
         update = {
@@ -356,6 +614,9 @@ class Backend(Database):
                 'attributes': attributes,
                 'timeout': timeout,
                 'previousSeverity': previous_severity,
+                'previousStatus': previous_status,
+                'previousTimeout': previous_timeout,
+                'statusExpireTime': status_expire_time,
                 'updateTime': update_time
             },
             '$addToSet': {'tags': {'$each': tags}},
@@ -368,11 +629,48 @@ class Backend(Database):
             }
         }
 
-        return self.get_db().alerts.find_one_and_update(
+        response = self.get_db().alerts.find_one_and_update(
             query,
             update=update,
             return_document=ReturnDocument.AFTER
         )
+        self._count_changes([response['customer']] if response else [])
+        return response
+
+    def set_alerts(self, changes):
+        """
+        Write a batch of status changes using one bulk write and return the changed alerts. Alerts
+        whose status is no longer the status the change was made from are skipped.
+        """
+        if not changes:
+            return []
+
+        requests = [UpdateOne({'_id': c['id'], 'status': c['current_status']}, {
+            '$set': {
+                'severity': c['severity'],
+                'status': c['status'],
+                'attributes': c['attributes'],
+                'previousSeverity': c['previous_severity'],
+                'previousStatus': c['previous_status'],
+                'previousTimeout': c['previous_timeout'],
+                'statusExpireTime': c['status_expire_time'],
+                'updateTime': c['update_time']
+            },
+            '$addToSet': {'tags': {'$each': c['tags']}},
+            '$push': {
+                'history': {
+                    '$each': [h.serialize for h in c['history']],
+                    '$slice': current_app.config['HISTORY_LIMIT'],
+                    '$position': 0
+                }
+            }
+        }) for c in changes]
+        self.get_db().alerts.bulk_write(requests, ordered=False)
+
+        # skipped alerts are those not in their new status, unless changed to it concurrently
+        alerts = list(self.get_db().alerts.find({'$or': [{'_id': c['id'], 'status': c['status']} for c in changes]}))
+        self._count_changes([alert['customer'] for alert in alerts])
+        return alerts
 
     def get_alert(self, id, customers=None):
         if len(id) == 8:
@@ -387,14 +685,22 @@ class Backend(Database):
 
     # STATUS, TAGS, ATTRIBUTES
 
-    def set_status(self, id, status, timeout, update_time, history=None):
+    def set_status(self, id, status, timeout, update_time, history=None, previous_status=None, previous_timeout=None,
+                   status_expire_time=None):
         """
         Set status and update history.
         """
         query = {'_id': {'$regex': '^' + id}}
 
         update = {
-            '$set': {'status': status, 'timeout': timeout, 'updateTime': update_time},
+            '$set': {
+                'status': status,
+                'timeout': timeout,
+                'previousStatus': previous_status,
+                'previousTimeout': previous_timeout,
+                'statusExpireTime': status_expire_time,
+                'updateTime': update_time
+            },
             '$push': {
                 'history': {
                     '$each': [history.serialize],
@@ -403,11 +709,13 @@ class Backend(Database):
                 }
             }
         }
-        return self.get_db().alerts.find_one_and_update(
+        response = self.get_db().alerts.find_one_and_update(
             query,
             update=update,
             return_document=ReturnDocument.AFTER
         )
+        self._count_changes([response['customer']] if response else [])
+        return response
 
     def tag_alert(self, id, tags):
         """
@@ -415,6 +723,7 @@ class Backend(Database):
         """
         response = self.get_db().alerts.update_one(
             {'_id': {'$regex': '^' + id}}, {'$addToSet': {'tags': {'$each': tags}}})
+        self._count_changes()
         return response.matched_count > 0
 
     def untag_alert(self, id, tags):
@@ -422,10 +731,12 @@ class Backend(Database):
         Remove tags from tag list.
         """
         response = self.get_db().alerts.update_one({'_id': {'$regex': '^' + id}}, {'$pullAll': {'tags': tags}})
+        self._count_changes()
         return response.matched_count > 0
 
     def update_tags(self, id, tags):
         response = self.get_db().alerts.update_one({'_id': {'$regex': '^' + id}}, update={'$set': {'tags': tags}})
+        self._count_changes()
         return response.matched_count > 0
 
     def update_attributes(self, id, old_attrs, new_attrs):
@@ -438,16 +749,20 @@ class Backend(Database):
             update['$unset'] = unset_value
 
         if update:
-            return self.get_db().alerts.find_one_and_update(
+            response = self.get_db().alerts.find_one_and_update(
                 {'_id': {'$regex': '^' + id}},
                 update=update,
                 return_document=ReturnDocument.AFTER
-            )['attributes']
+            )
+            self._count_changes([response['customer']])
+            return response['attributes']
         return {}
 
     def delete_alert(self, id):
-        response = self.get_db().alerts.delete_one({'_id': {'$regex': '^' + id}})
-        return True if response.deleted_count == 1 else False
+        deleted = self.get_db().alerts.find_one_and_delete({'_id': {'$regex': '^' + id}}, projection={'customer': 1})
+        self._add_tombstones([deleted] if deleted else [])
+        self._count_changes([deleted['customer']] if deleted else [])
+        return True if deleted else False
 
     # BULK
 
@@ -455,12 +770,14 @@ class Backend(Database):
         query = query or Query()
         updated = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
         response = self.get_db().alerts.update(query.where, {'$addToSet': {'tags': {'$each': tags}}})
+        self._count_changes()
         return updated if response['n'] else []
 
     def untag_alerts(self, query=None, tags=None):
         query = query or Query()
         updated = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
         response = self.get_db().alerts.update(query.where, {'$pullAll': {'tags': tags}})
+        self._count_changes()
         return updated if response['n'] else []
 
     def update_attributes_by_query(self, query=None, attributes=None):
@@ -475,13 +792,52 @@ class Backend(Database):
 
         updated = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
         response = self.get_db().alerts.update_many(query.where, update=update)
+        self._count_changes()
         return updated if response.matched_count > 0 else []
 
     def delete_alerts(self, query=None):
         query = query or Query()
-        deleted = list(self.get_db().alerts.find(query.where, projection={'_id': 1}))
+        deleted = list(self.get_db().alerts.find(query.where, projection={'_id': 1, 'customer': 1}))
         response = self.get_db().alerts.remove(query.where)
-        return deleted if response['n'] else []
+        self._add_tombstones(deleted)
+        self._count_changes([d.get('customer') for d in deleted])
+        return [{'_id': d['_id']} for d in deleted] if response['n'] else []
+
+    def _add_tombstones(self, deleted):
+        # record ids of deleted alerts, so that "updated-since" queries can return them
+        if deleted:
+            now = datetime.utcnow()
+            self.get_db().tombstones.bulk_write([
+                UpdateOne({'_id': d['_id']}, {'$set': {'customer': d.get('customer'), 'deleteTime': now}}, upsert=True)
+                for d in deleted
+            ], ordered=False)
+
+    def _count_changes(self, customers=None):
+        """
+        Increment the change sequence of customers of written alerts, or of all customers
+        if not known. It is done after the write so it is never seen before the change.
+        """
+        if not current_app.config['ETAG_ENABLED']:
+            return
+        keys = {'' if c is None else c for c in customers} if customers is not None else {'*'}
+        for key in sorted(keys):
+            self.get_db().changes.update_one({'_id': key}, {'$inc': {'seq': 1}}, upsert=True)
+
+    def get_change_sequence(self, customers=None):
+        query = {'_id': {'$in': customers + ['*']}} if customers else {}
+        return sum(c['seq'] for c in self.get_db().changes.find(query, projection={'seq': 1}))
+
+    def get_alert_changes(self, query, since, customers=None):
+        """
+        Return ids of alerts changed since then that no longer match the query, and ids of
+        alerts deleted since then.
+        """
+        changed = {'$or': [{'updateTime': {'$gt': since}}, {'lastReceiveTime': {'$gt': since}}]}
+        deleted = {'deleteTime': {'$gt': since}}
+        if customers:
+            changed['customer'] = deleted['customer'] = {'$in': customers}
+        removed = self.get_db().alerts.find({'$and': [changed, {'$nor': [query.where]}]}, projection={'_id': 1})
+        return [r['_id'] for r in removed], [d['_id'] for d in self.get_db().tombstones.find(deleted, projection={'_id': 1})]
 
     # SEARCH & HISTORY
 
@@ -497,11 +853,13 @@ class Backend(Database):
                 }
             }
         }
-        return self.get_db().alerts.find_one_and_update(
+        response = self.get_db().alerts.find_one_and_update(
             query,
             update=update,
             return_document=ReturnDocument.AFTER
         )
+        self._count_changes([response['customer']] if response else [])
+        return response
 
     def get_alerts(self, query=None, raw_data=False, history=False, page=None, page_size=None):
         query = query or Query()
@@ -535,6 +893,44 @@ class Backend(Database):
         ]
         return self.get_db().alerts.aggregate(pipeline)
 
+    def get_alerts_by_ids(self, ids, query=None):
+        query = query or Query()
+        return self.get_db().alerts.find({'$and': [{'_id': {'$in': ids}}, query.where]}, projection={'rawData': 0, 'history': 0})
+
+    def get_alerts_after(self, query=None, after=None, raw_data=False, history=False, page_size=None):
+        query = query or Query()
+        fields = dict()
+        if not raw_data:
+            fields['rawData'] = 0
+        if not history:
+            fields['history'] = 0
+        sort = [(k, v) for k, v in query.sort if k != '_id'] + [('_id', 1)]
+        pipeline = [
+            {'$lookup': {
+                'from': 'codes',
+                'localField': 'severity',
+                'foreignField': 'severity',
+                'as': 'fromCodes'
+            }},
+            {'$replaceRoot': {'newRoot': {'$mergeObjects': [{'$arrayElemAt': ['$fromCodes', 0]}, '$$ROOT']}}},
+            {'$project': {'fromCodes': 0}},
+            {'$lookup': {
+                'from': 'states',
+                'localField': 'status',
+                'foreignField': 'status',
+                'as': 'fromStates'
+            }},
+            {'$replaceRoot': {'newRoot': {'$mergeObjects': [{'$arrayElemAt': ['$fromStates', 0]}, '$$ROOT']}}},
+            {'$project': {'fromStates': 0}},
+            {'$match': query.where},
+            {'$match': self._keyset(sort, after)},
+            {'$project': fields},
+            {'$sort': {k: v for k, v in sort}},
+            {'$limit': page_size + 1}
+        ]
+        alerts = list(self.get_db().alerts.aggregate(pipeline))
+        return alerts[:page_size], self._sort_key(sort, alerts[page_size - 1]) if len(alerts) > page_size else None
+
     def get_alert_history(self, alert, page=None, page_size=None):
         query = {
             'environment': alert.environment,
@@ -602,58 +998,89 @@ class Backend(Database):
 
     def get_history(self, query=None, page=None, page_size=None):
         query = query or Query()
-        fields = {
-            'resource': 1,
-            'event': 1,
-            'environment': 1,
-            'customer': 1,
-            'service': 1,
-            'group': 1,
-            'tags': 1,
-            'attributes': 1,
-            'origin': 1,
-            'user': 1,
-            'timeout': 1,
-            'type': 1,
-            'history': 1
-        }
-
         pipeline = [
             {'$unwind': '$history'},
             {'$match': query.where},
-            {'$project': fields},
+            {'$project': HISTORY_FIELDS},
             {'$sort': {'history.updateTime': -1}},
             {'$skip': (page - 1) * page_size},
             {'$limit': page_size},
         ]
+        return [self._history_record(response) for response in self.get_db().alerts.aggregate(pipeline)]
 
-        responses = self.get_db().alerts.aggregate(pipeline)
+    def get_history_after(self, query=None, after=None, page_size=None):
+        query = query or Query()
+        sort = [('history.updateTime', -1), ('_id', 1), ('n', 1)]
+        pipeline = [
+            {'$unwind': {'path': '$history', 'includeArrayIndex': 'n'}},
+            {'$match': query.where},
+            {'$match': self._keyset(sort, after)},
+            {'$project': dict(HISTORY_FIELDS, n=1)},
+            {'$sort': {k: v for k, v in sort}},
+            {'$limit': page_size + 1},
+        ]
+        responses = list(self.get_db().alerts.aggregate(pipeline))
+        return (
+            [self._history_record(response) for response in responses[:page_size]],
+            self._sort_key(sort, responses[page_size - 1]) if len(responses) > page_size else None
+        )
 
-        history = list()
-        for response in responses:
-            history.append(
-                {
-                    'id': response['history']['id'],
-                    'resource': response['resource'],
-                    'event': response['history']['event'],
-                    'environment': response['environment'],
-                    'severity': response['history']['severity'],
-                    'service': response['service'],
-                    'status': response['history']['status'],
-                    'group': response['group'],
-                    'value': response['history']['value'],
-                    'text': response['history']['text'],
-                    'tags': response['tags'],
-                    'attributes': response['attributes'],
-                    'origin': response['origin'],
-                    'updateTime': response['history']['updateTime'],
-                    'user': response.get('user'),
-                    'timeout': response.get('timeout'),
-                    'type': response['history'].get('type', 'unknown'),
-                    'customer': response.get('customer', None)
-                }
-            )
-        return history
+    @staticmethod
+    def _history_record(response):
+        return {
+            'id': response['history']['id'],
+            'resource': response['resource'],
+            'event': response['history']['event'],
+            'environment': response['environment'],
+            'severity': response['history']['severity'],
+            'service': response['service'],
+            'status': response['history']['status'],
+            'group': response['group'],
+            'value': response['history']['value'],
+            'text': response['history']['text'],
+            'tags': response['tags'],
+            'attributes': response['attributes'],
+            'origin': response['origin'],
+            'updateTime': response['history']['updateTime'],
+            'user': response.get('user'),
+            'timeout': response.get('timeout'),
+            'type': response['history'].get('type', 'unknown'),
+            'customer': response.get('customer', None)
+        }
+
+    @staticmethod
+    def _keyset(sort, after):
+        """
+        Return filter for documents that sort after the given sort key.
+        """
+        if after is None:
+            return {}
+        after = json_util.loads(json.dumps(after))
+        if len(after) != len(sort):
+            raise ValueError('sort key does not match sort order')
+
+        equal = []
+        conditions = []
+        for (field, direction), value in zip(sort, after):
+            # nulls sort first in ascending order and last in descending order
+            if direction == 1:
+                later = {field: {'$ne': None}} if value is None else {field: {'$gt': value}}
+            else:
+                later = None if value is None else {'$or': [{field: {'$lt': value}}, {field: None}]}
+            if later:
+                conditions.append({'$and': equal + [later]})
+            equal.append({field: value})
+        return {'$or': conditions} if conditions else {'_id': {'$exists': False}}
+
+    @staticmethod
+    def _sort_key(sort, doc):
+        values = []
+        for field, _ in sort:
+            value = doc
+            for name in field.split('.'):
+                value = value.get(name) if isinstance(value, dict) else None
+            values.append(value)
+        return json.loads(json_util.dumps(values))
 
     # COUNTS
 
@@ -664,6 +1091,16 @@ class Backend(Database):
         query = query or Query()
         return self.get_db().alerts.count_documents(query.where)
 
+    def get_count_estimate(self, query=None):
+        """
+        Return estimated number of alerts that meet the query filter, using
+        collection metadata if there is no filter.
+        """
+        query = query or Query()
+        if not query.where:
+            return self.get_db().alerts.estimated_document_count()
+        return self.get_db().alerts.count_documents(query.where)
+
     def get_counts(self, query=None, group=None):
         query = query or Query()
         if group is None:
@@ -688,6 +1125,21 @@ class Backend(Database):
         query = query or Query()
         return self.get_counts(query, group='status')
 
+    def get_counts_by_severity_and_status(self, query=None):
+        query = query or Query()
+        pipeline = [
+            {'$match': query.where},
+            {'$facet': {
+                'severity': [{'$group': {'_id': '$severity', 'count': {'$sum': 1}}}],
+                'status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]
+            }}
+        ]
+        response = next(self.get_db().alerts.aggregate(pipeline), {'severity': [], 'status': []})
+        return (
+            {r['_id']: r['count'] for r in response['severity']},
+            {r['_id']: r['count'] for r in response['status']}
+        )
+
     def get_topn_count(self, query=None, group='event', topn=100):
         query = query or Query()
         pipeline = [
@@ -983,6 +1435,9 @@ class Backend(Database):
         query = query or Query()
         return self.get_db().blackouts.find(query.where, sort=query.sort).skip((page - 1) * page_size).limit(page_size)
 
+    def get_blackouts_ending_after(self, end_time):
+        return list(self.get_db().blackouts.find({'endTime': {'$gt': end_time}}))
+
     def get_blackouts_count(self, query=None):
         query = query or Query()
         return self.get_db().blackouts.count_documents(query.where)
@@ -1154,6 +1609,17 @@ class Backend(Database):
             }
         ).matched_count == 1
 
+    def update_keys_last_used(self, usage):
+        return self.get_db().keys.bulk_write([
+            UpdateOne(
+                {'$or': [{'key': u['key']}, {'_id': u['key']}]},
+                {
+                    '$max': {'lastUsedTime': u['last_used_time']},
+                    '$inc': {'count': u['count']}
+                }
+            ) for u in usage
+        ]).matched_count
+
     # delete
     def delete_key(self, key):
         query = {'$or': [{'key': key}, {'_id': key}]}
@@ -1378,8 +1844,8 @@ class Backend(Database):
                 scopes.extend(current_app.config['USER_DEFAULT_SCOPES'])
             if match in current_app.config['GUEST_ROLES']:
                 scopes.extend(current_app.config['GUEST_DEFAULT_SCOPES'])
-            response = self.get_db().perms.find_one({'match': match}, projection={'scopes': 1, '_id': 0})
-            if response:
+        if matches:
+            for response in self.get_db().perms.find({'match': {'$in': list(matches)}}, projection={'scopes': 1, '_id': 0}):
                 scopes.extend(response['scopes'])
         return sorted(set(scopes))
 
@@ -1421,10 +1887,7 @@ class Backend(Database):
         if login in current_app.config['ADMIN_USERS']:
             return '*'  # all customers
 
-        customers = []
-        for match in [login] + matches:
-            for r in self.get_db().customers.find({'match': match}):
-                customers.append(r['customer'])
+        customers = [r['customer'] for r in self.get_db().customers.find({'match': {'$in': [login] + list(matches)}})]
 
         if customers:
             if '*' in customers:
@@ -1537,38 +2000,71 @@ class Backend(Database):
                 'group': timer.group,
                 'name': timer.name
             },
-            {
-                '$set': {
-                    'group': timer.group,
-                    'name': timer.name,
-                    'title': timer.title,
-                    'description': timer.description,
-                    'type': 'timer'
-                },
-                '$inc': {'count': timer.count, 'totalTime': timer.total_time}
-            },
+            self._metric_update(timer),
             upsert=True,
             return_document=ReturnDocument.AFTER
         )
 
+    def update_metrics(self, metrics):
+        """
+        Increment counters and timers, including timer histogram buckets, in one bulk write.
+        """
+        requests = [
+            UpdateOne({'group': metric.group, 'name': metric.name}, self._metric_update(metric), upsert=True)
+            for metric in metrics
+        ]
+        self.get_db().metrics.bulk_write(requests, ordered=False)
+
+    @staticmethod
+    def _metric_update(metric):
+        update = {
+            '$set': {
+                'group': metric.group,
+                'name': metric.name,
+                'title': metric.title,
+                'description': metric.description,
+                'type': metric.type
+            },
+            '$inc': {'count': metric.count}
+        }
+        if metric.type == 'timer':
+            update['$inc']['totalTime'] = metric.total_time
+            # buckets are stored as a sub-document keyed by bucket index
+            for i, observed in enumerate(metric.buckets or []):
+                if observed:
+                    update['$inc'][f'buckets.{i}'] = observed
+        return update
+
     # HOUSEKEEPING
 
-    def get_expired(self, expired_threshold, info_threshold):
+    def delete_expired(self, expired_threshold, info_threshold):
         # delete 'closed' or 'expired' alerts older than "expired_threshold" seconds
         # and 'informational' alerts older than "info_threshold" seconds
 
+        queries = []
         if expired_threshold:
             expired_seconds_ago = datetime.utcnow() - timedelta(seconds=expired_threshold)
-            self.get_db().alerts.delete_many(
-                {'status': {'$in': ['closed', 'expired']}, 'lastReceiveTime': {'$lt': expired_seconds_ago}})
+            queries.append({'status': {'$in': ['closed', 'expired']}, 'lastReceiveTime': {'$lt': expired_seconds_ago}})
 
         if info_threshold:
             info_seconds_ago = datetime.utcnow() - timedelta(seconds=info_threshold)
-            self.get_db().alerts.delete_many({'severity': alarm_model.DEFAULT_INFORM_SEVERITY, 'lastReceiveTime': {'$lt': info_seconds_ago}})
+            queries.append({'severity': alarm_model.DEFAULT_INFORM_SEVERITY, 'lastReceiveTime': {'$lt': info_seconds_ago}})
+
+        for query in queries:
+            deleted = list(self.get_db().alerts.find(query, projection={'_id': 1, 'customer': 1}))
+            self.get_db().alerts.delete_many({'_id': {'$in': [d['_id'] for d in deleted]}})
+            self._add_tombstones(deleted)
+            self._count_changes([d.get('customer') for d in deleted])
 
-        # get list of alerts to be newly expired
+        # delete ids of alerts deleted more than "TOMBSTONE_MAX_AGE" seconds ago
+        if current_app.config['TOMBSTONE_MAX_AGE']:
+            max_age_ago = datetime.utcnow() - timedelta(seconds=current_app.config['TOMBSTONE_MAX_AGE'])
+            self.get_db().tombstones.delete_many({'deleteTime': {'$lt': max_age_ago}})
+
+    def get_expired(self, limit=None, exclude=None):
+        # get list of alerts to be newly expired, except excluded ids
         pipeline = [
-            {'$match': {'status': {'$nin': ['expired']}}},
+            {'$match': {'status': {'$nin': ['expired']}, '_id': {'$nin': list(exclude or [])}}},
             {'$addFields': {
                 'computedTimeout': {'$multiply': [{'$ifNull': ['$timeout', current_app.config['ALERT_TIMEOUT']]}, 1000]}
             }},
@@ -1577,104 +2073,61 @@ class Backend(Database):
             }},
             {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}}
         ]
+        if limit:
+            pipeline.append({'$limit': limit})
         return self.get_db().alerts.aggregate(pipeline)
 
-    def get_unshelve(self):
-        # get list of alerts to be unshelved
-        pipeline = [
-            {'$match': {'status': 'shelved'}},
-            {'$unwind': '$history'},
-            {'$match': {
-                'history.type': 'shelve',
-                'history.status': 'shelved'
-            }},
-            {'$sort': {'history.updateTime': -1}},
-            {'$group': {
-                '_id': '$_id',
-                'resource': {'$first': '$resource'},
-                'event': {'$first': '$event'},
-                'environment': {'$first': '$environment'},
-                'severity': {'$first': '$severity'},
-                'correlate': {'$first': '$correlate'},
-                'status': {'$first': '$status'},
-                'service': {'$first': '$service'},
-                'group': {'$first': '$group'},
-                'value': {'$first': '$value'},
-                'text': {'$first': '$text'},
-                'tags': {'$first': '$tags'},
-                'attributes': {'$first': '$attributes'},
-                'origin': {'$first': '$origin'},
-                'type': {'$first': '$type'},
-                'createTime': {'$first': '$createTime'},
-                'timeout': {'$first': '$timeout'},
-                'rawData': {'$first': '$rawData'},
-                'customer': {'$first': '$customer'},
-                'duplicateCount': {'$first': '$duplicateCount'},
-                'repeat': {'$first': '$repeat'},
-                'previousSeverity': {'$first': '$previousSeverity'},
-                'trendIndication': {'$first': '$trendIndication'},
-                'receiveTime': {'$first': '$receiveTime'},
-                'lastReceiveId': {'$first': '$lastReceiveId'},
-                'lastReceiveTime': {'$first': '$lastReceiveTime'},
-                'updateTime': {'$first': '$updateTime'},
-                'history': {'$first': '$history'},
-            }},
-            {'$addFields': {
-                'computedTimeout': {'$multiply': [{'$ifNull': ['$history.timeout', current_app.config['SHELVE_TIMEOUT']]}, 1000]}
-            }},
-            {'$addFields': {
-                'isExpired': {'$lt': [{'$add': ['$updateTime', '$computedTimeout']}, datetime.utcnow()]}
-            }},
-            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}}
-        ]
-        return self.get_db().alerts.aggregate(pipeline)
+    def get_unshelve(self, limit=None, exclude=None):
+        # get list of alerts to be unshelved, except excluded ids
+        query = {'status': 'shelved', 'statusExpireTime': {'$lt': datetime.utcnow()}, '_id': {'$nin': list(exclude or [])}}
+        return self.get_db().alerts.find(query, limit=limit or 0)
+
+    def get_unack(self, limit=None, exclude=None):
+        # get list of alerts to be unack'ed, except excluded ids
+        query = {'status': 'ack', 'statusExpireTime': {'$lt': datetime.utcnow()}, '_id': {'$nin': list(exclude or [])}}
+        return self.get_db().alerts.find(query, limit=limit or 0)
 
-    def get_unack(self):
-        # get list of alerts to be unack'ed
+    def acquire_lock(self, name, ttl):
+        # lease held by a process until released or it expires after "ttl" seconds, eg. if process was killed
+        now = datetime.utcnow()
+        try:
+            self.get_db().locks.find_one_and_update(
+                {'_id': name, '$or': [{'owner': self._lock_owner()}, {'expireTime': {'$lt': now}}]},
+                {'$set': {'owner': self._lock_owner(), 'expireTime': now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def release_lock(self, name):
+        response = self.get_db().locks.delete_one({'_id': name, 'owner': self._lock_owner()})
+        return response.deleted_count == 1
+
+    def listen_alerts(self, timeout=None):
+        """
+        Yield an empty list once listening, then lists of (change, id, customer) for alerts changed
+        as they are notified, or an empty list if there were no changes for "timeout" seconds. The
+        customer of deleted alerts is not known so it is None.
+        """
         pipeline = [
-            {'$match': {'status': 'ack'}},
-            {'$unwind': '$history'},
-            {'$match': {
-                'history.type': 'ack',
-                'history.status': 'ack'
-            }},
-            {'$sort': {'history.updateTime': -1}},
-            {'$group': {
-                '_id': '$_id',
-                'resource': {'$first': '$resource'},
-                'event': {'$first': '$event'},
-                'environment': {'$first': '$environment'},
-                'severity': {'$first': '$severity'},
-                'correlate': {'$first': '$correlate'},
-                'status': {'$first': '$status'},
-                'service': {'$first': '$service'},
-                'group': {'$first': '$group'},
-                'value': {'$first': '$value'},
-                'text': {'$first': '$text'},
-                'tags': {'$first': '$tags'},
-                'attributes': {'$first': '$attributes'},
-                'origin': {'$first': '$origin'},
-                'type': {'$first': '$type'},
-                'createTime': {'$first': '$createTime'},
-                'timeout': {'$first': '$timeout'},
-                'rawData': {'$first': '$rawData'},
-                'customer': {'$first': '$customer'},
-                'duplicateCount': {'$first': '$duplicateCount'},
-                'repeat': {'$first': '$repeat'},
-                'previousSeverity': {'$first': '$previousSeverity'},
-                'trendIndication': {'$first': '$trendIndication'},
-                'receiveTime': {'$first': '$receiveTime'},
-                'lastReceiveId': {'$first': '$lastReceiveId'},
-                'lastReceiveTime': {'$first': '$lastReceiveTime'},
-                'updateTime': {'$first': '$updateTime'},
-                'history': {'$first': '$history'},
-            }},
-            {'$addFields': {
-                'computedTimeout': {'$multiply': [{'$ifNull': ['$history.timeout', current_app.config['ACK_TIMEOUT']]}, 1000]}
-            }},
-            {'$addFields': {
-                'isExpired': {'$lt': [{'$add': ['$updateTime', '$computedTimeout']}, datetime.utcnow()]}
-            }},
-            {'$match': {'isExpired': True, 'computedTimeout': {'$ne': 0}}}
+            {'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}},
+            {'$project': {'operationType': 1, 'documentKey': 1, 'fullDocument.customer': 1, 'updateDescription.updatedFields.status': 1}}
         ]
-        return self.get_db().alerts.aggregate(pipeline)
+        max_await_time_ms = int(timeout * 1000) if timeout else None
+        with self.connect().alerts.watch(pipeline, full_document='updateLookup', max_await_time_ms=max_await_time_ms) as stream:
+            yield []
+            while stream.alive:
+                changes = []
+                change = stream.try_next()
+                while change is not None:
+                    op = {'insert': 'create', 'delete': 'delete'}.get(change['operationType'])
+                    if not op:
+                        op = 'status' if 'status' in change.get('updateDescription', {}).get('updatedFields', {}) else 'update'
+                    changes.append((op, change['documentKey']['_id'], (change.get('fullDocument') or {}).get('customer')))
+                    change = stream.try_next()
+                yield changes
+
+    @staticmethod
+    def _lock_owner():
+        return f'{socket.gethostname()}:{os.getpid()}'
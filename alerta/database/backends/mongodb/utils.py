@@ -12,6 +12,7 @@ from alerta.exceptions import ApiError
 from alerta.models.blackout import BlackoutStatus
 from alerta.models.key import ApiKeyStatus
 from alerta.utils.format import DateTime
+from alerta.utils.paging import UpdatedSince
 
 from .queryparser import QueryParser
 
@@ -21,7 +22,8 @@ Query.__new__.__defaults__ = ({}, [('_id', 1)], 'status')  # type: ignore
 
 EXCLUDE_FROM_QUERY = [
     '_', 'callback', 'token', 'api-key', 'q', 'q.df', 'id', 'from-date', 'to-date',
-    'sort-by', 'group-by', 'page', 'page-size', 'limit', 'show-raw-data', 'show-history'
+    'sort-by', 'group-by', 'page', 'page-size', 'limit', 'cursor', 'count', 'show-raw-data', 'show-history',
+    'updated-since'
 ]
 
 
@@ -188,6 +190,12 @@ class Alerts(QueryBuilder):
         sort = QueryBuilder.sort_by_columns(params, Alerts.VALID_PARAMS)
         group = params.getlist('group-by')
 
+        # updated-since
+        updated_since = UpdatedSince.from_params(params)
+        if updated_since and updated_since.since:
+            since = updated_since.since.replace(tzinfo=pytz.utc)
+            query = {'$and': [query, {'$or': [{'updateTime': {'$gt': since}}, {'lastReceiveTime': {'$gt': since}}]}]}
+
         if customer_query:
             query = {'$and': [customer_query, query]}
 
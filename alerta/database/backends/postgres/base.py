@@ -1,8 +1,12 @@
+import json
 import logging
+import os
+import select
 import threading
 import time
 from collections import defaultdict, namedtuple
 from datetime import datetime
+from typing import List  # noqa
 
 import psycopg2
 from flask import current_app
@@ -18,10 +22,44 @@ from alerta.models.heartbeat import HeartbeatStatus
 from alerta.utils.format import DateTime
 from alerta.utils.response import absolute_url
 
+from .pool import ConnectionPool
 from .utils import Query
 
 MAX_RETRIES = 5
 
+# statement-level triggers that notify listeners of changed alerts, see notify_alerts() in schema.sql
+STREAM_TRIGGERS = [
+    ('alerts_insert_notify', 'INSERT', 'NEW TABLE AS new_alerts', 'notify_alerts'),
+    ('alerts_update_notify', 'UPDATE', 'OLD TABLE AS old_alerts NEW TABLE AS new_alerts', 'notify_alerts'),
+    ('alerts_delete_notify', 'DELETE', 'OLD TABLE AS old_alerts', 'notify_alerts')
+]
+
+# statement-level triggers that count changes to alerts, see count_alert_changes() in schema.sql
+CHANGE_TRIGGERS = [
+    ('alerts_insert_count', 'INSERT', 'NEW TABLE AS new_alerts', 'count_alert_changes'),
+    ('alerts_update_count', 'UPDATE', 'OLD TABLE AS old_alerts NEW TABLE AS new_alerts', 'count_alert_changes'),
+    ('alerts_delete_count', 'DELETE', 'OLD TABLE AS old_alerts', 'count_alert_changes')
+]
+
+# statement-level triggers that maintain the alert summary, see summarize_alerts() in schema.sql
+SUMMARY_TRIGGERS = [
+    ('alerts_insert_summary', 'INSERT', 'NEW TABLE AS new_alerts', 'summarize_alerts'),
+    ('alerts_update_summary', 'UPDATE', 'OLD TABLE AS old_alerts NEW TABLE AS new_alerts', 'summarize_alerts'),
+    ('alerts_delete_summary', 'DELETE', 'OLD TABLE AS old_alerts', 'summarize_alerts')
+]
+
+# triggers are only created when a feature is enabled, see drop_triggers() to remove them
+FEATURE_TRIGGERS = {
+    'stream': STREAM_TRIGGERS,
+    'etag': CHANGE_TRIGGERS,
+    'summary': SUMMARY_TRIGGERS
+}
+
+# connection pools of forked parent processes must never be closed or garbage
+# collected in the child process as that would terminate the parent's sessions
+_inherited_pools = []  # type: List[ConnectionPool]
+_pool_lock = threading.Lock()
+
 
 class HistoryAdapter:
     def __init__(self, history):
@@ -69,14 +107,34 @@ class Backend(Database):
         self.dbname = dbname
         self.schema = schema
 
+        self._reset_pool()
+        self.pool_config = dict(
+            min_size=app.config['DATABASE_POOL_MIN_SIZE'],
+            max_size=app.config['DATABASE_POOL_MAX_SIZE'],
+            timeout=app.config['DATABASE_POOL_TIMEOUT'],
+            max_age=app.config['DATABASE_POOL_MAX_AGE'],
+            check_after=app.config['DATABASE_POOL_CHECK_AFTER']
+        )
+        self.trace_queries = app.config['DATABASE_TRACE_QUERIES']
+        self.slow_query_threshold = app.config['DATABASE_SLOW_QUERY_THRESHOLD']
+        self.trace_statement_length = app.config['DATABASE_TRACE_STATEMENT_LENGTH']
+        self.history_seq = 0  # last history entry checked against HISTORY_LIMIT by housekeeping
+        self.locks = dict()  # (name, thread) -> connection holding advisory lock
+
         lock = threading.Lock()
         with lock:
-            conn = self.connect()
+            conn = self._connect()
 
             with app.open_resource('sql/schema.sql') as f:
                 try:
                     conn.cursor().execute(f.read())
                     conn.commit()
+                    if app.config['STREAM_ENABLED']:
+                        self._create_triggers(conn, STREAM_TRIGGERS)
+                    if app.config['ETAG_ENABLED']:
+                        self._create_triggers(conn, CHANGE_TRIGGERS)
+                    if app.config['ALERT_SUMMARY'] and self._create_triggers(conn, SUMMARY_TRIGGERS):
+                        self._rebuild_summary(conn)
                 except Exception as e:
                     if raise_on_error:
                         raise
@@ -91,8 +149,73 @@ class Backend(Database):
         )
         from alerta.models.alert import History
         register_adapter(History, HistoryAdapter)
+        conn.close()
+
+    @staticmethod
+    def _create_triggers(conn, triggers):
+        """
+        Create missing triggers on the alerts table and return True if any were created.
+        Triggers are never dropped here because other instances sharing the database
+        may still have the feature enabled.
+        """
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT tgname FROM pg_trigger WHERE tgrelid='alerts'::regclass AND tgname=ANY(%(names)s)
+        """, {'names': [name for name, _, _, _ in triggers]})
+        existing = {r.tgname for r in cursor.fetchall()}
+        created = False
+        for name, event, transition, function in triggers:
+            if name not in existing:
+                created = True
+                cursor.execute(f"""
+                    DO $$
+                    BEGIN
+                        CREATE TRIGGER {name} AFTER {event} ON alerts REFERENCING {transition}
+                            FOR EACH STATEMENT EXECUTE PROCEDURE {function}();
+                    EXCEPTION
+                        WHEN duplicate_object THEN RAISE NOTICE 'trigger "{name}" already exists on alerts.';
+                    END$$;
+                """)
+        conn.commit()
+        return created
+
+    @staticmethod
+    def _rebuild_summary(conn):
+        cursor = conn.cursor()
+        # alerts can't be changed while they are counted
+        cursor.execute('LOCK TABLE alerts IN SHARE MODE')
+        cursor.execute('DELETE FROM alert_summary')
+        cursor.execute("""
+            INSERT INTO alert_summary (customer, environment, service, severity, status, count)
+            SELECT customer, environment, service, severity, status, COUNT(*) FROM alerts
+          GROUP BY 1, 2, 3, 4, 5
+        """)
+        count = cursor.rowcount
+        conn.commit()
+        return count
+
+    def _reset_pool(self):
+        pool = getattr(self, 'pool', None)
+        if pool:
+            if pool.is_owner():
+                pool.closeall()
+            else:
+                _inherited_pools.append(pool)
+        self.pool = None
 
     def connect(self):
+        if not self.pool_config['max_size']:
+            return self._connect()
+
+        if not self.pool or not self.pool.is_owner():
+            with _pool_lock:
+                if not self.pool or not self.pool.is_owner():
+                    self._reset_pool()
+                    self.pool = ConnectionPool(self._connect, **self.pool_config)
+                    logging.getLogger('alerta.database').info('Database connection pool created (pid=%s)', os.getpid())
+        return self.pool.getconn()
+
+    def _connect(self):
         retry = 0
         while True:
             try:
@@ -145,12 +268,21 @@ class Backend(Database):
         return cursor.fetchone()
 
     def close(self, db):
-        db.close()
+        if self.pool and self.pool.is_owner():
+            self.pool.putconn(db)
+        else:
+            db.close()
+
+    def get_pool_stats(self):
+        if self.pool and self.pool.is_owner():
+            return self.pool.stats
+        return dict()
 
     def destroy(self):
-        conn = self.connect()
+        conn = self._connect()
         cursor = conn.cursor()
-        for table in ['alerts', 'blackouts', 'customers', 'groups', 'heartbeats', 'keys', 'metrics', 'perms', 'users']:
+        for table in ['alert_changes', 'alert_history', 'alert_summary', 'alert_tombstones', 'alerts', 'blackouts', 'customers', 'groups',
+                      'heartbeats', 'keys', 'metrics', 'perms', 'users']:
             cursor.execute(f'DROP TABLE IF EXISTS {table}')
         conn.commit()
         conn.close()
@@ -185,7 +317,7 @@ class Backend(Database):
                AND severity=%(severity)s
                AND {customer}
             """.format(customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
-        return self._fetchone(select, vars(alert))
+        return self._with_history(self._fetchone(select, vars(alert)))
 
     def is_correlated(self, alert):
         select = """
@@ -195,6 +327,36 @@ class Backend(Database):
                 OR (event!=%(event)s AND %(event)s=ANY(correlate)))
                AND {customer}
         """.format(customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
+        return self._with_history(self._fetchone(select, vars(alert)))
+
+    def get_ingest_match(self, alert):
+        """
+        Return the duplicate or correlated alert (duplicate preferred) locked for update, the
+        type of match and the current and previous status from its history in a single query.
+        """
+        select = """
+            SELECT a.*,
+                   CASE WHEN a.event=%(event)s AND a.severity=%(severity)s THEN 'duplicate' ELSE 'correlated' END AS match,
+                   h.statuses[1] AS current_status, h.vals[1] AS current_value,
+                   h.statuses[2] AS hist_previous_status, h.timeouts[2] AS hist_previous_timeout
+              FROM alerts a
+              LEFT JOIN LATERAL (
+                    SELECT array_agg(hist.status ORDER BY hist.update_time DESC) AS statuses,
+                           array_agg(hist.value ORDER BY hist.update_time DESC) AS vals,
+                           array_agg(hist.timeout ORDER BY hist.update_time DESC) AS timeouts
+                      FROM {history}
+                     WHERE hist.event=%(event)s OR %(event)s=ANY(a.correlate)
+                   ) h ON true
+             WHERE a.environment=%(environment)s AND a.resource=%(resource)s
+               AND (a.event=%(event)s OR %(event)s=ANY(a.correlate))
+               AND {customer}
+          ORDER BY (a.event=%(event)s AND a.severity=%(severity)s) DESC, (a.event=%(event)s) DESC
+             LIMIT 1
+               FOR UPDATE OF a
+        """.format(
+            history=self._history_from('a', 'hist'),
+            customer='a.customer=%(customer)s' if alert.customer else 'a.customer IS NULL'
+        )
         return self._fetchone(select, vars(alert))
 
     def is_flapping(self, alert, window=1800, count=2):
@@ -203,14 +365,18 @@ class Backend(Database):
         """
         select = """
             SELECT COUNT(*)
-              FROM alerts, unnest(history) h
+              FROM alerts, {history}
              WHERE environment=%(environment)s
                AND resource=%(resource)s
                AND h.event=%(event)s
                AND h.update_time > (NOW() at time zone 'utc' - INTERVAL '{window} seconds')
                AND h.type='severity'
                AND {customer}
-        """.format(window=window, customer='customer=%(customer)s' if alert.customer else 'customer IS NULL')
+        """.format(
+            history=self._history_from(),
+            window=window,
+            customer='customer=%(customer)s' if alert.customer else 'customer IS NULL'
+        )
         return self._fetchone(select, vars(alert)).count > count
 
     def dedup_alert(self, alert, history):
@@ -218,14 +384,16 @@ class Backend(Database):
         Update alert status, service, value, text, timeout and rawData, increment duplicate count and set
         repeat=True, and keep track of last receive id and time but don't append to history unless status changes.
         """
-        alert.history = history
+        alert.history = [history] if history else []
         update = """
             UPDATE alerts
                SET status=%(status)s, service=%(service)s, value=%(value)s, text=%(text)s,
                    timeout=%(timeout)s, raw_data=%(raw_data)s, repeat=%(repeat)s,
                    last_receive_id=%(last_receive_id)s, last_receive_time=%(last_receive_time)s,
                    tags=ARRAY(SELECT DISTINCT UNNEST(tags || %(tags)s)), attributes=attributes || %(attributes)s,
-                   duplicate_count=duplicate_count + 1, {update_time}, history=(%(history)s || history)[1:{limit}]
+                   duplicate_count=duplicate_count + 1, previous_status=%(previous_status)s,
+                   previous_timeout=%(previous_timeout)s, status_expire_time=%(status_expire_time)s,
+                   {update_time}, history={history}
              WHERE environment=%(environment)s
                AND resource=%(resource)s
                AND event=%(event)s
@@ -233,11 +401,12 @@ class Backend(Database):
                AND {customer}
          RETURNING *
         """.format(
-            limit=current_app.config['HISTORY_LIMIT'],
+            history=self._history_value('%(history)s', 'history'),
             update_time='update_time=%(update_time)s' if alert.update_time else 'update_time=update_time',
             customer='customer=%(customer)s' if alert.customer else 'customer IS NULL'
         )
-        return self._updateone(update, vars(alert), returning=True)
+        update = self._append_history(update, '%(history)s')
+        return self._with_history(self._updateone(update, vars(alert), returning=True))
 
     def correlate_alert(self, alert, history):
         alert.history = history
@@ -248,18 +417,21 @@ class Backend(Database):
                    duplicate_count=%(duplicate_count)s, repeat=%(repeat)s, previous_severity=%(previous_severity)s,
                    trend_indication=%(trend_indication)s, receive_time=%(receive_time)s, last_receive_id=%(last_receive_id)s,
                    last_receive_time=%(last_receive_time)s, tags=ARRAY(SELECT DISTINCT UNNEST(tags || %(tags)s)),
-                   attributes=attributes || %(attributes)s, {update_time}, history=(%(history)s || history)[1:{limit}]
+                   attributes=attributes || %(attributes)s, previous_status=%(previous_status)s,
+                   previous_timeout=%(previous_timeout)s, status_expire_time=%(status_expire_time)s,
+                   {update_time}, history={history}
              WHERE environment=%(environment)s
                AND resource=%(resource)s
                AND ((event=%(event)s AND severity!=%(severity)s) OR (event!=%(event)s AND %(event)s=ANY(correlate)))
                AND {customer}
          RETURNING *
         """.format(
-            limit=current_app.config['HISTORY_LIMIT'],
+            history=self._history_value('%(history)s', 'history'),
             update_time='update_time=%(update_time)s' if alert.update_time else 'update_time=update_time',
             customer='customer=%(customer)s' if alert.customer else 'customer IS NULL'
         )
-        return self._updateone(update, vars(alert), returning=True)
+        update = self._append_history(update, '%(history)s')
+        return self._with_history(self._updateone(update, vars(alert), returning=True))
 
     def create_alert(self, alert):
         insert = """
@@ -271,24 +443,219 @@ class Backend(Database):
                 %(service)s, %(group)s, %(value)s, %(text)s, %(tags)s, %(attributes)s, %(origin)s,
                 %(event_type)s, %(create_time)s, %(timeout)s, %(raw_data)s, %(customer)s, %(duplicate_count)s,
                 %(repeat)s, %(previous_severity)s, %(trend_indication)s, %(receive_time)s, %(last_receive_id)s,
-                %(last_receive_time)s, %(update_time)s, %(history)s::history[])
+                %(last_receive_time)s, %(update_time)s, {history})
             RETURNING *
-        """
-        return self._insert(insert, vars(alert))
+        """.format(history=self._history_value('%(history)s'))
+        insert = self._append_history(insert, '%(history)s')
+        return self._with_history(self._insert(insert, vars(alert)))
 
-    def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None):
+    def get_ingest_matches(self, alerts):
+        """
+        Return the duplicate or correlated alert, type of match and history info for each
+        alert in a batch (or None if there is no match) locked for update in a single query.
+        """
+        select = """
+            SELECT k.idx, m.*
+              FROM unnest(%(environments)s::text[], %(resources)s::text[], %(events)s::text[],
+                          %(severities)s::text[], %(customers)s::text[])
+                   WITH ORDINALITY AS k(environment, resource, event, severity, customer, idx)
+              JOIN LATERAL (
+                    SELECT a.*,
+                           CASE WHEN a.event=k.event AND a.severity=k.severity THEN 'duplicate' ELSE 'correlated' END AS match,
+                           h.statuses[1] AS current_status, h.vals[1] AS current_value,
+                           h.statuses[2] AS hist_previous_status, h.timeouts[2] AS hist_previous_timeout
+                      FROM alerts a
+                      LEFT JOIN LATERAL (
+                            SELECT array_agg(hist.status ORDER BY hist.update_time DESC) AS statuses,
+                                   array_agg(hist.value ORDER BY hist.update_time DESC) AS vals,
+                                   array_agg(hist.timeout ORDER BY hist.update_time DESC) AS timeouts
+                              FROM {history}
+                             WHERE hist.event=k.event OR k.event=ANY(a.correlate)
+                           ) h ON true
+                     WHERE a.environment=k.environment AND a.resource=k.resource
+                       AND (a.event=k.event OR k.event=ANY(a.correlate))
+                       AND COALESCE(a.customer, '')=COALESCE(k.customer, '')
+                  ORDER BY (a.event=k.event AND a.severity=k.severity) DESC, (a.event=k.event) DESC
+                     LIMIT 1
+                       FOR UPDATE OF a
+                   ) m ON true
+        """.format(history=self._history_from('a', 'hist'))
+        rows = self._fetchall(select, {
+            'environments': [alert.environment for alert in alerts],
+            'resources': [alert.resource for alert in alerts],
+            'events': [alert.event for alert in alerts],
+            'severities': [alert.severity for alert in alerts],
+            'customers': [alert.customer for alert in alerts]
+        })
+        matches = {
+            r.idx: (r.match, r, (r.current_status, r.current_value, r.hist_previous_status, r.hist_previous_timeout)) for r in rows
+        }
+        return [matches.get(idx) for idx in range(1, len(alerts) + 1)]
+
+    def ingest_alerts(self, duplicates, correlated, new):
+        """
+        Write a batch of de-duplicated (id, alert, history), correlated (id, alert, history) and new alerts
+        using one statement for each type of change in a single transaction and return all written alerts.
+        New alerts that conflict with an alert created concurrently are skipped.
+
+        Alerts are locked, and new alerts inserted, in (environment, resource, event) order so that
+        concurrent batches that overlap wait for each other instead of deadlocking.
+        """
+        new = sorted(new, key=lambda a: (a.environment, a.resource, a.event, a.customer or ''))
+        statements = []
+        if duplicates:
+            update = """
+                UPDATE alerts a
+                   SET status=v.status, service=v.service, value=v.value, text=v.text,
+                       timeout=v.timeout, raw_data=v.raw_data, repeat=v.repeat,
+                       last_receive_id=v.last_receive_id, last_receive_time=v.last_receive_time,
+                       tags=ARRAY(SELECT DISTINCT UNNEST(a.tags || v.tags)), attributes=a.attributes || v.attributes,
+                       duplicate_count=a.duplicate_count + 1, previous_status=v.previous_status,
+                       previous_timeout=v.previous_timeout, status_expire_time=v.status_expire_time,
+                       update_time=COALESCE(v.update_time, a.update_time), history={history}
+                  FROM (VALUES %(values)s) AS v(id, status, service, value, text, timeout, raw_data, repeat,
+                       last_receive_id, last_receive_time, tags, attributes, previous_status, previous_timeout,
+                       status_expire_time, update_time, history)
+                 WHERE a.id=v.id
+             RETURNING a.*
+            """.format(history=self._history_value('v.history', 'a.history'))
+            template = """
+                (%(match_id)s, %(status)s, %(service)s::text[], %(value)s::text, %(text)s, %(timeout)s::integer,
+                %(raw_data)s::text, %(repeat)s, %(last_receive_id)s, %(last_receive_time)s::timestamp, %(tags)s::text[],
+                %(attributes)s::jsonb, %(previous_status)s::text, %(previous_timeout)s::integer,
+                %(status_expire_time)s::timestamp, %(update_time)s::timestamp, %(history)s::history[])
+            """
+            statements.append((update, template, [
+                dict(vars(alert), match_id=id, history=[history] if history else []) for id, alert, history in duplicates
+            ]))
+        if correlated:
+            update = """
+                UPDATE alerts a
+                   SET event=v.event, severity=v.severity, status=v.status, service=v.service, value=v.value,
+                       text=v.text, create_time=v.create_time, timeout=v.timeout, raw_data=v.raw_data,
+                       duplicate_count=v.duplicate_count, repeat=v.repeat, previous_severity=v.previous_severity,
+                       trend_indication=v.trend_indication, receive_time=v.receive_time, last_receive_id=v.last_receive_id,
+                       last_receive_time=v.last_receive_time, tags=ARRAY(SELECT DISTINCT UNNEST(a.tags || v.tags)),
+                       attributes=a.attributes || v.attributes, previous_status=v.previous_status,
+                       previous_timeout=v.previous_timeout, status_expire_time=v.status_expire_time,
+                       update_time=COALESCE(v.update_time, a.update_time), history={history}
+                  FROM (VALUES %(values)s) AS v(id, event, severity, status, service, value, text, create_time, timeout,
+                       raw_data, duplicate_count, repeat, previous_severity, trend_indication, receive_time,
+                       last_receive_id, last_receive_time, tags, attributes, previous_status, previous_timeout,
+                       status_expire_time, update_time, history)
+                 WHERE a.id=v.id
+             RETURNING a.*
+            """.format(history=self._history_value('v.history', 'a.history'))
+            template = """
+                (%(match_id)s, %(event)s, %(severity)s, %(status)s, %(service)s::text[], %(value)s::text, %(text)s,
+                %(create_time)s::timestamp, %(timeout)s::integer, %(raw_data)s::text, %(duplicate_count)s::integer,
+                %(repeat)s, %(previous_severity)s::text, %(trend_indication)s::text, %(receive_time)s::timestamp,
+                %(last_receive_id)s, %(last_receive_time)s::timestamp, %(tags)s::text[], %(attributes)s::jsonb,
+                %(previous_status)s::text, %(previous_timeout)s::integer, %(status_expire_time)s::timestamp,
+                %(update_time)s::timestamp, %(history)s::history[])
+            """
+            statements.append((update, template, [
+                dict(vars(alert), match_id=id, history=history) for id, alert, history in correlated
+            ]))
+        if new:
+            insert = """
+                INSERT INTO alerts (id, resource, event, environment, severity, correlate, status, service, "group",
+                    value, text, tags, attributes, origin, type, create_time, timeout, raw_data, customer,
+                    duplicate_count, repeat, previous_severity, trend_indication, receive_time, last_receive_id,
+                    last_receive_time, update_time, history)
+                VALUES %(values)s
+                ON CONFLICT (environment, resource, event, (COALESCE(customer, ''))) DO NOTHING
+                RETURNING *
+            """
+            template = """
+                (%(id)s, %(resource)s, %(event)s, %(environment)s, %(severity)s, %(correlate)s, %(status)s,
+                %(service)s, %(group)s, %(value)s, %(text)s, %(tags)s, %(attributes)s, %(origin)s,
+                %(event_type)s, %(create_time)s, %(timeout)s, %(raw_data)s, %(customer)s, %(duplicate_count)s,
+                %(repeat)s, %(previous_severity)s, %(trend_indication)s, %(receive_time)s, %(last_receive_id)s,
+                %(last_receive_time)s, %(update_time)s, {history})
+            """.format(history=self._history_value('%(history)s'))
+            statements.append((insert, template, [vars(alert) for alert in new]))
+
+        if self.history_table:
+            # history of alerts not written because they were deleted or created concurrently is skipped
+            insert = """
+                INSERT INTO alert_history (alert_id, id, event, severity, status, value, text, type, update_time, "user", timeout)
+                SELECT v.alert_id, h.*
+                  FROM (VALUES %(values)s) AS v(alert_id, history), unnest(v.history) h
+                 WHERE EXISTS (SELECT 1 FROM alerts WHERE alerts.id=v.alert_id)
+            """
+            template = """
+                (%(alert_id)s, %(history)s::history[])
+            """
+            statements.append((insert, template, [
+                {'alert_id': id, 'history': [history] if history else []} for id, _, history in duplicates
+            ] + [
+                {'alert_id': id, 'history': history} for id, _, history in correlated
+            ] + [
+                {'alert_id': alert.id, 'history': alert.history} for alert in new
+            ]))
+
+        conn = self.get_db()
+        try:
+            if duplicates or correlated:
+                lock = """
+                    SELECT id FROM alerts WHERE id=ANY(%(ids)s)
+                     ORDER BY environment, resource, event, COALESCE(customer, '')
+                       FOR UPDATE
+                """
+                self._execute(conn.cursor(), lock, {'ids': [id for id, _, _ in duplicates + correlated]})
+            rows = self._executemany(statements)
+        except Exception:
+            # connection must not be left in a failed transaction
+            conn.rollback()
+            raise
+        return self._with_history(rows)
+
+    def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None,
+                  previous_status=None, previous_timeout=None, status_expire_time=None):
         update = """
             UPDATE alerts
                SET severity=%(severity)s, status=%(status)s, tags=ARRAY(SELECT DISTINCT UNNEST(tags || %(tags)s)),
                    attributes=%(attributes)s, timeout=%(timeout)s, previous_severity=%(previous_severity)s,
-                   update_time=%(update_time)s, history=(%(change)s || history)[1:{limit}]
+                   previous_status=%(previous_status)s, previous_timeout=%(previous_timeout)s,
+                   status_expire_time=%(status_expire_time)s, update_time=%(update_time)s, history={history}
              WHERE id=%(id)s OR id LIKE %(like_id)s
          RETURNING *
-        """.format(limit=current_app.config['HISTORY_LIMIT'])
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'severity': severity, 'status': status,
-                                        'tags': tags, 'attributes': attributes, 'timeout': timeout,
-                                        'previous_severity': previous_severity, 'update_time': update_time,
-                                        'change': history}, returning=True)
+        """.format(history=self._history_value('%(change)s', 'history'))
+        update = self._append_history(update, '%(change)s')
+        return self._with_history(self._updateone(update, {
+            'id': id, 'like_id': id + '%', 'severity': severity, 'status': status, 'tags': tags,
+            'attributes': attributes, 'timeout': timeout, 'previous_severity': previous_severity,
+            'previous_status': previous_status, 'previous_timeout': previous_timeout,
+            'status_expire_time': status_expire_time, 'update_time': update_time, 'change': history or []
+        }, returning=True))
+
+    def set_alerts(self, changes):
+        """
+        Write a batch of status changes using one statement and return the changed alerts. Alerts
+        whose status is no longer the status the change was made from are skipped.
+        """
+        update = """
+            UPDATE alerts a
+               SET severity=v.severity, status=v.status, tags=ARRAY(SELECT DISTINCT UNNEST(a.tags || v.tags)),
+                   attributes=v.attributes, previous_severity=v.previous_severity, previous_status=v.previous_status,
+                   previous_timeout=v.previous_timeout, status_expire_time=v.status_expire_time,
+                   update_time=v.update_time, history={history}
+              FROM (VALUES %(values)s) AS v(id, current_status, severity, status, tags, attributes, previous_severity,
+                   previous_status, previous_timeout, status_expire_time, update_time, history)
+             WHERE a.id=v.id AND a.status=v.current_status
+         RETURNING a.*{change}
+        """.format(
+            history=self._history_value('v.history', 'a.history'),
+            change=', v.history AS change' if self.history_table else ''
+        )
+        update = self._append_history(update, 'a.change')
+        template = """
+            (%(id)s, %(current_status)s, %(severity)s, %(status)s, %(tags)s::text[], %(attributes)s::jsonb,
+            %(previous_severity)s::text, %(previous_status)s::text, %(previous_timeout)s::integer,
+            %(status_expire_time)s::timestamp, %(update_time)s::timestamp, %(history)s::history[])
+        """
+        return self._with_history(self._executemany([(update, template, changes)])) if changes else []
 
     def get_alert(self, id, customers=None):
         select = """
@@ -296,18 +663,26 @@ class Backend(Database):
              WHERE (id ~* (%(id)s) OR last_receive_id ~* (%(id)s))
                AND {customer}
         """.format(customer='customer=ANY(%(customers)s)' if customers else '1=1')
-        return self._fetchone(select, {'id': '^' + id, 'customers': customers})
+        return self._with_history(self._fetchone(select, {'id': '^' + id, 'customers': customers}))
 
     # STATUS, TAGS, ATTRIBUTES
 
-    def set_status(self, id, status, timeout, update_time, history=None):
+    def set_status(self, id, status, timeout, update_time, history=None, previous_status=None, previous_timeout=None,
+                   status_expire_time=None):
         update = """
             UPDATE alerts
-            SET status=%(status)s, timeout=%(timeout)s, update_time=%(update_time)s, history=(%(change)s || history)[1:{limit}]
+            SET status=%(status)s, timeout=%(timeout)s, previous_status=%(previous_status)s,
+                previous_timeout=%(previous_timeout)s, status_expire_time=%(status_expire_time)s,
+                update_time=%(update_time)s, history={history}
             WHERE id=%(id)s OR id LIKE %(like_id)s
             RETURNING *
-        """.format(limit=current_app.config['HISTORY_LIMIT'])
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'status': status, 'timeout': timeout, 'update_time': update_time, 'change': history}, returning=True)
+        """.format(history=self._history_value('%(change)s', 'history'))
+        update = self._append_history(update, '%(change)s')
+        return self._with_history(self._updateone(update, {
+            'id': id, 'like_id': id + '%', 'status': status, 'timeout': timeout, 'previous_status': previous_status,
+            'previous_timeout': previous_timeout, 'status_expire_time': status_expire_time, 'update_time': update_time,
+            'change': [history] if history else []
+        }, returning=True))
 
     def tag_alert(self, id, tags):
         update = """
@@ -352,9 +727,9 @@ class Backend(Database):
         delete = """
             DELETE FROM alerts
             WHERE id=%(id)s OR id LIKE %(like_id)s
-            RETURNING id
+            RETURNING id, customer
         """
-        return self._deleteone(delete, {'id': id, 'like_id': id + '%'}, returning=True)
+        return self._deleteone(self._add_tombstones(delete), {'id': id, 'like_id': id + '%'}, returning=True)
 
     # BULK
 
@@ -392,23 +767,145 @@ class Backend(Database):
         delete = f"""
             DELETE FROM alerts
             WHERE {query.where}
-            RETURNING id
+            RETURNING id, customer
         """
-        return [row[0] for row in self._deleteall(delete, query.vars, returning=True)]
+        return [row[0] for row in self._deleteall(self._add_tombstones(delete), query.vars, returning=True)]
 
     # SEARCH & HISTORY
 
     def add_history(self, id, history):
         update = """
             UPDATE alerts
-               SET history=(%(history)s || history)[1:{limit}]
+               SET history={history}
              WHERE id=%(id)s OR id LIKE %(like_id)s
          RETURNING *
-        """.format(limit=current_app.config['HISTORY_LIMIT'])
-        return self._updateone(update, {'id': id, 'like_id': id + '%', 'history': history}, returning=True)
+        """.format(history=self._history_value('%(history)s', 'history'))
+        update = self._append_history(update, '%(history)s')
+        return self._with_history(self._updateone(update, {
+            'id': id, 'like_id': id + '%', 'history': [history] if history else []
+        }, returning=True))
 
-    def get_alerts(self, query=None, raw_data=False, history=False, page=None, page_size=None):
-        query = query or Query()
+    @staticmethod
+    def _add_tombstones(delete):
+        """
+        Return statement that deletes alerts and records their ids, so that "updated-since"
+        queries can return them. The delete must return the id and customer of each alert.
+        """
+        return f"""
+            WITH d AS ({delete}), t AS (
+                INSERT INTO alert_tombstones (id, customer, delete_time)
+                SELECT id, customer, NOW() at time zone 'utc' FROM d
+                ON CONFLICT (id) DO UPDATE SET delete_time=EXCLUDED.delete_time
+            )
+            SELECT id FROM d
+        """
+
+    def get_change_sequence(self, customers=None):
+        select = """
+            SELECT COALESCE(SUM(seq), 0) AS seq FROM alert_changes
+        """
+        if customers:
+            select += ' WHERE customer=ANY(%(customers)s)'
+        return int(self._fetchone(select, {'customers': customers}).seq)
+
+    def get_alert_changes(self, query, since, customers=None):
+        """
+        Return ids of alerts changed since then that no longer match the query, and ids of
+        alerts deleted since then.
+        """
+        select = """
+            SELECT id, false AS deleted
+              FROM alerts
+             WHERE GREATEST(update_time, last_receive_time) > %(since)s
+               AND {customer}
+               AND ({where}) IS NOT TRUE
+         UNION ALL
+            SELECT id, true AS deleted
+              FROM alert_tombstones
+             WHERE delete_time > %(since)s
+               AND {customer}
+        """.format(
+            customer='customer=ANY(%(customers)s)' if customers else '1=1',
+            where=query.where
+        )
+        changes = self._fetchall(select, dict(query.vars, since=since, customers=customers))
+        return [c.id for c in changes if not c.deleted], [c.id for c in changes if c.deleted]
+
+    @property
+    def history_table(self):
+        return current_app.config['HISTORY_TABLE']
+
+    def _history_value(self, new, current=None):
+        """
+        Return new value of the history array after prepending history entries, capped at
+        HISTORY_LIMIT, or the unchanged array if history is stored in the alert history table.
+        """
+        if self.history_table:
+            return current or "'{}'::history[]"
+        if current:
+            return '({}::history[] || {})[1:{}]'.format(new, current, current_app.config['HISTORY_LIMIT'])
+        return f'{new}::history[]'
+
+    def _history_from(self, alias='alerts', name='h', ordinality=False):
+        """
+        Return FROM item for the history entries of an alert, most recent first, from either
+        the history array or the alert history table.
+        """
+        limit = current_app.config['HISTORY_LIMIT']
+        if self.history_table:
+            return """
+                LATERAL (
+                    SELECT id, event, severity, status, value, text, type, update_time, "user", timeout{n}
+                      FROM alert_history
+                     WHERE alert_id={alias}.id
+                  ORDER BY seq DESC
+                     LIMIT {limit}
+                ) {name}
+            """.format(
+                n=', row_number() OVER (ORDER BY seq DESC) AS n' if ordinality else '',
+                alias=alias,
+                limit=limit,
+                name=name
+            )
+        if ordinality:
+            return f"""unnest({alias}.history[1:{limit}]) WITH ORDINALITY
+                AS {name}(id, event, severity, status, value, text, type, update_time, "user", timeout, n)"""
+        return f'unnest({alias}.history[1:{limit}]) {name}'
+
+    def _append_history(self, write, history):
+        """
+        Return statement that writes an alert and appends history entries to the alert
+        history table, if used. Otherwise, the write must update the history array.
+        """
+        if not self.history_table:
+            return write
+        return f"""
+            WITH a AS ({write}), h AS (
+                INSERT INTO alert_history (alert_id, id, event, severity, status, value, text, type, update_time, "user", timeout)
+                SELECT a.id, h.* FROM a, unnest({history}::history[]) h
+            )
+            SELECT * FROM a
+        """
+
+    def _with_history(self, alerts):
+        """
+        Return alerts with history entries from the alert history table, if used, in one query.
+        """
+        if not self.history_table or not alerts:
+            return alerts
+        if not isinstance(alerts, list):
+            return self._with_history([alerts])[0]
+
+        select = """
+            SELECT a.id AS alert_id, h.*
+              FROM unnest(%(ids)s::text[]) AS a(id), {history}
+        """.format(history=self._history_from('a'))
+        history = defaultdict(list)
+        for h in self._fetchall(select, {'ids': [alert.id for alert in alerts]}):
+            history[h.alert_id].append(h)
+        return [alert._replace(history=history[alert.id]) for alert in alerts]
+
+    def _alerts_select(self, query, raw_data=False, history=False):
         if raw_data and history:
             select = '*'
         else:
@@ -431,25 +928,59 @@ class Backend(Database):
             join += 'JOIN (VALUES {}) AS st(sts, state) ON alerts.status = st.sts '.format(
                 ', '.join((f"('{k}', '{v}')" for k, v in alarm_model.Status.items()))
             )
+        return select, join
+
+    def get_alerts(self, query=None, raw_data=False, history=False, page=None, page_size=None):
+        query = query or Query()
+        select, join = self._alerts_select(query, raw_data, history)
         select = f"""
             SELECT {select}
               FROM alerts {join}
              WHERE {query.where}
           ORDER BY {query.sort or 'last_receive_time'}
         """
-        return self._fetchall(select, query.vars, limit=page_size, offset=(page - 1) * page_size)
+        alerts = self._fetchall(select, query.vars, limit=page_size, offset=(page - 1) * page_size)
+        return self._with_history(alerts) if history else alerts
+
+    def get_alerts_by_ids(self, ids, query=None):
+        query = query or Query()
+        select, _ = self._alerts_select(query)
+        select = f"""
+            SELECT {select}
+              FROM alerts
+             WHERE alerts.id=ANY(%(alert_ids)s)
+               AND {query.where}
+        """
+        return self._fetchall(select, dict(query.vars, alert_ids=ids))
+
+    def get_alerts_after(self, query=None, after=None, raw_data=False, history=False, page_size=None):
+        query = query or Query()
+        select, join = self._alerts_select(query, raw_data, history)
+        sort = [s.rsplit(' ', 1) for s in query.sort.split(',') if s != '(select 1)'] + [['alerts.id', 'ASC']]
+        where, vars = self._keyset(sort, after, query.vars)
+        select = f"""
+            SELECT {select}, json_build_array({', '.join(expr for expr, _ in sort)}) AS sort_key
+              FROM alerts {join}
+             WHERE {query.where}
+               AND {where}
+          ORDER BY {', '.join(f'{expr} {direction}' for expr, direction in sort)}
+        """
+        alerts = self._fetchall(select, vars, limit=page_size + 1)
+        next_key = alerts[page_size - 1].sort_key if len(alerts) > page_size else None
+        alerts = alerts[:page_size]
+        return self._with_history(alerts) if history else alerts, next_key
 
     def get_alert_history(self, alert, page=None, page_size=None):
         select = """
             SELECT resource, environment, service, "group", tags, attributes, origin, customer, h.*
-              FROM alerts, unnest(history[1:{limit}]) h
+              FROM alerts, {history}
              WHERE environment=%(environment)s AND resource=%(resource)s
                AND (h.event=%(event)s OR %(event)s=ANY(correlate))
                AND {customer}
           ORDER BY update_time DESC
             """.format(
             customer='customer=%(customer)s' if alert.customer else 'customer IS NULL',
-            limit=current_app.config['HISTORY_LIMIT']
+            history=self._history_from()
         )
         return [
             Record(
@@ -479,17 +1010,17 @@ class Backend(Database):
         if 'id' in query.vars:
             select = """
                 SELECT a.id
-                  FROM alerts a, unnest(history[1:{limit}]) h
+                  FROM alerts a, {history}
                  WHERE h.id LIKE %(id)s
-            """.format(limit=current_app.config['HISTORY_LIMIT'])
+            """.format(history=self._history_from('a'))
             query.vars['id'] = self._fetchone(select, query.vars)
 
         select = """
             SELECT resource, environment, service, "group", tags, attributes, origin, customer, history, h.*
-              FROM alerts, unnest(history[1:{limit}]) h
+              FROM alerts, {history}
              WHERE {where}
           ORDER BY update_time DESC
-        """.format(where=query.where, limit=current_app.config['HISTORY_LIMIT'])
+        """.format(where=query.where, history=self._history_from())
 
         return [
             Record(
@@ -514,16 +1045,74 @@ class Backend(Database):
             ) for h in self._fetchall(select, query.vars, limit=page_size, offset=(page - 1) * page_size)
         ]
 
+    def get_history_after(self, query=None, after=None, page_size=None):
+        query = query or Query()
+        sort = [['h.update_time', 'DESC'], ['alerts.id', 'ASC'], ['n', 'ASC']]
+        where, vars = self._keyset(sort, after, query.vars)
+        select = """
+            SELECT resource, environment, service, "group", tags, attributes, origin, customer, history, h.*,
+                   json_build_array(h.update_time, alerts.id, n) AS sort_key
+              FROM alerts, {history}
+             WHERE {where}
+               AND {keyset}
+          ORDER BY h.update_time DESC, alerts.id, n
+        """.format(where=query.where, keyset=where, history=self._history_from(ordinality=True))
+
+        history = self._fetchall(select, vars, limit=page_size + 1)
+        return [
+            Record(
+                id=h.id,
+                resource=h.resource,
+                event=h.event,
+                environment=h.environment,
+                severity=h.severity,
+                status=h.status,
+                service=h.service,
+                group=h.group,
+                value=h.value,
+                text=h.text,
+                tags=h.tags,
+                attributes=h.attributes,
+                origin=h.origin,
+                update_time=h.update_time,
+                user=h.user,
+                timeout=h.timeout,
+                type=h.type,
+                customer=h.customer
+            ) for h in history[:page_size]
+        ], history[page_size - 1].sort_key if len(history) > page_size else None
+
     # COUNTS
 
+    def _count_source(self, query):
+        """
+        Return the table, filter and count expression used to count alerts, which is the alert
+        summary if ALERT_SUMMARY is set and the query only filters by summarized columns.
+        """
+        if current_app.config['ALERT_SUMMARY'] and query.summary:
+            return 'alert_summary', query.summary, 'COALESCE(SUM(count), 0)::bigint'
+        return 'alerts', query.where, 'COUNT(*)'
+
     def get_count(self, query=None):
         query = query or Query()
+        table, where, count = self._count_source(query)
         select = f"""
-            SELECT COUNT(1) FROM alerts
-             WHERE {query.where}
+            SELECT {count} AS count FROM {table}
+             WHERE {where}
         """
         return self._fetchone(select, query.vars).count
 
+    def get_count_estimate(self, query=None):
+        """
+        Return number of alerts that meet the query filter estimated by the query planner.
+        """
+        query = query or Query()
+        explain = f"""
+            EXPLAIN (FORMAT JSON) SELECT 1 FROM alerts
+             WHERE {query.where}
+        """
+        return self._fetchone(explain, query.vars)[0][0]['Plan']['Plan Rows']
+
     def get_counts(self, query=None, group=None):
         query = query or Query()
         if group is None:
@@ -537,22 +1126,40 @@ class Backend(Database):
 
     def get_counts_by_severity(self, query=None):
         query = query or Query()
+        table, where, count = self._count_source(query)
         select = f"""
-            SELECT severity, COUNT(*) FROM alerts
-             WHERE {query.where}
+            SELECT severity, {count} AS count FROM {table}
+             WHERE {where}
             GROUP BY severity
         """
         return {s.severity: s.count for s in self._fetchall(select, query.vars)}
 
     def get_counts_by_status(self, query=None):
         query = query or Query()
+        table, where, count = self._count_source(query)
         select = f"""
-            SELECT status, COUNT(*) FROM alerts
-            WHERE {query.where}
+            SELECT status, {count} AS count FROM {table}
+            WHERE {where}
             GROUP BY status
         """
         return {s.status: s.count for s in self._fetchall(select, query.vars)}
 
+    def get_counts_by_severity_and_status(self, query=None):
+        query = query or Query()
+        table, where, count = self._count_source(query)
+        select = f"""
+            SELECT GROUPING(severity) AS by_status, severity, status, {count} AS count FROM {table}
+             WHERE {where}
+            GROUP BY GROUPING SETS ((severity), (status))
+        """
+        severity_count, status_count = dict(), dict()
+        for s in self._fetchall(select, query.vars):
+            if s.by_status:
+                status_count[s.status] = s.count
+            else:
+                severity_count[s.severity] = s.count
+        return severity_count, status_count
+
     def get_topn_count(self, query=None, topn=100):
         query = query or Query()
         group = 'event'
@@ -589,11 +1196,11 @@ class Backend(Database):
             SELECT topn.{group}, COUNT(1) as count, SUM(duplicate_count) AS duplicate_count,
                    array_agg(DISTINCT environment) AS environments, array_agg(DISTINCT svc) AS services,
                    array_agg(DISTINCT ARRAY[topn.id, resource]) AS resources
-              FROM topn, UNNEST (service) svc, UNNEST (history) hist
+              FROM topn, UNNEST (service) svc, {history}
              WHERE hist.type='severity'
           GROUP BY topn.{group}
           ORDER BY count DESC
-        """.format(where=query.where, group=group)
+        """.format(where=query.where, group=group, history=self._history_from('topn', 'hist'))
         return [
             {
                 'count': t.count,
@@ -616,11 +1223,11 @@ class Backend(Database):
                    SUM(last_receive_time - create_time) as life_time,
                    array_agg(DISTINCT environment) AS environments, array_agg(DISTINCT svc) AS services,
                    array_agg(DISTINCT ARRAY[topn.id, resource]) AS resources
-              FROM topn, UNNEST (service) svc, UNNEST (history) hist
+              FROM topn, UNNEST (service) svc, {history}
              WHERE hist.type='severity'
           GROUP BY topn.{group}
           ORDER BY life_time DESC
-        """.format(where=query.where, group=group)
+        """.format(where=query.where, group=group, history=self._history_from('topn', 'hist'))
         return [
             {
                 'count': t.count,
@@ -635,18 +1242,19 @@ class Backend(Database):
     # ENVIRONMENTS
 
     def get_environments(self, query=None, page=1, page_size=1000):
+        query = query or Query()
+        table, where, count = self._count_source(query)
+
         # Get distinct environments from page
-        select = """SELECT DISTINCT environment FROM alerts order by environment ASC"""
+        select = f"""SELECT DISTINCT environment FROM {table} order by environment ASC"""
 
         environments = self._fetchall(select, {}, limit=page_size, offset=(page - 1) * page_size)
 
         # Extend information from given environments
-        query = query or Query()
-
         environments_filter = f"""AND environment in ({', '.join(f"'{e.environment}'" for e in environments)})""" if environments else ''
         select = f"""
-            SELECT environment, severity, status, count(1) FROM alerts
-            WHERE {query.where} {environments_filter}
+            SELECT environment, severity, status, {count} AS count FROM {table}
+            WHERE {where} {environments_filter}
             GROUP BY environment, CUBE(severity, status)
         """
         result = self._fetchall(select, query.vars, limit=1000)
@@ -673,21 +1281,23 @@ class Backend(Database):
 
     def get_environments_count(self, query=None):
         query = query or Query()
-        select = """
-            SELECT COUNT(DISTINCT environment) FROM alerts
+        table, where, _ = self._count_source(query)
+        select = f"""
+            SELECT COUNT(DISTINCT environment) FROM {table}
             WHERE {where}
-        """.format(where=query.where)
+        """
         return self._fetchone(select, query.vars).count
 
     # SERVICES
 
     def get_services(self, query=None, topn=1000):
         query = query or Query()
-        select = """
-            SELECT environment, svc, severity, status, count(1) FROM alerts, UNNEST(service) svc
+        table, where, count = self._count_source(query)
+        select = f"""
+            SELECT environment, svc, severity, status, {count} AS count FROM {table}, UNNEST(service) svc
             WHERE {where}
             GROUP BY environment, svc, CUBE(severity, status)
-        """.format(where=query.where)
+        """
         result = self._fetchall(select, query.vars, limit=topn)
 
         severity_count = defaultdict(list)
@@ -702,7 +1312,7 @@ class Backend(Database):
             if not row.severity and not row.status:
                 total_count[(row.environment, row.svc)] = row.count
 
-        select = """SELECT DISTINCT environment, svc FROM alerts, UNNEST(service) svc"""
+        select = f"""SELECT DISTINCT environment, svc FROM {table}, UNNEST(service) svc"""
         services = self._fetchall(select, {})
         return [
             {
@@ -773,6 +1383,14 @@ class Backend(Database):
         """.format(where=query.where, order=query.sort)
         return self._fetchall(select, query.vars, limit=page_size, offset=(page - 1) * page_size)
 
+    def get_blackouts_ending_after(self, end_time):
+        select = """
+            SELECT *, GREATEST(EXTRACT(EPOCH FROM (end_time - GREATEST(start_time, NOW() at time zone 'utc'))), 0) AS remaining
+              FROM blackouts
+             WHERE end_time > %(end_time)s
+        """
+        return self._fetchall(select, {'end_time': end_time})
+
     def get_blackouts_count(self, query=None):
         query = query or Query()
         select = f"""
@@ -1007,6 +1625,17 @@ class Backend(Database):
         """
         return self._updateone(update, (key, key))
 
+    def update_keys_last_used(self, usage):
+        update = """
+            UPDATE keys
+               SET last_used_time=GREATEST(keys.last_used_time, v.last_used_time), count=keys.count + v.count
+              FROM (VALUES %(values)s) AS v(key, count, last_used_time)
+             WHERE keys.id=v.key OR keys.key=v.key
+            RETURNING keys.key
+        """
+        template = '(%(key)s, %(count)s::bigint, %(last_used_time)s::timestamp)'
+        return self._executemany([(update, template, usage)])
+
     def delete_key(self, key):
         delete = """
             DELETE FROM keys
@@ -1286,9 +1915,9 @@ class Backend(Database):
                 scopes.extend(current_app.config['USER_DEFAULT_SCOPES'])
             if match in current_app.config['GUEST_ROLES']:
                 scopes.extend(current_app.config['GUEST_DEFAULT_SCOPES'])
-            select = """SELECT scopes FROM perms WHERE match=%s"""
-            response = self._fetchone(select, (match,))
-            if response:
+        if matches:
+            select = """SELECT scopes FROM perms WHERE match=ANY(%s)"""
+            for response in self._fetchall(select, (list(matches),)):
                 scopes.extend(response.scopes)
         return sorted(set(scopes))
 
@@ -1352,12 +1981,12 @@ class Backend(Database):
         if login in current_app.config['ADMIN_USERS']:
             return '*'  # all customers
 
-        customers = []
-        for match in [login] + matches:
-            select = """SELECT customer FROM customers WHERE match=%s"""
-            response = self._fetchall(select, (match,))
-            if response:
-                customers.extend([r.customer for r in response])
+        select = """
+            SELECT customer FROM customers
+             WHERE match=ANY(%(matches)s)
+          ORDER BY array_position(%(matches)s, match)
+        """
+        customers = [r.customer for r in self._fetchall(select, {'matches': [login] + list(matches)})]
 
         if customers:
             if '*' in customers:
@@ -1464,18 +2093,38 @@ class Backend(Database):
         return self._upsert(upsert, vars(counter))
 
     def update_timer(self, timer):
+        return self.update_metrics([timer])[0]
+
+    def update_metrics(self, metrics):
+        """
+        Increment counters and timers, including timer histogram buckets, in one statement.
+        """
         upsert = """
-            INSERT INTO metrics ("group", name, title, description, count, total_time, type)
-            VALUES (%(group)s, %(name)s, %(title)s, %(description)s, %(count)s, %(total_time)s, %(type)s)
+            INSERT INTO metrics ("group", name, title, description, count, total_time, buckets, type)
+            VALUES %(values)s
             ON CONFLICT ("group", name, type) DO UPDATE
-                SET count=metrics.count + %(count)s, total_time=metrics.total_time + %(total_time)s
+                SET count=metrics.count + EXCLUDED.count, total_time=metrics.total_time + EXCLUDED.total_time,
+                    buckets=CASE
+                        WHEN metrics.buckets IS NULL THEN EXCLUDED.buckets
+                        WHEN EXCLUDED.buckets IS NULL THEN metrics.buckets
+                        ELSE ARRAY(
+                            SELECT COALESCE(a, 0) + COALESCE(b, 0)
+                              FROM unnest(metrics.buckets, EXCLUDED.buckets) WITH ORDINALITY AS t(a, b, i)
+                          ORDER BY i)
+                    END
             RETURNING *
         """
-        return self._upsert(upsert, vars(timer))
+        template = """
+            (%(group)s, %(name)s, %(title)s, %(description)s, %(count)s, %(total_time)s::bigint,
+            %(buckets)s::bigint[], %(type)s)
+        """
+        return self._executemany([(upsert, template, [
+            {'total_time': None, 'buckets': None, **vars(metric)} for metric in metrics
+        ])])
 
     # HOUSEKEEPING
 
-    def get_expired(self, expired_threshold, info_threshold):
+    def delete_expired(self, expired_threshold, info_threshold):
         # delete 'closed' or 'expired' alerts older than "expired_threshold" seconds
         # and 'informational' alerts older than "info_threshold" seconds
 
@@ -1484,54 +2133,160 @@ class Backend(Database):
                 DELETE FROM alerts
                  WHERE (status IN ('closed', 'expired')
                         AND last_receive_time < (NOW() at time zone 'utc' - INTERVAL '%(expired_threshold)s seconds'))
+             RETURNING id, customer
             """
-            self._deleteall(delete, {'expired_threshold': expired_threshold})
+            self._deleteall(self._add_tombstones(delete), {'expired_threshold': expired_threshold})
 
         if info_threshold:
             delete = """
                 DELETE FROM alerts
                  WHERE (severity=%(inform_severity)s
                         AND last_receive_time < (NOW() at time zone 'utc' - INTERVAL '%(info_threshold)s seconds'))
+             RETURNING id, customer
             """
-            self._deleteall(delete, {'inform_severity': alarm_model.DEFAULT_INFORM_SEVERITY, 'info_threshold': info_threshold})
+            self._deleteall(self._add_tombstones(delete), {
+                'inform_severity': alarm_model.DEFAULT_INFORM_SEVERITY, 'info_threshold': info_threshold
+            })
 
-        # get list of alerts to be newly expired
+        # delete ids of alerts deleted more than "TOMBSTONE_MAX_AGE" seconds ago
+        if current_app.config['TOMBSTONE_MAX_AGE']:
+            delete = """
+                DELETE FROM alert_tombstones
+                 WHERE delete_time < (NOW() at time zone 'utc' - INTERVAL '%(max_age)s seconds')
+            """
+            self._deleteall(delete, {'max_age': current_app.config['TOMBSTONE_MAX_AGE']})
+
+        # delete history entries older than "HISTORY_MAX_AGE" seconds or over the "HISTORY_LIMIT" cap
+        if self.history_table:
+            if current_app.config['HISTORY_MAX_AGE']:
+                delete = """
+                    DELETE FROM alert_history
+                     WHERE update_time < (NOW() at time zone 'utc' - INTERVAL '%(max_age)s seconds')
+                """
+                self._deleteall(delete, {'max_age': current_app.config['HISTORY_MAX_AGE']})
+
+            # only alerts with history entries added since the last run can be over the cap
+            last_seq = self._fetchone('SELECT COALESCE(MAX(seq), 0) AS seq FROM alert_history', {}).seq
+            if last_seq < self.history_seq:
+                self.history_seq = 0  # history table was recreated
+            delete = """
+                DELETE FROM alert_history
+                 WHERE seq IN (
+                    SELECT seq
+                      FROM (
+                        SELECT seq, row_number() OVER (PARTITION BY alert_id ORDER BY seq DESC) AS n
+                          FROM alert_history
+                         WHERE alert_id IN (SELECT alert_id FROM alert_history WHERE seq > %(seq)s AND seq <= %(last_seq)s)
+                      ) h
+                     WHERE n > %(limit)s
+                 )
+            """
+            self._deleteall(delete, {'seq': self.history_seq, 'last_seq': last_seq, 'limit': current_app.config['HISTORY_LIMIT']})
+            self.history_seq = last_seq
+
+    def get_expired(self, limit=None, exclude=None):
+        # get list of alerts to be newly expired, except excluded ids
         select = """
             SELECT *
               FROM alerts
              WHERE status NOT IN ('expired') AND COALESCE(timeout, {timeout})!=0
                AND (last_receive_time + INTERVAL '1 second' * timeout) < NOW() at time zone 'utc'
+               AND id <> ALL(%(exclude)s::text[])
         """.format(timeout=current_app.config['ALERT_TIMEOUT'])
+        return self._fetchall(select, {'exclude': list(exclude or [])}, limit=limit)
 
-        return self._fetchall(select, {})
-
-    def get_unshelve(self):
-        # get list of alerts to be unshelved
+    def get_unshelve(self, limit=None, exclude=None):
+        # get list of alerts to be unshelved, except excluded ids
         select = """
-            SELECT DISTINCT ON (a.id) a.*
-              FROM alerts a, UNNEST(history) h
-             WHERE a.status='shelved'
-               AND h.type='shelve'
-               AND h.status='shelved'
-               AND COALESCE(h.timeout, {timeout})!=0
-               AND (a.update_time + INTERVAL '1 second' * h.timeout) < NOW() at time zone 'utc'
-          ORDER BY a.id, a.update_time DESC
-        """.format(timeout=current_app.config['SHELVE_TIMEOUT'])
-        return self._fetchall(select, {})
-
-    def get_unack(self):
-        # get list of alerts to be unack'ed
+            SELECT * FROM alerts
+             WHERE status='shelved'
+               AND status_expire_time < NOW() at time zone 'utc'
+               AND id <> ALL(%(exclude)s::text[])
+        """
+        return self._fetchall(select, {'exclude': list(exclude or [])}, limit=limit)
+
+    def get_unack(self, limit=None, exclude=None):
+        # get list of alerts to be unack'ed, except excluded ids
         select = """
-            SELECT DISTINCT ON (a.id) a.*
-              FROM alerts a, UNNEST(history) h
-             WHERE a.status='ack'
-               AND h.type='ack'
-               AND h.status='ack'
-               AND COALESCE(h.timeout, {timeout})!=0
-               AND (a.update_time + INTERVAL '1 second' * h.timeout) < NOW() at time zone 'utc'
-          ORDER BY a.id, a.update_time DESC
-        """.format(timeout=current_app.config['ACK_TIMEOUT'])
-        return self._fetchall(select, {})
+            SELECT * FROM alerts
+             WHERE status='ack'
+               AND status_expire_time < NOW() at time zone 'utc'
+               AND id <> ALL(%(exclude)s::text[])
+        """
+        return self._fetchall(select, {'exclude': list(exclude or [])}, limit=limit)
+
+    def acquire_lock(self, name, ttl):
+        # session-level advisory lock held on its own connection, not one from the pool, which
+        # is closed when the lock is released or the process dies, so ttl is not needed
+        conn = self._connect()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%(name)s)) AS locked', {'name': name})
+        if not cursor.fetchone().locked:
+            conn.close()
+            return False
+        self.locks[(name, threading.get_ident())] = conn
+        return True
+
+    def release_lock(self, name):
+        conn = self.locks.pop((name, threading.get_ident()), None)
+        if conn is None:
+            return False
+        conn.close()
+        return True
+
+    def listen_alerts(self, timeout=None):
+        """
+        Yield an empty list once listening, then lists of (change, id, customer) for alerts changed
+        as they are notified, or an empty list if there were no changes for "timeout" seconds.
+        """
+        # uses its own connection as it is never returned to the pool
+        conn = self._connect()
+        try:
+            conn.autocommit = True
+            conn.cursor().execute('LISTEN alerts')
+            yield []
+            while True:
+                if select.select([conn], [], [], timeout) != ([], [], []):
+                    conn.poll()
+                changes = []
+                while conn.notifies:
+                    changes.extend(tuple(c) for c in json.loads(conn.notifies.pop(0).payload))
+                yield changes
+        finally:
+            conn.close()
+
+    def rebuild_summary(self):
+        return self._rebuild_summary(self.get_db())
+
+    def drop_triggers(self, feature):
+        # summary is rebuilt when triggers are created again so it can't be left stale
+        triggers = FEATURE_TRIGGERS[feature]
+        cursor = self.get_db().cursor()
+        for name, _, _, _ in triggers:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name} ON alerts')
+        self.get_db().commit()
+        return len(triggers)
+
+    def migrate_history(self, batch_size=1000):
+        # move history entries of a batch of alerts from the history array to the alert history table
+        update = """
+            WITH a AS (
+                SELECT id, history FROM alerts WHERE cardinality(history) > 0 LIMIT %(batch_size)s FOR UPDATE SKIP LOCKED
+            ), h AS (
+                INSERT INTO alert_history (alert_id, id, event, severity, status, value, text, type, update_time, "user", timeout)
+                SELECT a.id, h.id, h.event, h.severity, h.status, h.value, h.text, h.type, h.update_time, h."user", h.timeout
+                  FROM a, unnest(a.history) WITH ORDINALITY
+                       AS h(id, event, severity, status, value, text, type, update_time, "user", timeout, n)
+              ORDER BY a.id, h.n DESC
+            )
+            UPDATE alerts
+               SET history='{}'
+              FROM a
+             WHERE alerts.id=a.id
+         RETURNING alerts.id
+        """
+        return len(self._updateall(update, {'batch_size': batch_size}, returning=True))
 
     # SQL HELPERS
 
@@ -1540,8 +2295,7 @@ class Backend(Database):
         Insert, with return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchone()
 
@@ -1550,8 +2304,7 @@ class Backend(Database):
         Return none or one row.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         return cursor.fetchone()
 
     def _fetchall(self, query, vars, limit=None, offset=0):
@@ -1561,8 +2314,7 @@ class Backend(Database):
         if limit is not None:
             query += f' LIMIT {limit} OFFSET {offset}'
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         return cursor.fetchall()
 
     def _updateone(self, query, vars, returning=False):
@@ -1570,8 +2322,7 @@ class Backend(Database):
         Update, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchone() if returning else None
 
@@ -1580,8 +2331,7 @@ class Backend(Database):
         Update, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchall() if returning else None
 
@@ -1591,13 +2341,56 @@ class Backend(Database):
         """
         return self._insert(query, vars)
 
+    def _executemany(self, statements):
+        """
+        Execute statements with multi-row VALUES lists in a single transaction, with return
+        of rows from statements that return any.
+        """
+        conn = self.get_db()
+        cursor = conn.cursor()
+        rows = []
+        for query, template, argslist in statements:
+            values = b','.join(cursor.mogrify(template.strip(), args) for args in argslist)
+            vars = {'values': AsIs(values.decode('utf-8'))}
+            self._execute(cursor, query, vars)
+            if cursor.description:
+                rows.extend(cursor.fetchall())
+        conn.commit()
+        return rows
+
+    @staticmethod
+    def _keyset(sort, after, vars):
+        """
+        Return condition for rows that sort after the given sort key, with vars.
+        """
+        if after is None:
+            return '1=1', vars
+        if len(after) != len(sort):
+            raise ValueError('sort key does not match sort order')
+
+        vars = dict(vars)
+        equal = []
+        conditions = []
+        for i, ((expr, direction), value) in enumerate(zip(sort, after)):
+            name = f'after_{i}'
+            vars[name] = Json(value) if expr.startswith('attributes') else value
+            # nulls sort last in ascending order and first in descending order
+            if value is None:
+                later = 'FALSE' if direction == 'ASC' else f'{expr} IS NOT NULL'
+            elif direction == 'ASC':
+                later = f'({expr} > %({name})s OR {expr} IS NULL)'
+            else:
+                later = f'{expr} < %({name})s'
+            conditions.append('(' + ' AND '.join(equal + [later]) + ')')
+            equal.append(f'{expr} IS NULL' if value is None else f'{expr} = %({name})s')
+        return '(' + ' OR '.join(conditions) + ')', vars
+
     def _deleteone(self, query, vars, returning=False):
         """
         Delete, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchone() if returning else None
 
@@ -1606,11 +2399,31 @@ class Backend(Database):
         Delete multiple rows, with optional return.
         """
         cursor = self.get_db().cursor()
-        self._log(cursor, query, vars)
-        cursor.execute(query, vars)
+        self._execute(cursor, query, vars)
         self.get_db().commit()
         return cursor.fetchall() if returning else None
 
-    def _log(self, cursor, query, vars):
-        current_app.logger.debug('{stars}\n{query}\n{stars}'.format(
-            stars='*' * 40, query=cursor.mogrify(query, vars).decode('utf-8')))
+    def _execute(self, cursor, query, vars):
+        """
+        Execute query, logging and tracing it only if enabled.
+        """
+        logger = current_app.logger
+        if not (self.trace_queries or self.slow_query_threshold or logger.isEnabledFor(logging.DEBUG)):
+            cursor.execute(query, vars)
+            return
+
+        start = time.monotonic()
+        cursor.execute(query, vars)
+        duration = (time.monotonic() - start) * 1000
+
+        # statement actually sent to the server so no need to mogrify it again
+        statement = cursor.query.decode('utf-8', errors='replace')
+        logger.debug('{stars}\n{query}\n{stars}'.format(stars='*' * 40, query=statement))
+
+        statement = ' '.join(statement.split())
+        if len(statement) > self.trace_statement_length:
+            statement = statement[:self.trace_statement_length] + '...'
+        if self.slow_query_threshold and duration >= self.slow_query_threshold:
+            logger.warning('Slow query took %.1fms (%d rows): %s', duration, cursor.rowcount, statement)
+        elif self.trace_queries:
+            logger.info('Query took %.1fms (%d rows): %s', duration, cursor.rowcount, statement)
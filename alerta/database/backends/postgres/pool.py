@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+LOG = logging.getLogger('alerta.database')
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections for a single worker process.
+
+    Connections are created using the supplied ``connect`` function so that
+    retry and backoff on connection errors is handled in one place. A pool
+    created in one process must not be used after a fork, use ``is_owner()``
+    to detect that and create a new pool in the child process.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30, max_age=3600, check_after=60):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_after = check_after
+
+        self.pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created, last_used)
+        self._in_use = dict()  # id(conn) -> created
+        self._size = 0
+
+        self.created = 0
+        self.recycled = 0
+        self.waiting = 0
+
+        for _ in range(self.min_size):
+            self._size += 1
+            conn = self._new_conn()
+            self._idle.append((conn, time.monotonic(), time.monotonic()))
+
+    def is_owner(self):
+        return self.pid == os.getpid()
+
+    def _new_conn(self):
+        # caller must have already reserved a slot by incrementing _size
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            self._size -= 1
+            self.recycled += 1
+            self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, created, last_used):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.max_age and now - created > self.max_age:
+            return False
+        if self.check_after is not None and now - last_used > self.check_after:
+            try:
+                conn.cursor().execute('SELECT 1')
+                conn.rollback()
+            except Exception as e:
+                LOG.warning('Database connection failed health check: %s', e)
+                return False
+        return True
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        raise PoolTimeout(f'Timed out after {self.timeout}s waiting for a database connection')
+                    self.waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                if self._idle:
+                    item = self._idle.pop()
+                else:
+                    item = None
+                    self._size += 1  # reserve slot while connecting
+
+            if item:
+                conn, created, last_used = item
+                if not self._is_healthy(conn, created, last_used):
+                    self._discard(conn)
+                    continue
+            else:
+                conn, created = self._new_conn(), time.monotonic()
+
+            with self._cond:
+                self._in_use[id(conn)] = created
+            return conn
+
+    def putconn(self, conn):
+        with self._cond:
+            created = self._in_use.pop(id(conn), None)
+        if created is None:
+            # not from this pool (eg. checked out before the pool was replaced)
+            conn.close()
+            return
+
+        if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+
+        if conn.closed or (self.max_age and time.monotonic() - created > self.max_age):
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, created, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @property
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'checkedOut': len(self._in_use),
+                'waiting': self.waiting,
+                'created': self.created,
+                'recycled': self.recycled
+            }
@@ -9,18 +9,23 @@ from alerta.exceptions import ApiError
 from alerta.models.blackout import BlackoutStatus
 from alerta.models.key import ApiKeyStatus
 from alerta.utils.format import DateTime
+from alerta.utils.paging import UpdatedSince
 
 from .queryparser import QueryParser
 
-Query = namedtuple('Query', ['where', 'vars', 'sort', 'group'])
-Query.__new__.__defaults__ = ('1=1', {}, '(select 1)', 'status')  # type: ignore
+Query = namedtuple('Query', ['where', 'vars', 'sort', 'group', 'summary'])
+Query.__new__.__defaults__ = ('1=1', {}, '(select 1)', 'status', None)  # type: ignore
 
 
 EXCLUDE_FROM_QUERY = [
     '_', 'callback', 'token', 'api-key', 'q', 'q.df', 'id', 'from-date', 'to-date',
-    'sort-by', 'group-by', 'page', 'page-size', 'limit', 'show-raw-data', 'show-history'
+    'sort-by', 'group-by', 'page', 'page-size', 'limit', 'cursor', 'count', 'show-raw-data', 'show-history',
+    'updated-since'
 ]
 
+# alert summary columns, see summarize_alerts() in schema.sql
+SUMMARY_PARAMS = ['environment', 'service', 'severity', 'status', 'customer']
+
 
 class QueryBuilder:
 
@@ -173,6 +178,12 @@ class Alerts(QueryBuilder):
             query.append('AND last_receive_time <= %(to_date)s')
             qvars['to_date'] = to_date.replace(tzinfo=pytz.utc)
 
+        # updated-since
+        updated_since = UpdatedSince.from_params(params)
+        if updated_since and updated_since.since:
+            query.append('AND GREATEST(update_time, last_receive_time) > %(updated_since)s')
+            qvars['updated_since'] = updated_since.since.replace(tzinfo=pytz.utc)
+
         # duplicateCount, repeat
         if params.get('duplicateCount', None):
             query.append('AND duplicate_count=%(duplicate_count)s')
@@ -195,7 +206,15 @@ class Alerts(QueryBuilder):
         sort = QueryBuilder.sort_by_columns(params, Alerts.VALID_PARAMS)
         group = params.getlist('group-by')
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group=group)
+        # same filter for the alert summary, if only summarized columns are used
+        summary = None
+        if not any(params.get(p) for p in ['q', 'from-date', 'to-date', 'updated-since', 'duplicateCount', 'repeat', 'id']) \
+                and all(f.replace('!', '').split('.')[0] in SUMMARY_PARAMS + EXCLUDE_FROM_QUERY for f in params.keys()):
+            summary, _ = QueryBuilder.filter_query(
+                params, Alerts.VALID_PARAMS, ['1=1', 'AND customer=ANY(%(customers)s)'] if customers else ['1=1'], dict())
+            summary = '\n'.join(summary)
+
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group=group, summary=summary)
 
 
 class Blackouts(QueryBuilder):
@@ -265,7 +284,7 @@ class Blackouts(QueryBuilder):
         query, qvars = QueryBuilder.filter_query(params, Blackouts.VALID_PARAMS, query, qvars)
         sort = QueryBuilder.sort_by_columns(params, Blackouts.VALID_PARAMS)
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='')
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='', summary=None)
 
 
 class Heartbeats(QueryBuilder):
@@ -306,7 +325,7 @@ class Heartbeats(QueryBuilder):
         query, qvars = QueryBuilder.filter_query(params, Heartbeats.VALID_PARAMS, query, qvars)
         sort = QueryBuilder.sort_by_columns(params, Heartbeats.VALID_PARAMS)
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='')
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='', summary=None)
 
 
 class ApiKeys(QueryBuilder):
@@ -354,7 +373,7 @@ class ApiKeys(QueryBuilder):
         query, qvars = QueryBuilder.filter_query(params, ApiKeys.VALID_PARAMS, query, qvars)
         sort = QueryBuilder.sort_by_columns(params, ApiKeys.VALID_PARAMS)
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='')
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='', summary=None)
 
 
 class Users(QueryBuilder):
@@ -388,7 +407,7 @@ class Users(QueryBuilder):
         query, qvars = QueryBuilder.filter_query(params, Users.VALID_PARAMS, query, qvars)
         sort = QueryBuilder.sort_by_columns(params, Users.VALID_PARAMS)
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='')
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='', summary=None)
 
 
 class Groups(QueryBuilder):
@@ -412,7 +431,7 @@ class Groups(QueryBuilder):
         query, qvars = QueryBuilder.filter_query(params, Groups.VALID_PARAMS, query, qvars)
         sort = QueryBuilder.sort_by_columns(params, Groups.VALID_PARAMS)
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='')
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='', summary=None)
 
 
 class Permissions(QueryBuilder):
@@ -436,7 +455,7 @@ class Permissions(QueryBuilder):
         query, qvars = QueryBuilder.filter_query(params, Permissions.VALID_PARAMS, query, qvars)
         sort = QueryBuilder.sort_by_columns(params, Permissions.VALID_PARAMS)
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='')
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='', summary=None)
 
 
 class Customers(QueryBuilder):
@@ -459,4 +478,4 @@ class Customers(QueryBuilder):
         query, qvars = QueryBuilder.filter_query(params, Customers.VALID_PARAMS, query, qvars)
         sort = QueryBuilder.sort_by_columns(params, Customers.VALID_PARAMS)
 
-        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='')
+        return Query(where='\n'.join(query), vars=qvars, sort=','.join(sort), group='', summary=None)
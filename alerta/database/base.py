@@ -90,6 +90,9 @@ class Database(Base):
     def close(self, db):
         raise NotImplementedError('Database engine has no close() method')
 
+    def get_pool_stats(self):
+        return dict()  # connection pool statistics, if supported by database engine
+
     def destroy(self):
         raise NotImplementedError('Database engine has no destroy() method')
 
@@ -117,6 +120,9 @@ class Database(Base):
     def is_correlated(self, alert):
         raise NotImplementedError
 
+    def get_ingest_match(self, alert):
+        raise NotImplementedError
+
     def is_flapping(self, alert, window=1800, count=2):
         raise NotImplementedError
 
@@ -129,7 +135,17 @@ class Database(Base):
     def create_alert(self, alert):
         raise NotImplementedError
 
-    def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None):
+    def get_ingest_matches(self, alerts):
+        raise NotImplementedError
+
+    def ingest_alerts(self, duplicates, correlated, new):
+        raise NotImplementedError
+
+    def set_alert(self, id, severity, status, tags, attributes, timeout, previous_severity, update_time, history=None,
+                  previous_status=None, previous_timeout=None, status_expire_time=None):
+        raise NotImplementedError
+
+    def set_alerts(self, changes):
         raise NotImplementedError
 
     def get_alert(self, id, customers=None):
@@ -137,7 +153,8 @@ class Database(Base):
 
     # STATUS, TAGS, ATTRIBUTES
 
-    def set_status(self, id, status, timeout, update_time, history=None):
+    def set_status(self, id, status, timeout, update_time, history=None, previous_status=None, previous_timeout=None,
+                   status_expire_time=None):
         raise NotImplementedError
 
     def tag_alert(self, id, tags):
@@ -177,17 +194,35 @@ class Database(Base):
     def get_alerts(self, query=None, raw_data=False, history=False, page=None, page_size=None):
         raise NotImplementedError
 
+    def get_alerts_by_ids(self, ids, query=None):
+        raise NotImplementedError
+
+    def get_alerts_after(self, query=None, after=None, raw_data=False, history=False, page_size=None):
+        raise NotImplementedError
+
+    def get_change_sequence(self, customers=None):
+        raise NotImplementedError
+
+    def get_alert_changes(self, query, since, customers=None):
+        raise NotImplementedError
+
     def get_alert_history(self, alert, page=None, page_size=None):
         raise NotImplementedError
 
     def get_history(self, query=None, page=None, page_size=None):
         raise NotImplementedError
 
+    def get_history_after(self, query=None, after=None, page_size=None):
+        raise NotImplementedError
+
     # COUNTS
 
     def get_count(self, query=None):
         raise NotImplementedError
 
+    def get_count_estimate(self, query=None):
+        raise NotImplementedError
+
     def get_counts(self, query=None, group=None):
         raise NotImplementedError
 
@@ -197,6 +232,9 @@ class Database(Base):
     def get_counts_by_status(self, query=None):
         raise NotImplementedError
 
+    def get_counts_by_severity_and_status(self, query=None):
+        raise NotImplementedError
+
     def get_topn_count(self, query, group='event', topn=100):
         raise NotImplementedError
 
@@ -240,6 +278,9 @@ class Database(Base):
     def get_blackouts(self, query=None, page=None, page_size=None):
         raise NotImplementedError
 
+    def get_blackouts_ending_after(self, end_time):
+        raise NotImplementedError
+
     def get_blackouts_count(self, query=None):
         raise NotImplementedError
 
@@ -295,6 +336,9 @@ class Database(Base):
     def update_key_last_used(self, key):
         raise NotImplementedError
 
+    def update_keys_last_used(self, usage):
+        raise NotImplementedError
+
     def delete_key(self, key):
         raise NotImplementedError
 
@@ -451,17 +495,41 @@ class Database(Base):
     def update_timer(self, timer):
         raise NotImplementedError
 
+    def update_metrics(self, metrics):
+        raise NotImplementedError
+
     # HOUSEKEEPING
 
-    def get_expired(self, expired_threshold, info_threshold):
+    def delete_expired(self, expired_threshold, info_threshold):
         raise NotImplementedError
 
-    def get_unshelve(self):
+    def get_expired(self, limit=None, exclude=None):
         raise NotImplementedError
 
-    def get_unack(self):
+    def get_unshelve(self, limit=None, exclude=None):
         raise NotImplementedError
 
+    def get_unack(self, limit=None, exclude=None):
+        raise NotImplementedError
+
+    def acquire_lock(self, name, ttl):
+        raise NotImplementedError
+
+    def release_lock(self, name):
+        raise NotImplementedError
+
+    def listen_alerts(self, timeout=None):
+        raise NotImplementedError('Database engine does not support alert stream')
+
+    def migrate_history(self, batch_size=1000):
+        raise NotImplementedError('Database engine does not support alert history table')
+
+    def rebuild_summary(self):
+        raise NotImplementedError('Database engine does not support alert summary')
+
+    def drop_triggers(self, feature):
+        raise NotImplementedError('Database engine does not support triggers')
+
 
 class QueryBuilder(Base):
 
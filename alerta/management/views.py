@@ -2,20 +2,19 @@ import datetime
 import os
 import time
 
-from flask import (Response, current_app, g, jsonify, render_template, request,
+from flask import (Response, current_app, jsonify, render_template, request,
                    url_for)
 from flask_cors import cross_origin
 
-from alerta.app import db
+from alerta.app import audit, db, key_cache, plugin_executor
 from alerta.auth.decorators import permission
-from alerta.exceptions import ApiError, RejectException
+from alerta.exceptions import ApiError
 from alerta.models.alert import Alert
 from alerta.models.enums import Scope
 from alerta.models.heartbeat import Heartbeat
 from alerta.models.metrics import Counter, Gauge, Timer
 from alerta.models.switch import Switch, SwitchState
-from alerta.utils.api import process_action
-from alerta.utils.audit import write_audit_trail
+from alerta.utils.housekeeping import run_housekeeping
 from alerta.version import __version__
 
 from . import mgmt
@@ -36,6 +35,77 @@ total_alert_gauge = Gauge('alerts', 'total', 'Total alerts', 'Total number of al
 started = time.time() * 1000
 
 
+def pool_metrics():
+    stats = db.get_pool_stats()
+    if not stats:
+        return []
+    return [
+        Gauge('database', 'pool_size', 'Connection pool size', 'Number of open database connections',
+              value=stats['size']),
+        Gauge('database', 'pool_checked_out', 'Checked out connections', 'Number of database connections in use',
+              value=stats['checkedOut']),
+        Gauge('database', 'pool_waiting', 'Waiting for connection', 'Number of requests waiting for a database connection',
+              value=stats['waiting']),
+        Counter('database', 'pool_created', 'Created connections', 'Total number of database connections created',
+                count=stats['created']),
+        Counter('database', 'pool_recycled', 'Recycled connections', 'Total number of database connections discarded',
+                count=stats['recycled'])
+    ] + ([
+        Gauge('database', 'servers', 'Available servers', 'Number of database servers available for selection',
+              value=stats['servers']),
+        Gauge('database', 'server_rtt', 'Server round trip time', 'Lowest round trip time to a database server in milliseconds',
+              value=stats['roundTripTime'])
+    ] if 'servers' in stats else [])
+
+
+def key_cache_metrics():
+    if not key_cache.ttl:
+        return []
+    return [
+        Gauge('auth', 'key_cache_size', 'Cached API keys', 'Number of API keys in the verification cache',
+              value=len(key_cache.cache)),
+        Counter('auth', 'key_cache_hits', 'API key cache hits', 'Total number of API keys verified from the cache',
+                count=key_cache.stats['hits']),
+        Counter('auth', 'key_cache_misses', 'API key cache misses', 'Total number of API keys looked up in the database',
+                count=key_cache.stats['misses']),
+        Counter('auth', 'key_cache_evictions', 'API key cache evictions', 'Total number of API keys evicted from the cache',
+                count=key_cache.stats['evictions'])
+    ]
+
+
+def plugin_executor_metrics():
+    if not plugin_executor.stats:
+        return []
+    return [
+        Gauge('plugins', 'queued', 'Queued plugin hooks', 'Number of asynchronous plugin hooks waiting to run',
+              value=plugin_executor.queue_depth),
+        Gauge('plugins', 'running', 'Running plugin hooks', 'Number of asynchronous plugin hooks running',
+              value=plugin_executor.stats.get('running', 0)),
+        Counter('plugins', 'completed', 'Completed plugin hooks', 'Total number of asynchronous plugin hooks run',
+                count=plugin_executor.stats.get('completed', 0)),
+        Counter('plugins', 'failed', 'Failed plugin hooks', 'Total number of asynchronous plugin hooks that failed',
+                count=plugin_executor.stats.get('failed', 0)),
+        Counter('plugins', 'dropped', 'Dropped plugin hooks', 'Total number of asynchronous plugin hooks dropped when the queue was full',
+                count=plugin_executor.stats.get('dropped', 0))
+    ]
+
+
+def audit_metrics():
+    shipper = audit.shipper
+    if not shipper or not shipper.stats:
+        return []
+    return [
+        Gauge('audit', 'queued', 'Queued audit events', 'Number of audit events waiting to be sent',
+              value=shipper.queue_depth),
+        Counter('audit', 'sent', 'Sent audit events', 'Total number of audit events sent to the audit URL',
+                count=shipper.stats.get('sent', 0)),
+        Counter('audit', 'spilled', 'Spilled audit events', 'Total number of audit events written to disk when they could not be sent',
+                count=shipper.stats.get('spilled', 0)),
+        Counter('audit', 'dropped', 'Dropped audit events', 'Total number of audit events dropped because they could not be sent',
+                count=shipper.stats.get('dropped', 0))
+    ]
+
+
 def version_info():
     if current_app.config['SERVER_VERSION'] == 'full':
         return __version__
@@ -170,48 +240,13 @@ def housekeeping():
     else:
         info_threshold = current_app.config['DELETE_INFO_AFTER']  # seconds
 
-    has_expired, shelve_timeout, ack_timeout = Alert.housekeeping(expired_threshold, info_threshold)
-
-    errors = []
-    for alert in has_expired:
-        try:
-            # pre actioon
-            alert, _, text, timeout = process_action(alert, action='expired', text='', timeout=None)
-            # update status
-            alert = alert.from_expired(text, timeout)
-            # post action
-            alert, _, text, timeout = process_action(alert, action='expired', text=text, timeout=timeout, post_action=True)
-        except RejectException as e:
-            write_audit_trail.send(current_app._get_current_object(), event='alert-expire-rejected', message=alert.text,
-                                   user=g.login, customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert',
-                                   request=request)
-            errors.append(str(e))
-            continue
-        except Exception as e:
-            raise ApiError(str(e), 500)
-
-        write_audit_trail.send(current_app._get_current_object(), event='alert-expired', message=text, user=g.login,
-                               customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert', request=request)
-
-    for alert in shelve_timeout + ack_timeout:
-        try:
-            # pre action
-            alert, _, text, timeout = process_action(alert, action='timeout', text='', timeout=None)
-            # update status
-            alert = alert.from_timeout(text, timeout)
-            # post action
-            alert, _, text, timeout = process_action(alert, action='timeout', text=text, timeout=timeout, post_action=True)
-        except RejectException as e:
-            write_audit_trail.send(current_app._get_current_object(), event='alert-timeout-rejected', message=alert.text,
-                                   user=g.login, customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert',
-                                   request=request)
-            errors.append(str(e))
-            continue
-        except Exception as e:
-            raise ApiError(str(e), 500)
-
-        write_audit_trail.send(current_app._get_current_object(), event='alert-timeout', message=text, user=g.login,
-                               customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert', request=request)
+    try:
+        result = run_housekeeping(expired_threshold, info_threshold)
+    except Exception as e:
+        raise ApiError(str(e), 500)
+    if result is None:
+        raise ApiError('housekeeping already running', 409)
+    has_expired, shelve_timeout, ack_timeout, errors = result
 
     if errors:
         raise ApiError('housekeeping failed', 500, errors=errors)
@@ -237,6 +272,10 @@ def status():
     metrics.extend(Counter.find_all())
     metrics.extend(Timer.find_all())
     metrics.extend(Switch.find_all())
+    metrics.extend(pool_metrics())
+    metrics.extend(key_cache_metrics())
+    metrics.extend(plugin_executor_metrics())
+    metrics.extend(audit_metrics())
 
     return jsonify(application='alerta', version=version_info(), time=now, uptime=int(now - started),
                    metrics=[metric.serialize() for metric in metrics])
@@ -253,6 +292,10 @@ def prometheus_metrics():
     metrics = Gauge.find_all()
     metrics += Counter.find_all()
     metrics += Timer.find_all()
+    metrics += pool_metrics()
+    metrics += key_cache_metrics()
+    metrics += plugin_executor_metrics()
+    metrics += audit_metrics()
 
     output = [metric.serialize(format='prometheus') for metric in metrics]
     output += (
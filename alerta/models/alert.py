@@ -1,16 +1,16 @@
 import os
 import platform
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional  # noqa
 from typing import Any, Dict, List, Tuple, Union
 from uuid import uuid4
 
 from flask import current_app, g
 
-from alerta.app import alarm_model, db
+from alerta.app import alarm_model, blackout_index, db
 from alerta.database.base import Query
-from alerta.models.enums import ChangeType
+from alerta.models.enums import ChangeType, Status
 from alerta.models.history import History, RichHistory
 from alerta.models.note import Note
 from alerta.utils.format import DateTime
@@ -78,6 +78,11 @@ class Alert:
         self.update_time = kwargs.get('update_time', None)
         self.history = kwargs.get('history', None) or list()
 
+        # status and timeout restored when an ack or shelve is undone, and when it lapses
+        self.previous_status = kwargs.get('previous_status', None)
+        self.previous_timeout = kwargs.get('previous_timeout', None)
+        self.status_expire_time = kwargs.get('status_expire_time', None)
+
     @classmethod
     def parse(cls, json: JSON) -> 'Alert':
         if not isinstance(json.get('correlate', []), list):
@@ -196,7 +201,10 @@ class Alert:
             last_receive_id=doc.get('lastReceiveId', None),
             last_receive_time=doc.get('lastReceiveTime', None),
             update_time=doc.get('updateTime', None),
-            history=[History.from_db(h) for h in doc.get('history', list())]
+            history=[History.from_db(h) for h in doc.get('history', list())],
+            previous_status=doc.get('previousStatus', None),
+            previous_timeout=doc.get('previousTimeout', None),
+            status_expire_time=doc.get('statusExpireTime', None)
         )
 
     @classmethod
@@ -229,7 +237,10 @@ class Alert:
             last_receive_id=rec.last_receive_id,
             last_receive_time=rec.last_receive_time,
             update_time=getattr(rec, 'update_time'),
-            history=[History.from_db(h) for h in rec.history]
+            history=[History.from_db(h) for h in rec.history],
+            previous_status=getattr(rec, 'previous_status', None),
+            previous_timeout=getattr(rec, 'previous_timeout', None),
+            status_expire_time=getattr(rec, 'status_expire_time', None)
         )
 
     @classmethod
@@ -247,6 +258,13 @@ class Alert:
         """Return correlated alert or None"""
         return Alert.from_db(db.is_correlated(self))
 
+    def find_match(self) -> Tuple[Optional[str], Optional['Alert'], Tuple]:
+        """Return match type ('duplicate' or 'correlated'), matching alert and its history info"""
+        r = db.get_ingest_match(self)
+        if not r:
+            return None, None, (None, None, None, None)
+        return r.match, Alert.from_db(r), (r.current_status, r.current_value, r.hist_previous_status, r.hist_previous_timeout)
+
     def is_flapping(self, window: int = 1800, count: int = 2) -> bool:
         return db.is_flapping(self, window, count)
 
@@ -254,7 +272,15 @@ class Alert:
         return [(h.status, h.value) for h in self.get_alert_history(self, page=1, page_size=10) if h.status]
 
     def _get_hist_info(self, action=None):
-        h_loop = self.get_alert_history(alert=self)
+        if action == ChangeType.unack:
+            find = ChangeType.ack
+        elif action == ChangeType.unshelve:
+            find = ChangeType.shelve
+        else:
+            find = None
+
+        # only the current and previous history entries are needed unless looking for an action
+        h_loop = self.get_alert_history(alert=self, page_size=100 if find else 2)
         if not h_loop:
             return None, None, None, None
 
@@ -263,12 +289,6 @@ class Alert:
 
         if len(h_loop) == 1:
             return current_status, current_value, None, None
-        if action == ChangeType.unack:
-            find = ChangeType.ack
-        elif action == ChangeType.unshelve:
-            find = ChangeType.shelve
-        else:
-            find = None
 
         if find:
             for h, h_next in zip(h_loop, h_loop[1:]):
@@ -276,16 +296,83 @@ class Alert:
                     return current_status, current_value, h_next.status, h_next.timeout
             # action entry was evicted from history by HISTORY_LIMIT cap
             # fall back to Open as the safest default for unack/unshelve
-            from alerta.models.enums import Status
             return current_status, current_value, Status.Open, None
 
         return current_status, current_value, h_loop[1].status, h_loop[1].timeout
 
+    def _get_undo_info(self, status):
+        """
+        Return status and timeout restored when the current ack or shelve is undone, and
+        when it lapses, if the alert keeps its status. Otherwise, there is nothing to undo.
+        """
+        if status == self.status:
+            return self.previous_status, self.previous_timeout, self.status_expire_time
+        return None, None, None
+
+    # de-duplicate, correlate or create an alert using a single lookup
+    def ingest(self) -> 'Alert':
+        match, existing, hist_info = self.find_match()
+        if match == 'duplicate':
+            return self.deduplicate(existing, hist_info)
+        elif match == 'correlated':
+            return self.update(existing, hist_info)
+        else:
+            return self.create()
+
+    # de-duplicate, correlate or create a batch of alerts using set-based lookups and writes
+    @staticmethod
+    def ingest_many(alerts: List['Alert']) -> List['Alert']:
+        ingested = [None] * len(alerts)  # type: List[Optional[Alert]]
+
+        pending = list(enumerate(alerts))
+        while pending:
+            # alerts with the same environment, resource and customer may de-duplicate or
+            # correlate with each other so only the first is written in each round
+            batch, deferred, keys = [], [], set()
+            for i, alert in pending:
+                key = (alert.environment, alert.resource, alert.customer)
+                if key in keys:
+                    deferred.append((i, alert))
+                else:
+                    keys.add(key)
+                    batch.append((i, alert))
+
+            duplicates, correlated, new = [], [], []
+            expected = dict()
+            for (i, alert), m in zip(batch, db.get_ingest_matches([alert for _, alert in batch])):
+                if m:
+                    match, existing, hist_info = m[0], Alert.from_db(m[1]), m[2]
+                    if match == 'duplicate':
+                        duplicates.append((existing.id, alert, alert._prepare_dedup(existing, hist_info)))
+                    else:
+                        correlated.append((existing.id, alert, alert._prepare_update(existing, existing.severity, hist_info)))
+                    expected[i] = existing.id
+                else:
+                    alert._prepare_create()
+                    new.append(alert)
+                    expected[i] = alert.id
+
+            written = {a.id: a for a in (Alert.from_db(r) for r in db.ingest_alerts(duplicates, correlated, new))}
+
+            # alerts created or deleted concurrently by another request are tried again
+            for i, alert in batch:
+                if expected[i] in written:
+                    ingested[i] = written[expected[i]]
+                else:
+                    deferred.append((i, alert))
+            pending = sorted(deferred, key=lambda p: p[0])
+
+        return ingested  # type: ignore
+
     # de-duplicate an alert
-    def deduplicate(self, duplicate_of) -> 'Alert':
+    def deduplicate(self, duplicate_of, hist_info=None) -> 'Alert':
+        history = self._prepare_dedup(duplicate_of, hist_info or self._get_hist_info())
+        return Alert.from_db(db.dedup_alert(self, history))
+
+    def _prepare_dedup(self, duplicate_of, hist_info) -> Optional[History]:
         now = datetime.utcnow()
 
-        status, previous_value, previous_status, _ = self._get_hist_info()
+        status, previous_value, previous_status, _ = hist_info
 
         _, new_status = alarm_model.transition(
             alert=self,
@@ -332,16 +419,26 @@ class Alert:
             history = None
 
         self.status = new_status
-        return Alert.from_db(db.dedup_alert(self, history))
+        self.previous_status, self.previous_timeout, self.status_expire_time = duplicate_of._get_undo_info(new_status)
+        return history
 
     # correlate an alert
-    def update(self, correlate_with) -> 'Alert':
+    def update(self, correlate_with, hist_info=None) -> 'Alert':
+        if hist_info:
+            previous_severity = correlate_with.severity
+        else:
+            previous_severity = db.get_severity(self)
+            hist_info = self._get_hist_info()
+        history = self._prepare_update(correlate_with, previous_severity, hist_info)
+        return Alert.from_db(db.correlate_alert(self, history))
+
+    def _prepare_update(self, correlate_with, previous_severity, hist_info) -> List[History]:
         now = datetime.utcnow()
 
-        self.previous_severity = db.get_severity(self)
+        self.previous_severity = previous_severity
         self.trend_indication = alarm_model.trend(self.previous_severity, self.severity)
 
-        status, _, previous_status, _ = self._get_hist_info()
+        status, _, previous_status, _ = hist_info
 
         _, new_status = alarm_model.transition(
             alert=self,
@@ -376,10 +473,15 @@ class Alert:
         )]
 
         self.status = new_status
-        return Alert.from_db(db.correlate_alert(self, history))
+        self.previous_status, self.previous_timeout, self.status_expire_time = correlate_with._get_undo_info(new_status)
+        return history
 
     # create an alert
     def create(self) -> 'Alert':
+        self._prepare_create()
+        return Alert.from_db(db.create_alert(self))
+
+    def _prepare_create(self) -> None:
         now = datetime.utcnow()
 
         trend_indication = alarm_model.trend(alarm_model.DEFAULT_PREVIOUS_SEVERITY, self.severity)
@@ -410,19 +512,21 @@ class Alert:
             timeout=self.timeout
         )]
 
-        return Alert.from_db(db.create_alert(self))
-
     # retrieve an alert
     @staticmethod
     def find_by_id(id: str, customers: List[str] = None) -> 'Alert':
         return Alert.from_db(db.get_alert(id, customers))
 
+    @staticmethod
+    def find_by_ids(ids: List[str], query: Optional[Query] = None) -> List['Alert']:
+        return [Alert.from_db(alert) for alert in db.get_alerts_by_ids(ids, query)]
+
     def is_blackout(self) -> bool:
         """Does the alert create time fall within an existing blackout period?"""
         if not current_app.config['NOTIFICATION_BLACKOUT']:
             if self.severity in current_app.config['BLACKOUT_ACCEPT']:
                 return False
-        return db.is_blackout_period(self)
+        return blackout_index.is_blackout_period(self)
 
     @property
     def is_suppressed(self) -> bool:
@@ -446,7 +550,11 @@ class Alert:
             user=g.login,
             timeout=self.timeout
         )
-        return Alert.from_db(db.set_status(self.id, status, timeout, update_time=now, history=history))
+        previous_status, previous_timeout, status_expire_time = self._get_undo_info(status)
+        return Alert.from_db(db.set_status(
+            self.id, status, timeout, update_time=now, history=history, previous_status=previous_status,
+            previous_timeout=previous_timeout, status_expire_time=status_expire_time
+        ))
 
     # tag an alert
     def tag(self, tags: List[str]) -> bool:
@@ -493,6 +601,21 @@ class Alert:
     def find_all(query: Query = None, raw_data: bool = False, history: bool = False, page: int = 1, page_size: int = 1000) -> List['Alert']:
         return [Alert.from_db(alert) for alert in db.get_alerts(query, raw_data, history, page, page_size)]
 
+    @staticmethod
+    def find_after(query: Optional[Query] = None, after: Optional[List[Any]] = None, raw_data: bool = False, history: bool = False,
+                   page_size: int = 1000) -> Tuple[List['Alert'], Optional[List[Any]]]:
+        alerts, next_key = db.get_alerts_after(query, after, raw_data, history, page_size)
+        return [Alert.from_db(alert) for alert in alerts], next_key
+
+    # ids of changed alerts that no longer match the query, and of deleted alerts
+    @staticmethod
+    def find_changes(query: Query, since: datetime, customers: Optional[List[str]] = None) -> Tuple[List[str], List[str]]:
+        return db.get_alert_changes(query, since, customers)
+
+    @staticmethod
+    def get_change_sequence(customers: Optional[List[str]] = None) -> int:
+        return db.get_change_sequence(customers)
+
     @staticmethod
     def get_alert_history(alert, page=1, page_size=100):
         return [RichHistory.from_db(hist) for hist in db.get_alert_history(alert, page, page_size)]
@@ -502,11 +625,22 @@ class Alert:
     def get_history(query: Query = None, page=1, page_size=1000) -> List[RichHistory]:
         return [RichHistory.from_db(hist) for hist in db.get_history(query, page, page_size)]
 
+    @staticmethod
+    def get_history_after(query: Optional[Query] = None, after: Optional[List[Any]] = None,
+                          page_size: int = 1000) -> Tuple[List[RichHistory], Optional[List[Any]]]:
+        history, next_key = db.get_history_after(query, after, page_size)
+        return [RichHistory.from_db(hist) for hist in history], next_key
+
     # get total count
     @staticmethod
     def get_count(query: Query = None) -> Dict[str, Any]:
         return db.get_count(query)
 
+    # get estimated total count
+    @staticmethod
+    def get_count_estimate(query: Optional[Query] = None) -> int:
+        return db.get_count_estimate(query)
+
     # get severity counts
     @staticmethod
     def get_counts_by_severity(query: Query = None) -> Dict[str, Any]:
@@ -517,6 +651,11 @@ class Alert:
     def get_counts_by_status(query: Query = None) -> Dict[str, Any]:
         return db.get_counts_by_status(query)
 
+    # get severity and status counts
+    @staticmethod
+    def get_counts_by_severity_and_status(query: Optional[Query] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return db.get_counts_by_severity_and_status(query)
+
     # top 10 alerts
     @staticmethod
     def get_top10_count(query: Query = None) -> List[Dict[str, Any]]:
@@ -607,13 +746,22 @@ class Alert:
 
     @staticmethod
     def housekeeping(expired_threshold: int, info_threshold: int) -> Tuple[List['Alert'], List['Alert'], List['Alert']]:
+        Alert.delete_expired(expired_threshold, info_threshold)
+        return Alert.find_timed_out()
+
+    @staticmethod
+    def delete_expired(expired_threshold: int, info_threshold: int) -> None:
+        db.delete_expired(expired_threshold, info_threshold)
+
+    @staticmethod
+    def find_timed_out(limit: Optional[int] = None, exclude: Optional[List[str]] = None) -> Tuple[List['Alert'], List['Alert'], List['Alert']]:
         return (
-            [Alert.from_db(alert) for alert in db.get_expired(expired_threshold, info_threshold)],
-            [Alert.from_db(alert) for alert in db.get_unshelve()],
-            [Alert.from_db(alert) for alert in db.get_unack()]
+            [Alert.from_db(alert) for alert in db.get_expired(limit, exclude)],
+            [Alert.from_db(alert) for alert in db.get_unshelve(limit, exclude)],
+            [Alert.from_db(alert) for alert in db.get_unack(limit, exclude)]
         )
 
-    def from_status(self, status: str, text: str = '', timeout: int = None) -> 'Alert':
+    def from_status(self, status: str, text: str = '', timeout: Optional[int] = None) -> 'Alert':
         now = datetime.utcnow()
 
         self.timeout = timeout or current_app.config['ALERT_TIMEOUT']
@@ -629,6 +777,7 @@ class Alert:
             user=g.login,
             timeout=self.timeout
         )]
+        previous_status, previous_timeout, status_expire_time = self._get_undo_info(status)
         return Alert.from_db(db.set_alert(
             id=self.id,
             severity=self.severity,
@@ -638,13 +787,42 @@ class Alert:
             timeout=timeout,
             previous_severity=self.previous_severity,
             update_time=now,
-            history=history)
+            history=history,
+            previous_status=previous_status,
+            previous_timeout=previous_timeout,
+            status_expire_time=status_expire_time)
         )
 
-    def from_action(self, action: str, text: str = '', timeout: int = None) -> 'Alert':
+    def from_action(self, action: str, text: str = '', timeout: Optional[int] = None) -> 'Alert':
+        return Alert.from_db(db.set_alert(**self._prepare_action(action, text, timeout)))
+
+    @staticmethod
+    def from_actions(actions: List[Tuple['Alert', str, str, Optional[int]]]) -> List['Alert']:
+        """
+        Apply a batch of (alert, action, text, timeout) actions using a single update and return
+        the changed alerts. Alerts whose status has changed since they were read are skipped.
+        """
+        changes = []
+        for alert, action, text, timeout in actions:
+            change = alert._prepare_action(action, text, timeout, batch=True)
+            change['current_status'] = alert.status
+            changes.append(change)
+        return [Alert.from_db(alert) for alert in db.set_alerts(changes)]
+
+    def _prepare_action(self, action: str, text: str, timeout: Optional[int], batch: bool = False) -> Dict[str, Any]:
+        """
+        Return the change to the alert made by an action. When batched, current and previous status
+        are taken from the alert if it has them, rather than its history, and tags and attributes
+        changed by status change plugins are returned with the change instead of written.
+        """
         now = datetime.utcnow()
 
-        status, _, previous_status, previous_timeout = self._get_hist_info(action)
+        if batch and (action == ChangeType.expired or (self.status in [Status.Ack, Status.Shelved] and self.previous_status)):
+            status, previous_status, previous_timeout = self.status, self.previous_status, self.previous_timeout
+        elif (action, self.status) in [(ChangeType.unack, Status.Ack), (ChangeType.unshelve, Status.Shelved)] and self.previous_status:
+            status, previous_status, previous_timeout = self.status, self.previous_status, self.previous_timeout
+        else:
+            status, _, previous_status, previous_timeout = self._get_hist_info(action)
 
         if action in [ChangeType.unack, ChangeType.unshelve, ChangeType.timeout]:
             timeout = timeout or previous_timeout
@@ -663,8 +841,10 @@ class Alert:
             action=action
         )
 
-        r = status_change_hook.send(self, status=new_status, text=text)
-        _, (_, new_status, text) = r[0]
+        r = status_change_hook.send(self, status=new_status, text=text, persist=not batch)
+        _, (alert, new_status, text) = r[0]
+        if not batch:
+            alert = self
 
         try:
             change_type = ChangeType(action)
@@ -684,20 +864,32 @@ class Alert:
             timeout=timeout
         )]
 
-        return Alert.from_db(db.set_alert(
+        status_expire_time = now + timedelta(seconds=timeout) if timeout else None
+        if (change_type, new_status) in [(ChangeType.ack, Status.Ack), (ChangeType.shelve, Status.Shelved)]:
+            undo_info = status, self.timeout, status_expire_time  # type: Tuple[Optional[str], Optional[int], Optional[datetime]]
+        elif new_status in [Status.Ack, Status.Shelved] and new_status != self.status:
+            # eg. unshelved back to ack, so status and timeout to restore are found in history when undone
+            undo_info = None, None, status_expire_time
+        else:
+            undo_info = self._get_undo_info(new_status)
+
+        return dict(
             id=self.id,
             severity=new_severity,
             status=new_status,
-            tags=self.tags,
-            attributes=self.attributes,
+            tags=alert.tags,
+            attributes=alert.attributes,
             timeout=self.timeout,
             previous_severity=self.severity if new_severity != self.severity else self.previous_severity,
             update_time=now,
-            history=history)
+            history=history,
+            previous_status=undo_info[0],
+            previous_timeout=undo_info[1],
+            status_expire_time=undo_info[2]
         )
 
-    def from_expired(self, text: str = '', timeout: int = None):
+    def from_expired(self, text: str = '', timeout: Optional[int] = None):
         return self.from_action(action='expired', text=text, timeout=timeout)
 
-    def from_timeout(self, text: str = '', timeout: int = None):
+    def from_timeout(self, text: str = '', timeout: Optional[int] = None):
         return self.from_action(action='timeout', text=text, timeout=timeout)
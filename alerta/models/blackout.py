@@ -5,7 +5,7 @@ from uuid import uuid4
 from flask import current_app
 from strenum import StrEnum
 
-from alerta.app import db
+from alerta.app import blackout_index, db
 from alerta.database.base import Query
 from alerta.utils.format import DateTime
 from alerta.utils.response import absolute_url
@@ -218,7 +218,9 @@ class Blackout:
 
     # create a blackout
     def create(self) -> 'Blackout':
-        return Blackout.from_db(db.create_blackout(self))
+        blackout = Blackout.from_db(db.create_blackout(self))
+        blackout_index.invalidate()
+        return blackout
 
     # get a blackout
     @staticmethod
@@ -243,7 +245,11 @@ class Blackout:
             kwargs['service'] = []
         if 'tags' in kwargs and kwargs['tags'] is None:
             kwargs['tags'] = []
-        return Blackout.from_db(db.update_blackout(self.id, **kwargs))
+        blackout = Blackout.from_db(db.update_blackout(self.id, **kwargs))
+        blackout_index.invalidate()
+        return blackout
 
     def delete(self) -> bool:
-        return db.delete_blackout(self.id)
+        deleted = db.delete_blackout(self.id)
+        blackout_index.invalidate()
+        return deleted
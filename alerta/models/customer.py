@@ -1,7 +1,7 @@
 from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
 
-from alerta.app import db
+from alerta.app import auth_cache, db
 from alerta.database.base import Query
 from alerta.utils.response import absolute_url
 
@@ -61,7 +61,9 @@ class Customer:
             return cls.from_record(r)
 
     def create(self) -> 'Customer':
-        return Customer.from_db(db.create_customer(self))
+        customer = Customer.from_db(db.create_customer(self))
+        auth_cache.invalidate()
+        return customer
 
     @staticmethod
     def find_by_id(id: str) -> Optional['Customer']:
@@ -76,12 +78,19 @@ class Customer:
         return db.get_customers_count(query)
 
     def update(self, **kwargs) -> 'Customer':
-        return Customer.from_db(db.update_customer(self.id, **kwargs))
+        customer = Customer.from_db(db.update_customer(self.id, **kwargs))
+        auth_cache.invalidate()
+        return customer
 
     def delete(self) -> bool:
-        return db.delete_customer(self.id)
+        deleted = db.delete_customer(self.id)
+        auth_cache.invalidate()
+        return deleted
 
     @classmethod
     def lookup(cls, login: str, groups: List[str]) -> List[str]:
-        customers = db.get_customers_by_match(login, matches=groups)
+        customers = auth_cache.get_or_set(
+            ('customers', login, tuple(sorted(groups))),
+            lambda: db.get_customers_by_match(login, matches=groups)
+        )
         return customers if customers != '*' else []
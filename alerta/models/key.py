@@ -4,7 +4,7 @@ from uuid import uuid4
 
 from strenum import StrEnum
 
-from alerta.app import db, key_helper
+from alerta.app import db, key_cache, key_helper
 from alerta.database.base import Query
 from alerta.models.enums import Scope
 from alerta.utils.format import DateTime
@@ -128,6 +128,7 @@ class ApiKey:
         """
         Get API key details.
         """
+        key_cache.flush()
         return ApiKey.from_db(db.get_key(key, user))
 
     @staticmethod
@@ -135,6 +136,7 @@ class ApiKey:
         """
         List all API keys.
         """
+        key_cache.flush()
         return [ApiKey.from_db(key) for key in db.get_keys(query, page, page_size)]
 
     @staticmethod
@@ -146,22 +148,31 @@ class ApiKey:
         """
         List API keys for a user.
         """
+        key_cache.flush()
         return [ApiKey.from_db(key) for key in db.get_keys_by_user(user)]
 
     def update(self, **kwargs) -> 'ApiKey':
         kwargs['expireTime'] = DateTime.parse(kwargs['expireTime']) if 'expireTime' in kwargs else None
-        return ApiKey.from_db(db.update_key(self.key, **kwargs))
+        key = ApiKey.from_db(db.update_key(self.key, **kwargs))
+        key_cache.invalidate(self)
+        return key
 
     def delete(self) -> bool:
         """
         Delete an API key.
         """
-        return db.delete_key(self.key)
+        deleted = db.delete_key(self.key)
+        key_cache.invalidate(self)
+        return deleted
 
     @staticmethod
     def verify_key(key: str) -> Optional['ApiKey']:
-        key_info = ApiKey.from_db(db.get_key(key))
+        key_info = key_cache.get(key)
+        if not key_info:
+            key_info = ApiKey.from_db(db.get_key(key))
+            if key_info:
+                key_cache.put(key, key_info)
         if key_info and key_info.expire_time > datetime.utcnow():
-            db.update_key_last_used(key)
+            key_cache.used(key_info.key)
             return key_info
         return None
@@ -1,8 +1,16 @@
+import atexit
+import logging
+import os
+import threading
 import time
 from functools import wraps
 
+from flask import current_app
+
 from alerta.app import db
 
+LOG = logging.getLogger('alerta.metrics')
+
 
 class Gauge:
 
@@ -142,13 +150,19 @@ class Counter:
             return
 
     def inc(self, count=1):
-        result = db.inc_counter(Counter(
+        counter = Counter(
             group=self.group,
             name=self.name,
             title=self.title,
             description=self.description,
             count=count
-        ))
+        )
+        if current_app.config['METRICS_FLUSH_INTERVAL']:
+            self.count += count
+            metrics_buffer.add(counter)
+            return
+
+        result = db.inc_counter(counter)
         if isinstance(result, (int, float)):
             self.count = result
         else:
@@ -157,12 +171,13 @@ class Counter:
 
     @classmethod
     def find_all(cls):
+        metrics_buffer.flush()
         return [Counter.from_db(counter) for counter in db.get_metrics(type='counter')]
 
 
 class Timer:
 
-    def __init__(self, group, name, title=None, description=None, count=0, total_time=0):
+    def __init__(self, group, name, title=None, description=None, count=0, total_time=0, buckets=None):
 
         self.group = group
         self.name = name
@@ -173,19 +188,40 @@ class Timer:
         self.start = None
         self.count = count
         self.total_time = total_time
+        self.buckets = buckets  # number of observations in each histogram bucket (not cumulative)
 
     def serialize(self, format='json'):
+        bounds = current_app.config['METRICS_TIMER_BUCKETS']
         if format == 'prometheus':
-            return (
+            if not self.buckets:
+                return (
+                    '# HELP alerta_{group}_{name} {description}\n'
+                    '# TYPE alerta_{group}_{name} summary\n'
+                    'alerta_{group}_{name}_count {count}\n'
+                    'alerta_{group}_{name}_sum {total_time}\n'.format(
+                        group=self.group, name=self.name, description=self.description, count=self.count, total_time=self.total_time
+                    )
+                )
+            output = (
                 '# HELP alerta_{group}_{name} {description}\n'
-                '# TYPE alerta_{group}_{name} summary\n'
+                '# TYPE alerta_{group}_{name} histogram\n'.format(
+                    group=self.group, name=self.name, description=self.description
+                )
+            )
+            cumulative = 0
+            for le, observed in zip(bounds, self.buckets):
+                cumulative += observed or 0
+                output += f'alerta_{self.group}_{self.name}_bucket{{le="{le}"}} {cumulative}\n'
+            output += (
+                'alerta_{group}_{name}_bucket{{le="+Inf"}} {count}\n'
                 'alerta_{group}_{name}_count {count}\n'
                 'alerta_{group}_{name}_sum {total_time}\n'.format(
-                    group=self.group, name=self.name, description=self.description, count=self.count, total_time=self.total_time
+                    group=self.group, name=self.name, count=self.count, total_time=self.total_time
                 )
             )
+            return output
         else:
-            return {
+            timer = {
                 'group': self.group,
                 'name': self.name,
                 'title': self.title,
@@ -194,6 +230,9 @@ class Timer:
                 'count': self.count,
                 'totalTime': self.total_time
             }
+            if self.buckets:
+                timer['buckets'] = [{'le': le, 'count': observed or 0} for le, observed in zip(bounds, self.buckets)]
+            return timer
 
     def __repr__(self):
         return 'Timer(group={!r}, name={!r}, title={!r}, count={!r}, total_time={!r})'.format(
@@ -202,13 +241,15 @@ class Timer:
 
     @classmethod
     def from_document(cls, doc):
+        buckets = doc.get('buckets', None)
         return Timer(
             group=doc.get('group'),
             name=doc.get('name'),
             title=doc.get('title', None),
             description=doc.get('description', None),
             count=doc.get('count', None),
-            total_time=doc.get('totalTime', None)
+            total_time=doc.get('totalTime', None),
+            buckets=[buckets.get(str(i), 0) for i in range(len(current_app.config['METRICS_TIMER_BUCKETS']))] if buckets else None
         )
 
     @classmethod
@@ -219,7 +260,8 @@ class Timer:
             title=rec.title,
             description=rec.description,
             count=rec.count,
-            total_time=rec.total_time
+            total_time=rec.total_time,
+            buckets=rec.buckets
         )
 
     @classmethod
@@ -238,22 +280,120 @@ class Timer:
         return self._time_in_millis()
 
     def stop_timer(self, start, count=1):
-        t = Timer.from_db(db.update_timer(Timer(
+        total_time = self._time_in_millis() - start
+
+        # when timing a batch each item is observed as taking the average time
+        buckets = [0] * len(current_app.config['METRICS_TIMER_BUCKETS'])
+        for i, le in enumerate(current_app.config['METRICS_TIMER_BUCKETS']):
+            if total_time / max(count, 1) <= le:
+                buckets[i] = count
+                break
+
+        timer = Timer(
             group=self.group,
             name=self.name,
             title=self.title,
             description=self.description,
             count=count,
-            total_time=(self._time_in_millis() - start)
-        )))
+            total_time=total_time,
+            buckets=buckets
+        )
+        if current_app.config['METRICS_FLUSH_INTERVAL']:
+            self.count += count
+            self.total_time += total_time
+            metrics_buffer.add(timer)
+            return
+
+        t = Timer.from_db(db.update_timer(timer))
         self.count = t.count
         self.total_time = t.total_time
 
     @classmethod
     def find_all(cls):
+        metrics_buffer.flush()
         return [Timer.from_db(timer) for timer in db.get_metrics(type='timer')]
 
 
+class MetricsBuffer:
+    """
+    Accumulate counter and timer updates in memory and write them to the
+    database in a single batch from a background thread every
+    METRICS_FLUSH_INTERVAL seconds, when metrics are read, and at exit.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.pending = dict()  # (group, name, type) -> Counter or Timer
+        self.last_flush = time.monotonic()
+        self.app = None
+        self.worker_pid = None
+        atexit.register(self._flush_at_exit)
+
+    def _merge(self, metric):
+        key = (metric.group, metric.name, metric.type)
+        pending = self.pending.get(key)
+        if not pending:
+            self.pending[key] = metric
+            return
+        pending.count += metric.count
+        if metric.type == 'timer':
+            pending.total_time += metric.total_time
+            if pending.buckets and metric.buckets:
+                pending.buckets = [a + b for a, b in zip(pending.buckets, metric.buckets)]
+
+    def _check_pid(self):
+        # updates buffered before a fork belong to the parent process
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.pending = dict()
+
+    def add(self, metric):
+        with self.lock:
+            self._check_pid()
+            self._merge(metric)
+            self.app = current_app._get_current_object()
+            # threads don't survive a fork so one is started by each process on its first update
+            if self.worker_pid != self.pid:
+                self.worker_pid = self.pid
+                threading.Thread(target=self._run, name='metrics', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(1)
+            if time.monotonic() - self.last_flush < self.app.config['METRICS_FLUSH_INTERVAL']:
+                continue
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception as e:
+                LOG.error('Failed to flush buffered metrics: %s', e)
+
+    def _flush_at_exit(self):
+        # updates buffered by a forked process that never added any belong to the parent
+        if self.app is not None and self.pid == os.getpid():
+            with self.app.app_context():
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            self._check_pid()
+            pending, self.pending = list(self.pending.values()), dict()
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            db.update_metrics(pending)
+        except Exception as e:
+            LOG.warning('Failed to write %d buffered metrics: %s', len(pending), e)
+            with self.lock:
+                for metric in pending:
+                    self._merge(metric)
+
+
+metrics_buffer = MetricsBuffer()
+
+
 def timer(metric):
     def decorated(f):
         @wraps(f)
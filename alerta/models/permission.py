@@ -3,7 +3,7 @@ from uuid import uuid4
 
 from flask import current_app
 
-from alerta.app import db
+from alerta.app import auth_cache, db
 from alerta.database.base import Query
 from alerta.models.enums import Scope
 from alerta.utils.response import absolute_url
@@ -66,7 +66,9 @@ class Permission:
             return cls.from_record(r)
 
     def create(self) -> 'Permission':
-        return Permission.from_db(db.create_perm(self))
+        perm = Permission.from_db(db.create_perm(self))
+        auth_cache.invalidate()
+        return perm
 
     @staticmethod
     def find_by_id(id: str) -> Optional['Permission']:
@@ -81,10 +83,14 @@ class Permission:
         return db.get_perms_count(query)
 
     def update(self, **kwargs) -> 'Permission':
-        return Permission.from_db(db.update_perm(self.id, **kwargs))
+        perm = Permission.from_db(db.update_perm(self.id, **kwargs))
+        auth_cache.invalidate()
+        return perm
 
     def delete(self) -> bool:
-        return db.delete_perm(self.id)
+        deleted = db.delete_perm(self.id)
+        auth_cache.invalidate()
+        return deleted
 
     @classmethod
     def is_in_scope(cls, want_scope: str, have_scopes: List[Scope]) -> bool:
@@ -111,4 +117,7 @@ class Permission:
 
     @classmethod
     def lookup(cls, login: str, roles: List[str]) -> List[Scope]:
-        return [Scope(s) for s in db.get_scopes_by_match(login, matches=roles)]
+        return auth_cache.get_or_set(
+            ('scopes', login, tuple(sorted(roles))),
+            lambda: [Scope(s) for s in db.get_scopes_by_match(login, matches=roles)]
+        )
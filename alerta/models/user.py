@@ -5,7 +5,7 @@ from uuid import uuid4
 from flask import current_app
 from strenum import StrEnum
 
-from alerta.app import db
+from alerta.app import auth_cache, db
 from alerta.auth import utils
 from alerta.database.base import Query
 from alerta.models.group import Group
@@ -194,7 +194,7 @@ class User:
     @staticmethod
     def check_credentials(username: str, password: str) -> Optional['User']:
         user = User.find_by_username(username)
-        if user and user.verify_password(password):
+        if user and auth_cache.check_password(user, password):
             return user
         return None
 
@@ -1,16 +1,49 @@
 import abc
 import logging
 import os
-from typing import TYPE_CHECKING, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional
 
 if TYPE_CHECKING:
     from alerta.models.alert import Alert  # noqa
 
 LOG = logging.getLogger('alerta.plugins')
 
+# max artifacts each plugin keeps, eg. one for each set of plugin config returned by routing rules
+CONFIG_CACHE_SIZE = 64
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple((k, _freeze(v)) for k, v in value.items())
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def stub(method: Callable) -> Callable:
+    """
+    Mark a hook that does nothing so that it is never called, eg. one that only raises
+    NotImplementedError, returns None or returns the alert passed to pre_receive().
+    """
+    method.__stub__ = True  # type: ignore
+    return method
+
 
 class PluginBase(metaclass=abc.ABCMeta):
 
+    # run post_receive() and post_action() in the background, see ASYNC_PLUGINS
+    asynchronous = False
+
+    _config_lock = threading.Lock()
+
     def __init__(self, name=None):
         self.name = name or self.__module__
         if self.__doc__:
@@ -55,6 +88,35 @@ class PluginBase(metaclass=abc.ABCMeta):
         """Trigger integrations when an alert is deleted. (optional)"""
         raise NotImplementedError
 
+    def close(self) -> None:
+        """Stop background threads and close connections when the plugin is replaced. (optional)"""
+        pass
+
+    def cached_config(self, keys: Iterable[str], build: Callable[..., Any], **kwargs) -> Any:
+        """
+        Return what build(**kwargs) derives from the config settings named in keys, eg.
+        compiled regexes or sets, and only call it again when the value of one of those
+        settings, from the environment or the config passed to the hook, changes.
+        """
+        config = kwargs.get('config') or {}
+        key = (build.__name__,) + tuple(
+            _freeze(os.environ[k] if k in os.environ else config.get(k)) for k in keys
+        )
+
+        with self._config_lock:
+            # created under the lock so that concurrent first calls share one cache
+            cache = self.__dict__.setdefault('_config_cache', OrderedDict())  # type: OrderedDict[tuple, Any]
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+
+        artifact = build(**kwargs)
+        with self._config_lock:
+            cache[key] = artifact
+            while len(cache) > CONFIG_CACHE_SIZE:
+                cache.popitem(last=False)
+        return artifact
+
     @staticmethod
     def get_config(key, default=None, type=None, **kwargs):
 
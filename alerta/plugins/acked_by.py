@@ -2,7 +2,7 @@ import logging
 
 from flask import g
 
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
 
 LOG = logging.getLogger('alerta.plugins')
 
@@ -17,9 +17,11 @@ class AckedBy(PluginBase):
     to the list of alert attributes in the COLUMNS server setting.
     """
 
+    @stub
     def pre_receive(self, alert, **kwargs):
         return alert
 
+    @stub
     def post_receive(self, alert, **kwargs):
         return
 
@@ -39,5 +41,6 @@ class AckedBy(PluginBase):
             alert.attributes['acked-by'] = None
         return alert
 
+    @stub
     def delete(self, alert, **kwargs) -> bool:
         raise NotImplementedError
@@ -1,7 +1,7 @@
 import logging
 
 from alerta.exceptions import BlackoutPeriod
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
 
 LOG = logging.getLogger('alerta.plugins')
 
@@ -16,7 +16,7 @@ class BlackoutHandler(PluginBase):
     any plugins for further notification.
     """
 
-    def pre_receive(self, alert, **kwargs):
+    def blackout_policy(self, **kwargs):
         NOTIFICATION_BLACKOUT = self.get_config('NOTIFICATION_BLACKOUT', default=True, type=bool, **kwargs)
 
         if self.get_config('ALARM_MODEL', **kwargs) == 'ALERTA':
@@ -24,6 +24,11 @@ class BlackoutHandler(PluginBase):
         else:
             status = 'OOSRV'  # ISA_18_2
 
+        return NOTIFICATION_BLACKOUT, status
+
+    def pre_receive(self, alert, **kwargs):
+        NOTIFICATION_BLACKOUT, status = self.cached_config(['NOTIFICATION_BLACKOUT', 'ALARM_MODEL'], self.blackout_policy, **kwargs)
+
         if alert.is_blackout():
             if NOTIFICATION_BLACKOUT:
                 LOG.debug(f'Set status to "{status}" during blackout period (id={alert.id})')
@@ -33,14 +38,18 @@ class BlackoutHandler(PluginBase):
                 raise BlackoutPeriod('Suppressed alert during blackout period')
         return alert
 
+    @stub
     def post_receive(self, alert, **kwargs):
         return
 
+    @stub
     def status_change(self, alert, status, text, **kwargs):
         return
 
+    @stub
     def take_action(self, alert, action, text, **kwargs):
         raise NotImplementedError
 
+    @stub
     def delete(self, alert, **kwargs) -> bool:
         raise NotImplementedError
@@ -2,7 +2,7 @@ import logging
 
 from alerta.app import alarm_model
 from alerta.exceptions import InvalidAction
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
 
 LOG = logging.getLogger('alerta.plugins')
 
@@ -30,12 +30,15 @@ class EscalateSeverity(PluginBase):
                 escalate_map[level].append(sev)
         super().__init__()
 
+    @stub
     def pre_receive(self, alert, **kwargs):
         return alert
 
+    @stub
     def post_receive(self, alert, **kwargs):
         return
 
+    @stub
     def status_change(self, alert, status, text, **kwargs):
         return
 
@@ -51,8 +54,10 @@ class EscalateSeverity(PluginBase):
 
         return alert, action, text
 
+    @stub
     def take_note(self, alert, text, **kwargs):
         raise NotImplementedError
 
+    @stub
     def delete(self, alert, **kwargs) -> bool:
         raise NotImplementedError
@@ -1,11 +1,20 @@
+import json
 import logging
-from typing import TYPE_CHECKING, Any, Optional
-
-from flask import request
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from flask import Flask, current_app, has_request_context, request
 
 from alerta.exceptions import ForwardingLoop
-from alerta.plugins import PluginBase
-from alerta.utils.client import Client
+from alerta.plugins import PluginBase, stub
+from alerta.utils.client import Client, CustomJsonEncoder
 from alerta.utils.response import base_url
 
 if TYPE_CHECKING:
@@ -16,23 +25,277 @@ LOG = logging.getLogger('alerta.plugins.forwarder')
 
 X_LOOP_HEADER = 'X-Alerta-Loop'
 
+# seconds a failed forward taken from the retry queue is hidden from other processes
+RETRY_LEASE = 300
+
+# forwards without auth use the auth for the remote in FWD_DESTINATIONS
+Forward = namedtuple('Forward', ['remote', 'method', 'path', 'data', 'headers', 'auth'], defaults=[None])
+
+
+def get_xloop(**kwargs):
+    # asynchronous hooks are passed the header of the request that submitted them
+    if 'x_loop' in kwargs:
+        return kwargs['x_loop']
+    # alerts changed by housekeeping were not forwarded by anyone
+    return request.headers.get(X_LOOP_HEADER) if has_request_context() else None
+
 
-def append_to_header(origin):
-    x_loop = request.headers.get(X_LOOP_HEADER)
+def append_to_header(origin, **kwargs):
+    x_loop = get_xloop(**kwargs)
     return origin if not x_loop else f'{x_loop},{origin}'
 
 
-def is_in_xloop(server):
-    x_loop = request.headers.get(X_LOOP_HEADER)
+def is_in_xloop(server, **kwargs):
+    x_loop = get_xloop(**kwargs)
     return server in x_loop if server and x_loop else False
 
 
+def metric_name(remote):
+    # eg. https://alerta.example.com:8443/api => alerta_example_com_8443
+    return re.sub(r'[^a-z0-9]+', '_', urlparse(remote).netloc.lower()).strip('_')
+
+
+def is_retryable(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+class RetryQueue:
+    """
+    Failed forwards stored in a SQLite database so that they survive a restart. Each
+    process on the same host can share the database.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.local = threading.local()
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS forwards (id INTEGER PRIMARY KEY, remote TEXT NOT NULL, method TEXT NOT NULL, '
+            'path TEXT NOT NULL, data TEXT, headers TEXT, attempts INTEGER NOT NULL, retry_time REAL NOT NULL, error TEXT, auth TEXT)'
+        )
+        # retry queues created before auth was stored with each forward
+        try:
+            self._conn().execute('ALTER TABLE forwards ADD COLUMN auth TEXT')
+        except sqlite3.OperationalError:
+            pass
+
+    def _conn(self) -> sqlite3.Connection:
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self.local.conn.execute('PRAGMA journal_mode=WAL')
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def put(self, fwd: Forward, attempts: int, delay: float, error: str) -> None:
+        self._conn().execute(
+            'INSERT INTO forwards (remote, method, path, data, headers, attempts, retry_time, error, auth) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (fwd.remote, fwd.method, fwd.path, json.dumps(fwd.data, cls=CustomJsonEncoder), json.dumps(fwd.headers),
+             attempts, time.time() + delay, error, json.dumps(fwd.auth))
+        )
+
+    def take(self, limit: int) -> List[Tuple[int, Forward, int]]:
+        """
+        Return forwards due for retry, and hide them from other processes until they are
+        retried or the lease expires.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                'SELECT id, remote, method, path, data, headers, attempts, auth FROM forwards WHERE retry_time <= ? ORDER BY retry_time LIMIT ?',
+                (now, limit)
+            ).fetchall()
+            conn.executemany('UPDATE forwards SET retry_time=? WHERE id=?', [(now + RETRY_LEASE, r[0]) for r in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return [(r[0], Forward(r[1], r[2], r[3], json.loads(r[4]), json.loads(r[5]), json.loads(r[7] or 'null')), r[6]) for r in rows]
+
+    def retry_later(self, id: int, attempts: int, delay: float, error: str) -> None:
+        self._conn().execute(
+            'UPDATE forwards SET attempts=?, retry_time=?, error=? WHERE id=?', (attempts, time.time() + delay, error, id)
+        )
+
+    def delete(self, id: int) -> None:
+        self._conn().execute('DELETE FROM forwards WHERE id=?', (id,))
+
+    def __len__(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM forwards').fetchone()[0]
+
+
 class Forwarder(PluginBase):
     """
     Alert and action forwarder for federated Alerta deployments
     See https://docs.alerta.io/en/latest/federated.html
+
+    Each remote has its own client so that connections are kept alive between requests,
+    and requests to different remotes are sent at the same time. Alerts for remotes with
+    "bulk" in actions are sent in batches of up to FWD_BATCH_SIZE alerts. If FWD_RETRY_QUEUE
+    is set, forwards that fail are retried with exponential backoff.
     """
 
+    def __init__(self, name=None) -> None:
+        super().__init__(name)
+
+        self.lock = threading.Lock()
+        self.pid = None  # type: Optional[int]
+        self.app = None  # type: Optional[Flask]
+        self.clients = dict()  # type: Dict[Tuple[str, str], Client]
+        self.executor = None  # type: Optional[ThreadPoolExecutor]
+        self.stopped = threading.Event()
+        self.metrics = dict()  # type: Dict[str, Tuple[Any, Any]]
+        self.batches = dict()  # type: Dict[Tuple[str, str, str], List[Dict[str, Any]]]
+        self.batch_time = dict()  # type: Dict[Tuple[str, str, str], float]
+        self.retry_queue = None  # type: Optional[RetryQueue]
+        self.worker = None  # type: Optional[threading.Thread]
+
+    def _setup(self, **kwargs) -> None:
+        # thread pools and connections are not shared with forked processes
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.app = current_app._get_current_object()  # type: ignore
+            self.stopped = threading.Event()
+            self.clients = dict()
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.get_config('FWD_MAX_WORKERS', default=4, type=int, **kwargs),
+                thread_name_prefix='forwarder'
+            )
+            self.batches = dict()
+            self.batch_time = dict()
+            retry_queue = self.get_config('FWD_RETRY_QUEUE', default=None, type=str, **kwargs)
+            self.retry_queue = RetryQueue(retry_queue) if retry_queue else None
+            if self.retry_queue is not None or self.get_config('FWD_BATCH_SIZE', default=0, type=int, **kwargs):
+                self.worker = threading.Thread(target=self._work, args=(self.app, self.stopped), name='forwarder', daemon=True)
+                self.worker.start()
+            self.pid = os.getpid()
+
+    def close(self) -> None:
+        # alerts waiting to be sent in a batch are sent now, unless they belong to the parent process
+        if self.pid == os.getpid() and self.app is not None:
+            batches = self._expired_batches(0)
+            if batches:
+                with self.app.app_context():
+                    self._forward(batches)
+        with self.lock:
+            self.stopped.set()
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+            self.pid = None
+
+    def _client(self, remote: str, auth: Optional[Dict[str, Any]] = None) -> Client:
+        if auth is None and self.app is not None:
+            auth = next((a for r, a, _ in self.app.config['FWD_DESTINATIONS'] if r == remote), None)
+        if auth is None:
+            raise ValueError(f'Remote {remote} is not in FWD_DESTINATIONS')
+        # routing rules can configure different credentials for the same remote
+        key = (remote, json.dumps(auth, sort_keys=True))
+        with self.lock:
+            if key not in self.clients:
+                self.clients[key] = Client(endpoint=remote, **auth)
+            return self.clients[key]
+
+    def _metrics(self, remote: str) -> Tuple[Any, Any]:
+        from alerta.models.metrics import Counter, Timer
+
+        with self.lock:
+            if remote not in self.metrics:
+                name = metric_name(remote)
+                self.metrics[remote] = (
+                    Timer('forwarder', name, f'Forwarded to {remote}', f'Total time and number of requests forwarded to {remote}'),
+                    Counter('forwarder', f'{name}_errors', f'Forward errors for {remote}',
+                            f'Total number of requests to {remote} that failed')
+                )
+            return self.metrics[remote]
+
+    def _send(self, fwd: Forward) -> Tuple[Optional[int], float, Optional[str]]:
+        start = time.monotonic()
+        try:
+            r = self._client(fwd.remote, fwd.auth).http.request(fwd.method, fwd.path, fwd.data, headers=fwd.headers)
+        except Exception as e:
+            return None, time.monotonic() - start, str(e)
+        LOG.debug(f'Forward [{fwd.method.upper()} {fwd.path}]: {fwd.remote} ; [{r.status_code}] {r.text}')
+        return r.status_code, time.monotonic() - start, None if r.status_code < 400 else f'[{r.status_code}] {r.text}'
+
+    def _submit(self, fwd: Forward) -> 'Future[Tuple[Optional[int], float, Optional[str]]]':
+        if self.executor is None:
+            raise RuntimeError('Forwarder is not set up')
+        return self.executor.submit(self._send, fwd)
+
+    def _record(self, fwd: Forward, elapsed: float, error: Optional[str]) -> None:
+        timer, errors = self._metrics(fwd.remote)
+        timer.stop_timer(timer.start_timer() - int(elapsed * 1000))
+        if error:
+            errors.inc()
+
+    def _forward(self, forwards: List[Forward]) -> None:
+        """
+        Send requests to all remotes at the same time and wait for the responses.
+        """
+        futures = [(fwd, self._submit(fwd)) for fwd in forwards]
+        for fwd, future in futures:
+            status_code, elapsed, error = future.result()
+            self._record(fwd, elapsed, error)
+            if not error:
+                continue
+            LOG.warning(f'Forward [{fwd.method.upper()} {fwd.path}]: Failed to forward to {fwd.remote} - {error}')
+            if self.retry_queue is not None and (status_code is None or is_retryable(status_code)):
+                self.retry_queue.put(fwd, attempts=1, delay=current_app.config['FWD_RETRY_INTERVAL'], error=error)
+
+    def _batch(self, remote: str, auth: Dict[str, Any], headers: Dict[str, str], data: Dict[str, Any],
+               batch_size: int) -> Optional[Forward]:
+        key = (remote, headers[X_LOOP_HEADER], json.dumps(auth, sort_keys=True))
+        with self.lock:
+            batch = self.batches.setdefault(key, [])
+            if not batch:
+                self.batch_time[key] = time.monotonic()
+            batch.append(data)
+            if len(batch) < batch_size:
+                return None
+            del self.batches[key]
+        return Forward(remote, 'post', '/alerts/_bulk', batch, headers, auth)
+
+    def _expired_batches(self, interval: float) -> List[Forward]:
+        now = time.monotonic()
+        forwards = list()
+        with self.lock:
+            for key in [k for k, t in self.batch_time.items() if k in self.batches and now - t >= interval]:
+                remote, x_loop, auth = key
+                forwards.append(Forward(remote, 'post', '/alerts/_bulk', self.batches.pop(key), {X_LOOP_HEADER: x_loop}, json.loads(auth)))
+        return forwards
+
+    def _retry(self, retry_queue: RetryQueue) -> None:
+        interval = current_app.config['FWD_RETRY_INTERVAL']
+        max_attempts = current_app.config['FWD_RETRY_MAX_ATTEMPTS']
+
+        due = retry_queue.take(limit=100)
+        futures = [(id, fwd, attempts, self._submit(fwd)) for id, fwd, attempts in due]
+        for id, fwd, attempts, future in futures:
+            status_code, elapsed, error = future.result()
+            self._record(fwd, elapsed, error)
+            if not error or not (status_code is None or is_retryable(status_code)):
+                retry_queue.delete(id)
+            elif attempts >= max_attempts:
+                LOG.error(f'Forward [{fwd.method.upper()} {fwd.path}]: Giving up after {attempts} attempts to {fwd.remote} - {error}')
+                retry_queue.delete(id)
+            else:
+                retry_queue.retry_later(id, attempts + 1, delay=interval * 2 ** attempts, error=error)
+
+    def _work(self, app: Flask, stopped: threading.Event) -> None:
+        while not stopped.wait(1):
+            try:
+                with app.app_context():
+                    batches = self._expired_batches(app.config['FWD_BATCH_INTERVAL'])
+                    if batches:
+                        self._forward(batches)
+                    if self.retry_queue is not None:
+                        self._retry(self.retry_queue)
+            except Exception as e:
+                LOG.error(f'Forwarder background task failed: {str(e)}', exc_info=True)
+
     def pre_receive(self, alert: 'Alert', **kwargs) -> 'Alert':
 
         if is_in_xloop(base_url()):
@@ -42,30 +305,39 @@ class Forwarder(PluginBase):
 
     def post_receive(self, alert: 'Alert', **kwargs) -> Optional['Alert']:
 
+        self._setup(**kwargs)
+        batch_size = self.get_config('FWD_BATCH_SIZE', default=0, type=int, **kwargs)
+        origin = kwargs.get('base_url') or base_url()
+
+        forwards = list()
         for remote, auth, actions in self.get_config('FWD_DESTINATIONS', default=[], type=list, **kwargs):
-            if is_in_xloop(remote):
+            if is_in_xloop(remote, **kwargs):
                 LOG.debug(f'Forward [action=alerts]: {alert.id} ; Remote {remote} already processed alert. Skip.')
                 continue
             if not ('*' in actions or 'alerts' in actions):
                 LOG.debug(f'Forward [action=alerts]: {alert.id} ; Remote {remote} not configured for alerts. Skip.')
                 continue
 
-            headers = {X_LOOP_HEADER: append_to_header(base_url())}
-            client = Client(endpoint=remote, headers=headers, **auth)
+            headers = {X_LOOP_HEADER: append_to_header(origin, **kwargs)}
 
-            LOG.info(f'Forward [action=alerts]: {alert.id} ; {base_url()} -> {remote}')
-            try:
-                body = alert.get_body(history=False)
-                body['id'] = alert.last_receive_id
-                # FIXME - createTime is being overwritten by send_alert()
-                r = client.send_alert(**body)
-            except Exception as e:
-                LOG.warning(f'Forward [action=alerts]: {alert.id} ; Failed to forward alert to {remote} - {str(e)}')
-                continue
-            LOG.debug(f'Forward [action=alerts]: {alert.id} ; [{r.status_code}] {r.text}')
+            LOG.info(f'Forward [action=alerts]: {alert.id} ; {origin} -> {remote}')
+            body = alert.get_body(history=False)
+            body['id'] = alert.last_receive_id
+            # FIXME - createTime is being overwritten by alert_data()
+            data = Client.alert_data(**body)
+
+            if batch_size and 'bulk' in actions:
+                fwd = self._batch(remote, auth, headers, data, batch_size)
+                if fwd:
+                    forwards.append(fwd)
+            else:
+                forwards.append(Forward(remote, 'post', '/alert', data, headers, auth))
 
+        if forwards:
+            self._forward(forwards)
         return alert
 
+    @stub
     def status_change(self, alert: 'Alert', status: str, text: str, **kwargs) -> Any:
         return
 
@@ -77,6 +349,9 @@ class Forwarder(PluginBase):
                 action, http_origin, base_url())
             )
 
+        self._setup(**kwargs)
+
+        forwards = list()
         for remote, auth, actions in self.get_config('FWD_DESTINATIONS', default=[], type=list, **kwargs):
             if is_in_xloop(remote):
                 LOG.debug(f'Forward [action={action}]: {alert.id} ; Remote {remote} already processed action. Skip.')
@@ -86,16 +361,13 @@ class Forwarder(PluginBase):
                 continue
 
             headers = {X_LOOP_HEADER: append_to_header(base_url())}
-            client = Client(endpoint=remote, headers=headers, **auth)
 
             LOG.info(f'Forward [action={action}]: {alert.id} ; {base_url()} -> {remote}')
-            try:
-                r = client.action(alert.id, action, text)
-            except Exception as e:
-                LOG.warning(f'Forward [action={action}]: {alert.id} ; Failed to action alert on {remote} - {str(e)}')
-                continue
-            LOG.debug(f'Forward [action={action}]: {alert.id} ; [{r.status_code}] {r.text}')
+            data = {'action': action, 'text': text, 'timeout': None}
+            forwards.append(Forward(remote, 'put', f'/alert/{alert.id}/action', data, headers, auth))
 
+        if forwards:
+            self._forward(forwards)
         return alert
 
     def delete(self, alert: 'Alert', **kwargs) -> bool:
@@ -104,6 +376,9 @@ class Forwarder(PluginBase):
             http_origin = request.origin or '(unknown)'  # type: ignore
             raise ForwardingLoop(f'Delete forwarded by {http_origin} already processed by {base_url()}')
 
+        self._setup(**kwargs)
+
+        forwards = list()
         for remote, auth, actions in self.get_config('FWD_DESTINATIONS', default=[], type=list, **kwargs):
             if is_in_xloop(remote):
                 LOG.debug(f'Forward [action=delete]: {alert.id} ; Remote {remote} already processed delete. Skip.')
@@ -113,14 +388,10 @@ class Forwarder(PluginBase):
                 continue
 
             headers = {X_LOOP_HEADER: append_to_header(base_url())}
-            client = Client(endpoint=remote, headers=headers, **auth)
 
             LOG.info(f'Forward [action=delete]: {alert.id} ; {base_url()} -> {remote}')
-            try:
-                r = client.delete_alert(alert.id)
-            except Exception as e:
-                LOG.warning(f'Forward [action=delete]: {alert.id} ; Failed to delete alert on {remote} - {str(e)}')
-                continue
-            LOG.debug(f'Forward [action=delete]: {alert.id} ; [{r.status_code}] {r.text}')
+            forwards.append(Forward(remote, 'delete', f'/alert/{alert.id}', None, headers, auth))
 
+        if forwards:
+            self._forward(forwards)
         return True  # always continue with local delete even if remote delete(s) fail
@@ -2,7 +2,7 @@ import logging
 
 from alerta.exceptions import HeartbeatReceived
 from alerta.models.heartbeat import Heartbeat
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
 
 LOG = logging.getLogger('alerta.plugins')
 
@@ -13,8 +13,11 @@ class HeartbeatReceiver(PluginBase):
     them into heartbeats and will return a 202 Accept HTTP status code.
     """
 
+    def heartbeat_events(self, **kwargs):
+        return frozenset(self.get_config('HEARTBEAT_EVENTS', default=['Heartbeat'], type=list, **kwargs))
+
     def pre_receive(self, alert, **kwargs):
-        HEARTBEAT_EVENTS = self.get_config('HEARTBEAT_EVENTS', default=['Heartbeat'], type=list, **kwargs)
+        HEARTBEAT_EVENTS = self.cached_config(['HEARTBEAT_EVENTS'], self.heartbeat_events, **kwargs)
 
         if alert.event in HEARTBEAT_EVENTS:
             hb = Heartbeat(
@@ -34,14 +37,18 @@ class HeartbeatReceiver(PluginBase):
 
         return alert
 
+    @stub
     def post_receive(self, alert, **kwargs):
         return
 
+    @stub
     def status_change(self, alert, status, text, **kwargs):
         return
 
+    @stub
     def take_action(self, alert, action, text, **kwargs):
         raise NotImplementedError
 
+    @stub
     def delete(self, alert, **kwargs) -> bool:
         raise NotImplementedError
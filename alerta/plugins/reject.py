@@ -2,7 +2,7 @@ import logging
 import re
 
 from alerta.exceptions import RejectException
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
 
 LOG = logging.getLogger('alerta.plugins')
 
@@ -16,13 +16,21 @@ class RejectPolicy(PluginBase):
     2) service - must supply a value for service. Any value is acceptable.
     """
 
-    def pre_receive(self, alert, **kwargs):
-
+    def compile_policy(self, **kwargs):
         ORIGIN_BLACKLIST = self.get_config('ORIGIN_BLACKLIST', default=[], type=list, **kwargs)
         ALLOWED_ENVIRONMENTS = self.get_config('ALLOWED_ENVIRONMENTS', default=[], type=list, **kwargs)
 
-        ORIGIN_BLACKLIST_REGEX = [re.compile(x) for x in ORIGIN_BLACKLIST]
-        ALLOWED_ENVIRONMENT_REGEX = [re.compile(x) for x in ALLOWED_ENVIRONMENTS]
+        return (
+            [re.compile(x) for x in ORIGIN_BLACKLIST],
+            ALLOWED_ENVIRONMENTS,
+            [re.compile(x) for x in ALLOWED_ENVIRONMENTS]
+        )
+
+    def pre_receive(self, alert, **kwargs):
+
+        ORIGIN_BLACKLIST_REGEX, ALLOWED_ENVIRONMENTS, ALLOWED_ENVIRONMENT_REGEX = self.cached_config(
+            ['ORIGIN_BLACKLIST', 'ALLOWED_ENVIRONMENTS'], self.compile_policy, **kwargs
+        )
 
         if any(regex.match(alert.origin) for regex in ORIGIN_BLACKLIST_REGEX):
             LOG.warning("[POLICY] Alert origin '%s' has been blacklisted", alert.origin)
@@ -39,14 +47,18 @@ class RejectPolicy(PluginBase):
 
         return alert
 
+    @stub
     def post_receive(self, alert, **kwargs):
         return
 
+    @stub
     def status_change(self, alert, status, text, **kwargs):
         return
 
+    @stub
     def take_action(self, alert, action, text, **kwargs):
         raise NotImplementedError
 
+    @stub
     def delete(self, alert, **kwargs) -> bool:
         raise NotImplementedError
@@ -2,7 +2,7 @@ import logging
 
 from flask import request
 
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
 
 LOG = logging.getLogger('alerta.plugins')
 
@@ -18,14 +18,18 @@ class RemoteIpAddr(PluginBase):
         alert.attributes.update(ip=remote_addr)
         return alert
 
+    @stub
     def post_receive(self, alert, **kwargs):
         return
 
+    @stub
     def status_change(self, alert, status, text, **kwargs):
         return
 
+    @stub
     def take_action(self, alert, action, text, **kwargs):
         raise NotImplementedError
 
+    @stub
     def delete(self, alert, **kwargs) -> bool:
         raise NotImplementedError
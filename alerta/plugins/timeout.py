@@ -1,8 +1,8 @@
 import logging
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, Optional, Tuple
 
 from alerta.models.enums import ChangeType
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
 
 if TYPE_CHECKING:
     from alerta.models.alert import Alert  # noqa
@@ -15,20 +15,31 @@ class TimeoutPolicy(PluginBase):
     Override user-defined ack and shelve timeout values with server defaults.
     """
 
+    @stub
     def pre_receive(self, alert: 'Alert', **kwargs) -> 'Alert':
         return alert
 
+    @stub
     def post_receive(self, alert: 'Alert', **kwargs) -> Optional['Alert']:
         return None
 
+    @stub
     def status_change(self, alert: 'Alert', status: str, text: str, **kwargs) -> Any:
         return
 
+    def server_timeouts(self) -> Tuple[Any, Any]:
+        # server timeouts are only read from the environment, not the config passed to hooks
+        return (
+            self.get_config('ACK_TIMEOUT'),
+            self.get_config('SHELVE_TIMEOUT')
+        )
+
     def take_action(self, alert: 'Alert', action: str, text: str, **kwargs) -> Any:
 
+        ack_timeout, shelve_timeout = self.cached_config(['ACK_TIMEOUT', 'SHELVE_TIMEOUT'], self.server_timeouts)
+
         timeout = kwargs['timeout']
         if action == ChangeType.ack:
-            ack_timeout = self.get_config('ACK_TIMEOUT')
             if timeout != ack_timeout:
                 LOG.warning('Override user-defined ack timeout of {} seconds to {} seconds.'.format(
                     timeout, ack_timeout
@@ -37,7 +48,6 @@ class TimeoutPolicy(PluginBase):
                 text += ' (using server timeout value)'
 
         if action == ChangeType.shelve:
-            shelve_timeout = self.get_config('SHELVE_TIMEOUT')
             if timeout != shelve_timeout:
                 LOG.warning('Override user-defined shelve timeout of {} seconds to {} seconds.'.format(
                     timeout, shelve_timeout
@@ -47,8 +57,10 @@ class TimeoutPolicy(PluginBase):
 
         return alert, action, text, timeout
 
+    @stub
     def take_note(self, alert: 'Alert', text: Optional[str], **kwargs) -> Any:
         raise NotImplementedError
 
+    @stub
     def delete(self, alert: 'Alert', **kwargs) -> bool:
         raise NotImplementedError
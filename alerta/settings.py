@@ -31,6 +31,10 @@ QUERY_LIMIT = 50
 DEFAULT_PAGE_SIZE = QUERY_LIMIT  # maximum number of alerts returned by a single query
 HISTORY_LIMIT = 100  # cap the number of alert history entries
 HISTORY_ON_VALUE_CHANGE = True  # history entry for duplicate alerts if value changes
+HISTORY_TABLE = False  # store alert history in a separate table instead of an array (Postgres only)
+HISTORY_MAX_AGE = 0  # delete history entries older than x seconds (0 = do not delete, HISTORY_TABLE only)
+INGEST_SINGLE_LOOKUP = False  # find duplicate or correlated alert and its history in one query (Postgres only)
+ALERT_SUMMARY = False  # count alerts by customer, environment, service, severity and status in a summary table (Postgres only)
 
 # MongoDB (deprecated, use DATABASE_URL setting)
 MONGO_URI = 'mongodb://localhost:27017/monitoring'
@@ -47,6 +51,25 @@ DATABASE_NAME = MONGO_DATABASE or POSTGRES_DB
 DATABASE_RAISE_ON_ERROR = MONGO_RAISE_ON_ERROR  # True - terminate, False - ignore and continue
 DATABASE_SCHEMA = 'public'  # default: None to use default schema
 
+# Database connection pool (per worker process)
+DATABASE_POOL_MIN_SIZE = 1
+DATABASE_POOL_MAX_SIZE = 10  # 0 = do not pool connections (connect per request)
+DATABASE_POOL_TIMEOUT = 30  # seconds to wait for a free connection
+DATABASE_POOL_MAX_AGE = 3600  # seconds before a connection is recycled (0 = never, Postgres only)
+DATABASE_POOL_CHECK_AFTER = 60  # seconds idle before a connection is health checked on checkout (Postgres only)
+
+# Database client (MongoDB only)
+DATABASE_CONNECT_TIMEOUT = 20  # seconds to wait for a new connection
+DATABASE_SERVER_SELECTION_TIMEOUT = 30  # seconds to wait for a suitable server
+DATABASE_SOCKET_TIMEOUT = 0  # seconds to wait for a response (0 = no timeout)
+DATABASE_READ_PREFERENCE = 'primary'  # primary, primaryPreferred, secondary, secondaryPreferred or nearest
+DATABASE_WRITE_CONCERN = {}  # type: Dict[str, Any]  # eg. {'w': 'majority', 'wTimeoutMS': 5000}
+
+# Database query tracing (Postgres only)
+DATABASE_TRACE_QUERIES = False  # log duration, row count and statement of every query at INFO level
+DATABASE_SLOW_QUERY_THRESHOLD = 0  # log queries slower than this at WARNING level in milliseconds (0 = disabled)
+DATABASE_TRACE_STATEMENT_LENGTH = 500  # truncate traced statements to this number of characters
+
 # Search
 DEFAULT_FIELD = 'text'  # default field if no search prefix specified (Postgres only)
 
@@ -58,6 +81,10 @@ CELERY_ACCEPT_CONTENT = ['customjson']
 CELERY_TASK_SERIALIZER = 'customjson'
 CELERY_RESULT_SERIALIZER = 'customjson'
 
+# Metrics
+METRICS_FLUSH_INTERVAL = 0  # seconds to buffer counter and timer updates in memory before writing them (0 = write immediately)
+METRICS_TIMER_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]  # timer histogram bucket bounds in milliseconds
+
 # Authentication settings
 AUTH_REQUIRED = False
 AUTH_PROVIDER = 'basic'  # basic (default), ldap, github, openid, saml2, azure, cognito, gitlab, google, keycloak, cas
@@ -95,6 +122,8 @@ AUTH_PROXY_ROLES_HEADER = 'X-Proxy-Roles'  # list of authenticated role names (X
 AUTH_PROXY_ROLES_SEPARATOR = ','  # default comma-separated list (,;|)
 AUTH_PROXY_AUTO_SIGNUP = True
 
+AUTH_CACHE_TTL = 0  # seconds to cache resolved scopes, customers and password checks (0 = look up for every request)
+
 OAUTH2_CLIENT_ID = ''  # OAuth2 client ID and secret
 OAUTH2_CLIENT_SECRET = ''
 ALLOWED_EMAIL_DOMAINS = ['*']
@@ -173,6 +202,9 @@ CAS_RESPONSE_TYPE = 'AUTO'  # AUTO, JSON, or XML
 
 TOKEN_EXPIRE_DAYS = 14
 API_KEY_EXPIRE_DAYS = 365  # 1 year
+API_KEY_CACHE_TTL = 0  # seconds to cache verified API keys in memory (0 = look up key for every request)
+API_KEY_CACHE_SIZE = 1000  # maximum number of API keys cached per process
+API_KEY_USAGE_FLUSH_INTERVAL = 0  # seconds to buffer API key usage counts in memory before writing them (0 = write immediately)
 
 # Audit Log
 AUDIT_TRAIL = ['admin']  # possible categories are 'admin', 'write', and 'auth'
@@ -180,6 +212,12 @@ AUDIT_LOG = None  # set to True to log to application logger
 AUDIT_LOG_REDACT = True  # redact sensitive data before logging
 AUDIT_LOG_JSON = False  # log alert data as JSON object
 AUDIT_URL = None  # send audit log events via webhook URL
+AUDIT_URL_FORMAT = 'json'  # 'json' (one event per request), 'array' (JSON array of events) or 'ndjson' (newline-delimited JSON)
+AUDIT_BATCH_SIZE = 100  # max events in each request if AUDIT_URL_FORMAT is 'array' or 'ndjson'
+AUDIT_QUEUE_SIZE = 10000  # max events waiting to be sent, new events are dropped when the queue is full
+AUDIT_TIMEOUT = 2  # seconds
+AUDIT_RETRY_MAX_ATTEMPTS = 3  # attempts to send events before they are spilled to disk or dropped
+AUDIT_SPILL_DIR = None  # directory to keep events that could not be sent until AUDIT_URL is back up eg. '/var/spool/alerta'
 
 # CORS settings
 CORS_ALLOW_HEADERS = ['Content-Type', 'Authorization', 'Access-Control-Allow-Origin', 'X-Request-ID']
@@ -210,6 +248,28 @@ SHELVE_TIMEOUT = 7200  # auto-unshelve alerts after x seconds (0 seconds = do no
 # Housekeeping settings
 DELETE_EXPIRED_AFTER = 2 * 60 * 60  # seconds (0 = do not delete)
 DELETE_INFO_AFTER = 12 * 60 * 60  # seconds (0 = do not delete)
+HOUSEKEEPING_INTERVAL = 0  # run housekeeping in the background every x seconds (0 = only run using API or CLI)
+HOUSEKEEPING_BATCH_SIZE = 500  # number of alerts to expire, unshelve and unack at a time (0 = all at once)
+HOUSEKEEPING_TIME_BUDGET = 50  # seconds before stopping, remaining alerts are processed next run (0 = no limit)
+HOUSEKEEPING_BULK = False  # expire, unshelve and unack each batch of alerts using a single update
+
+# Alert stream
+STREAM_ENABLED = False  # push alert changes to clients using server-sent events at /alerts/stream
+STREAM_INTERVAL = 1  # seconds to wait for more changes before checking them against each client's filter
+STREAM_KEEPALIVE = 15  # seconds between keep-alive comments when there are no changes
+STREAM_QUEUE_SIZE = 1000  # changes buffered for a slow client before it is told to reload alerts
+
+# Incremental alert queries
+UPDATED_SINCE_MARGIN = 5  # seconds of overlap between "updated-since" queries for changes being written
+TOMBSTONE_MAX_AGE = 24 * 60 * 60  # seconds to keep ids of deleted alerts for "updated-since" queries (0 = forever)
+
+# Conditional alert queries
+ETAG_ENABLED = False  # count changes to alerts so unchanged query results can be answered with "304 Not Modified"
+
+# Response cache
+RESPONSE_CACHE_TTL = 0  # seconds to cache environments, services, groups, tags and top 10 queries (0 = disabled)
+RESPONSE_CACHE_MAX_SIZE = 1000  # max number of responses cached by each process
+RESPONSE_CACHE_URL = None  # eg. redis://localhost:6379/0 to share cached responses between processes (requires redis)
 
 # Send verification emails to new BasicAuth users
 EMAIL_VERIFICATION = False
@@ -271,6 +331,12 @@ ROUTING_DIST = 'alerta-routing'
 # Plugins
 PLUGINS = ['remote_ip', 'reject', 'heartbeat', 'blackout', 'forwarder']
 PLUGINS_RAISE_ON_ERROR = True  # raise RuntimeError exception on first failure
+PLUGINS_ROUTING_CACHE_SIZE = 1000  # max routing results cached if routing rules define routing_key(alert)
+ASYNC_PLUGINS = []  # type: List[str]  # run post-receive and post-action hooks of these plugins in the background
+ASYNC_PLUGIN_EXECUTOR = 'threads'  # or 'celery' to run them on Celery workers (requires CELERY_BROKER_URL)
+ASYNC_PLUGIN_CONCURRENCY = 2  # max hooks of each plugin running at the same time in each process (threads only)
+ASYNC_PLUGIN_QUEUE_SIZE = 1000  # max hooks of each plugin waiting to run in each process (threads only)
+ASYNC_PLUGIN_QUEUE_FULL = 'drop'  # or 'block' to make requests wait for space in the queue (threads only)
 
 # reject plugin settings
 ORIGIN_BLACKLIST = []  # type: List[str]
@@ -282,6 +348,7 @@ BLACKOUT_DURATION = 3600  # default period = 1 hour
 NOTIFICATION_BLACKOUT = False  # True - set alert status=blackout, False - do not process alert (default)
 BLACKOUT_ACCEPT = []  # type: List[str]
 # BLACKOUT_ACCEPT = ['normal', 'ok', 'cleared']  # list of severities accepted during blackout period
+BLACKOUT_CACHE_TTL = 10  # seconds before in-memory index of blackouts is refreshed (0 = query database for every alert)
 
 # northbound interface
 FWD_DESTINATIONS = [
@@ -292,7 +359,14 @@ FWD_DESTINATIONS = [
     # ('http://localhost:9000', {'token': 'bearer-token'}, ['alerts', 'actions']),  # Bearer token
 ]  # type: List[Tuple]
 
-# valid actions=['*', 'alerts', 'actions', 'open', 'assign', 'ack', 'unack', 'shelve', 'unshelve', 'close', 'delete']
+# valid actions=['*', 'alerts', 'actions', 'open', 'assign', 'ack', 'unack', 'shelve', 'unshelve', 'close', 'delete', 'bulk']
+
+FWD_MAX_WORKERS = 4  # max requests each process forwards to remotes at the same time
+FWD_BATCH_SIZE = 0  # max alerts in each request to remotes with 'bulk' in actions (0 = forward alerts one at a time)
+FWD_BATCH_INTERVAL = 2  # max seconds an alert waits to be forwarded in a batch
+FWD_RETRY_QUEUE = None  # path to SQLite database of failed forwards to retry eg. '/var/lib/alerta/forwarder.db' (None = do not retry)
+FWD_RETRY_INTERVAL = 30  # seconds before a failed forward is retried, doubled after each attempt
+FWD_RETRY_MAX_ATTEMPTS = 10  # give up after this many attempts
 
 # Webhooks
 DEFAULT_ENVIRONMENT = 'Production'  # default environment used by webhooks, value must be in ALLOWED_ENVIRONMENTS
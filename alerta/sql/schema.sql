@@ -62,6 +62,84 @@ CREATE TABLE IF NOT EXISTS alerts (
 ALTER TABLE alerts ADD COLUMN IF NOT EXISTS update_time timestamp without time zone;
 
 
+CREATE TABLE IF NOT EXISTS alert_history (
+    seq bigserial,
+    alert_id text NOT NULL REFERENCES alerts (id) ON DELETE CASCADE,
+    id text,
+    event text,
+    severity text,
+    status text,
+    value text,
+    text text,
+    type text,
+    update_time timestamp without time zone,
+    "user" text,
+    timeout integer
+);
+
+CREATE INDEX IF NOT EXISTS alert_history_alert_id_seq_idx ON alert_history USING btree (alert_id, seq DESC);
+CREATE INDEX IF NOT EXISTS alert_history_update_time_idx ON alert_history USING btree (update_time);
+CREATE INDEX IF NOT EXISTS alert_history_seq_idx ON alert_history USING btree (seq);
+
+CREATE TABLE IF NOT EXISTS alert_tombstones (
+    id text PRIMARY KEY,
+    customer text,
+    delete_time timestamp without time zone NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS alert_tombstones_delete_time_idx ON alert_tombstones USING btree (delete_time);
+
+CREATE TABLE IF NOT EXISTS alert_summary (
+    customer text,
+    environment text,
+    service text[],
+    severity text,
+    status text,
+    count bigint NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS alert_summary_key ON alert_summary USING btree
+    ((COALESCE(customer, '')), (COALESCE(environment, '')), (COALESCE(service, '{}')), (COALESCE(severity, '')), (COALESCE(status, '')));
+
+CREATE TABLE IF NOT EXISTS alert_changes (
+    customer text NOT NULL,
+    slot integer NOT NULL,
+    seq bigint NOT NULL,
+    PRIMARY KEY (customer, slot)
+);
+
+DO $$
+BEGIN
+    ALTER TABLE alerts ADD COLUMN previous_status text;
+    ALTER TABLE alerts ADD COLUMN previous_timeout integer;
+    ALTER TABLE alerts ADD COLUMN status_expire_time timestamp without time zone;
+    WITH hist AS (
+        SELECT alert_id, status, type, update_time, timeout,
+               row_number() OVER (PARTITION BY alert_id ORDER BY update_time DESC) AS n
+          FROM (
+            SELECT a.id AS alert_id, h.status, h.type, h.update_time, h.timeout
+              FROM alerts a, unnest(a.history) h
+             WHERE a.status IN ('ack', 'shelved')
+            UNION ALL
+            SELECT h.alert_id, h.status, h.type, h.update_time, h.timeout
+              FROM alerts a JOIN alert_history h ON h.alert_id=a.id
+             WHERE a.status IN ('ack', 'shelved')
+          ) AS x
+    )
+    UPDATE alerts a
+       SET previous_status=p.status, previous_timeout=p.timeout,
+           status_expire_time=h.update_time + INTERVAL '1 second' * NULLIF(h.timeout, 0)
+      FROM (
+        SELECT DISTINCT ON (alert_id) * FROM hist
+         WHERE (type, status) IN (('ack', 'ack'), ('shelve', 'shelved'))
+      ORDER BY alert_id, n
+      ) AS h LEFT JOIN hist p ON p.alert_id=h.alert_id AND p.n=h.n + 1
+     WHERE a.id=h.alert_id AND a.status=h.status;
+EXCEPTION
+    WHEN duplicate_column THEN RAISE NOTICE 'column "previous_status" already exists in alerts.';
+END$$;
+
+
 CREATE TABLE IF NOT EXISTS notes (
     id text PRIMARY KEY,
     text text,
@@ -146,6 +224,7 @@ CREATE TABLE IF NOT EXISTS metrics (
 );
 ALTER TABLE metrics ALTER COLUMN total_time TYPE BIGINT;
 ALTER TABLE metrics ALTER COLUMN count TYPE BIGINT;
+ALTER TABLE metrics ADD COLUMN IF NOT EXISTS buckets bigint[];
 
 
 CREATE TABLE IF NOT EXISTS perms (
@@ -193,6 +272,96 @@ CREATE TABLE IF NOT EXISTS groups (
 
 
 CREATE UNIQUE INDEX IF NOT EXISTS env_res_evt_cust_key ON alerts USING btree (environment, resource, event, (COALESCE(customer, ''::text)));
+CREATE INDEX IF NOT EXISTS alerts_status_expire_time_idx ON alerts USING btree (status_expire_time) WHERE status_expire_time IS NOT NULL;
+CREATE INDEX IF NOT EXISTS alerts_change_time_idx ON alerts USING btree (GREATEST(update_time, last_receive_time));
+
+-- notify listeners of changed alerts, if STREAM_ENABLED is set, as a JSON array of [change, id, customer]
+CREATE OR REPLACE FUNCTION notify_alerts() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    changes json[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(json_build_array('create', n.id, n.customer)) INTO changes FROM new_alerts n;
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT array_agg(json_build_array(CASE WHEN n.status IS DISTINCT FROM o.status THEN 'status' ELSE 'update' END, n.id, n.customer))
+          INTO changes
+          FROM new_alerts n JOIN old_alerts o ON o.id = n.id;
+    ELSE
+        SELECT array_agg(json_build_array('delete', o.id, o.customer)) INTO changes FROM old_alerts o;
+    END IF;
+    -- notification payloads must be less than 8000 bytes
+    FOR i IN 1..coalesce(array_length(changes, 1), 0) BY 40 LOOP
+        PERFORM pg_notify('alerts', array_to_json(changes[i:i + 39])::text);
+    END LOOP;
+    RETURN NULL;
+END
+$$;
+
+-- count changes to alerts of each customer, if ETAG_ENABLED is set, spread over slots so
+-- concurrent writers rarely wait for each other. The change sequence is the sum of slots.
+CREATE OR REPLACE FUNCTION count_alert_changes() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO alert_changes (customer, slot, seq)
+        SELECT DISTINCT coalesce(n.customer, ''), pg_backend_pid() % 16, 1 FROM new_alerts n ORDER BY 1
+        ON CONFLICT (customer, slot) DO UPDATE SET seq = alert_changes.seq + 1;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO alert_changes (customer, slot, seq)
+        SELECT DISTINCT coalesce(c.customer, ''), pg_backend_pid() % 16, 1
+          FROM (SELECT customer FROM new_alerts UNION SELECT customer FROM old_alerts) c ORDER BY 1
+        ON CONFLICT (customer, slot) DO UPDATE SET seq = alert_changes.seq + 1;
+    ELSE
+        INSERT INTO alert_changes (customer, slot, seq)
+        SELECT DISTINCT coalesce(o.customer, ''), pg_backend_pid() % 16, 1 FROM old_alerts o ORDER BY 1
+        ON CONFLICT (customer, slot) DO UPDATE SET seq = alert_changes.seq + 1;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+-- count alerts by customer, environment, service, severity and status, if ALERT_SUMMARY is set
+CREATE OR REPLACE FUNCTION summarize_alerts() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO alert_summary (customer, environment, service, severity, status, count)
+        SELECT customer, environment, service, severity, status, COUNT(*) FROM new_alerts
+      GROUP BY 1, 2, 3, 4, 5 ORDER BY 1, 2, 3, 4, 5
+        ON CONFLICT ((COALESCE(customer, '')), (COALESCE(environment, '')), (COALESCE(service, '{}')), (COALESCE(severity, '')),
+                     (COALESCE(status, '')))
+        DO UPDATE SET count = alert_summary.count + EXCLUDED.count;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- most updates don't change any counts
+        INSERT INTO alert_summary (customer, environment, service, severity, status, count)
+        SELECT customer, environment, service, severity, status, SUM(n)
+          FROM (SELECT customer, environment, service, severity, status, 1 AS n FROM new_alerts
+                 UNION ALL
+                SELECT customer, environment, service, severity, status, -1 AS n FROM old_alerts) c
+      GROUP BY 1, 2, 3, 4, 5 HAVING SUM(n) <> 0 ORDER BY 1, 2, 3, 4, 5
+        ON CONFLICT ((COALESCE(customer, '')), (COALESCE(environment, '')), (COALESCE(service, '{}')), (COALESCE(severity, '')),
+                     (COALESCE(status, '')))
+        DO UPDATE SET count = alert_summary.count + EXCLUDED.count;
+        IF FOUND THEN
+            DELETE FROM alert_summary WHERE count = 0;
+        END IF;
+    ELSE
+        INSERT INTO alert_summary (customer, environment, service, severity, status, count)
+        SELECT customer, environment, service, severity, status, -COUNT(*) FROM old_alerts
+      GROUP BY 1, 2, 3, 4, 5 ORDER BY 1, 2, 3, 4, 5
+        ON CONFLICT ((COALESCE(customer, '')), (COALESCE(environment, '')), (COALESCE(service, '{}')), (COALESCE(severity, '')),
+                     (COALESCE(status, '')))
+        DO UPDATE SET count = alert_summary.count + EXCLUDED.count;
+        DELETE FROM alert_summary WHERE count = 0;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
 
 
 CREATE UNIQUE INDEX IF NOT EXISTS org_cust_key ON heartbeats USING btree (origin, (COALESCE(customer, ''::text)));
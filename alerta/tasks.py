@@ -1,8 +1,8 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from flask import g
 
-from alerta.app import create_celery_app
+from alerta.app import create_celery_app, plugins
 from alerta.exceptions import InvalidAction, RejectException
 from alerta.models.alert import Alert
 from alerta.utils.api import process_action, process_status
@@ -44,3 +44,15 @@ def action_alerts(alerts: List[str], action: str, text: str, timeout: Optional[i
                 continue
 
         updated.append(alert.id)
+
+
+@celery.task
+def run_plugin(name: str, hook: str, alert_id: str, args: List[Any], kwargs: Dict[str, Any], with_config: bool) -> None:
+    alert = Alert.find_by_id(alert_id)
+    plugin = plugins.plugins.get(name)
+    if not alert or not plugin:
+        return
+
+    if with_config:
+        _, kwargs['config'] = plugins.routing(alert)
+    getattr(plugin, hook)(alert, *args, **kwargs)
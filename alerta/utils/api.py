@@ -1,10 +1,9 @@
-import inspect
 import logging
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 from flask import current_app, g
 
-from alerta.app import plugins
+from alerta.app import plugin_executor, plugins
 from alerta.exceptions import (AlertaException, ApiError, BlackoutPeriod,
                                ForwardingLoop, HeartbeatReceived,
                                InvalidAction, RateLimit, RejectException)
@@ -12,17 +11,6 @@ from alerta.models.alert import Alert
 from alerta.models.enums import Scope
 
 
-def _accepts_config(method) -> bool:
-    try:
-        sig = inspect.signature(method)
-        params = sig.parameters
-        return 'config' in params or any(
-            p.kind == inspect.Parameter.VAR_KEYWORD for p in params.values()
-        )
-    except (ValueError, TypeError):
-        return False
-
-
 def assign_customer(wanted: str = None, permission: str = Scope.admin_alerts) -> Optional[str]:
     customers = g.get('customers', [])
     if wanted:
@@ -42,6 +30,40 @@ def assign_customer(wanted: str = None, permission: str = Scope.admin_alerts) ->
 
 def process_alert(alert: Alert) -> Alert:
 
+    alert, skip_plugins = pre_receive_alert(alert)
+
+    try:
+        if current_app.config['INGEST_SINGLE_LOOKUP']:
+            alert = alert.ingest()
+        else:
+            is_duplicate = alert.is_duplicate()
+            if is_duplicate:
+                alert = alert.deduplicate(is_duplicate)
+            else:
+                is_correlated = alert.is_correlated()
+                if is_correlated:
+                    alert = alert.update(is_correlated)
+                else:
+                    alert = alert.create()
+    except Exception as e:
+        raise ApiError(str(e))
+
+    return post_receive_alert(alert, skip_plugins)
+
+
+def process_alerts(alerts: List[Alert]) -> List[Alert]:
+    """
+    De-duplicate, correlate or create alerts that have already been through the
+    pre-receive plugins. Post-receive plugins must be run by the caller.
+    """
+    try:
+        return Alert.ingest_many(alerts)
+    except Exception as e:
+        raise ApiError(str(e))
+
+
+def pre_receive_alert(alert: Alert) -> Tuple[Alert, bool]:
+
     wanted_plugins, wanted_config = plugins.routing(alert)
 
     skip_plugins = False
@@ -49,8 +71,11 @@ def process_alert(alert: Alert) -> Alert:
         if alert.is_suppressed:
             skip_plugins = True
             break
+        accepts_config = plugins.hooks_of(plugin).get('pre_receive')
+        if accepts_config is None:
+            continue
         try:
-            if _accepts_config(plugin.pre_receive):
+            if accepts_config:
                 alert = plugin.pre_receive(alert, config=wanted_config)
             else:
                 alert = plugin.pre_receive(alert)
@@ -64,27 +89,23 @@ def process_alert(alert: Alert) -> Alert:
         if not alert:
             raise SyntaxError(f"Plugin '{plugin.name}' pre-receive hook did not return modified alert")
 
-    try:
-        is_duplicate = alert.is_duplicate()
-        if is_duplicate:
-            alert = alert.deduplicate(is_duplicate)
-        else:
-            is_correlated = alert.is_correlated()
-            if is_correlated:
-                alert = alert.update(is_correlated)
-            else:
-                alert = alert.create()
-    except Exception as e:
-        raise ApiError(str(e))
+    return alert, skip_plugins
+
+
+def post_receive_alert(alert: Alert, skip_plugins: bool = False) -> Alert:
 
     wanted_plugins, wanted_config = plugins.routing(alert)
 
     alert_was_updated: bool = False
-    for plugin in wanted_plugins:
+    deferred = []
+    for plugin, accepts_config in plugins.dispatch('post_receive', wanted_plugins):
         if skip_plugins:
             break
+        if plugin_executor.is_async(plugin):
+            deferred.append((plugin, accepts_config))
+            continue
         try:
-            if _accepts_config(plugin.post_receive):
+            if accepts_config:
                 updated = plugin.post_receive(alert, config=wanted_config)
             else:
                 updated = plugin.post_receive(alert)
@@ -103,18 +124,37 @@ def process_alert(alert: Alert) -> Alert:
         alert.update_tags(alert.tags)
         alert.attributes = alert.update_attributes(alert.attributes)
 
+    for plugin, accepts_config in deferred:
+        if accepts_config:
+            plugin_executor.submit(plugin, 'post_receive', alert, config=wanted_config)
+        else:
+            plugin_executor.submit(plugin, 'post_receive', alert)
+
     return alert
 
 
-def process_action(alert: Alert, action: str, text: str, timeout: int = None, post_action: bool = False) -> Tuple[Alert, str, str, Optional[int]]:
+def has_action_plugins(alert: Alert, post_action: bool = False) -> bool:
+    """
+    Return True if the alert is routed to any plugin that implements take_action(), or post_action().
+    """
+    hook = 'post_action' if post_action else 'take_action'
+    wanted_plugins, _ = plugins.routing(alert)
+    return any(plugins.dispatch(hook, wanted_plugins))
+
+
+def process_action(alert: Alert, action: str, text: str, timeout: Optional[int] = None, post_action: bool = False) -> Tuple[Alert, str, str, Optional[int]]:
 
     wanted_plugins, wanted_config = plugins.routing(alert)
 
     updated = None
     alert_was_updated = False
-    for plugin in wanted_plugins:
+    deferred = []
+    for plugin, _ in plugins.dispatch('post_action' if post_action else 'take_action', wanted_plugins):
         if alert.is_suppressed:
             break
+        if post_action and plugin_executor.is_async(plugin):
+            deferred.append(plugin)
+            continue
         try:
             if post_action:
                 updated = plugin.post_action(alert, action, text, timeout=timeout, config=wanted_config)
@@ -144,6 +184,9 @@ def process_action(alert: Alert, action: str, text: str, timeout: int = None, po
         alert.update_tags(alert.tags)
         alert.attributes = alert.update_attributes(alert.attributes)
 
+    for plugin in deferred:
+        plugin_executor.submit(plugin, 'post_action', alert, action, text, timeout=timeout, config=wanted_config)
+
     return alert, action, text, timeout
 
 
@@ -153,7 +196,7 @@ def process_note(alert: Alert, text: str) -> Tuple[Alert, str]:
 
     updated = None
     alert_was_updated = False
-    for plugin in wanted_plugins:
+    for plugin, _ in plugins.dispatch('take_note', wanted_plugins):
         try:
             updated = plugin.take_note(alert, text, config=wanted_config)
         except NotImplementedError:
@@ -186,11 +229,11 @@ def process_status(alert: Alert, status: str, text: str) -> Tuple[Alert, str, st
 
     updated = None
     alert_was_updated = False
-    for plugin in wanted_plugins:
+    for plugin, accepts_config in plugins.dispatch('status_change', wanted_plugins):
         if alert.is_suppressed:
             break
         try:
-            if _accepts_config(plugin.status_change):
+            if accepts_config:
                 updated = plugin.status_change(alert, status, text, config=wanted_config)
             else:
                 updated = plugin.status_change(alert, status, text)
@@ -220,7 +263,7 @@ def process_delete(alert: Alert) -> bool:
     wanted_plugins, wanted_config = plugins.routing(alert)
 
     delete = True
-    for plugin in wanted_plugins:
+    for plugin, _ in plugins.dispatch('delete', wanted_plugins):
         try:
             delete = delete and plugin.delete(alert, config=wanted_config)
         except NotImplementedError:
@@ -1,7 +1,13 @@
+import atexit
+import glob
 import json
+import os
+import queue
+import threading
+import time
 import uuid
 from datetime import datetime
-from typing import Any, List
+from typing import Any, Dict, List, Optional
 
 import blinker
 import requests
@@ -16,16 +22,172 @@ write_audit_trail = audit_signals.signal('write')
 read_audit_trail = audit_signals.signal('read')  # not used
 auth_audit_trail = audit_signals.signal('auth')
 
+# seconds to wait before the first retry, doubled after each failed attempt
+RETRY_BACKOFF = 0.5
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'array': 'application/json',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+class AuditShipper:
+    """
+    Send audit events to AUDIT_URL from a background thread so that requests never wait
+    on the collector. Events are queued, up to AUDIT_QUEUE_SIZE, and sent over a pooled
+    session either one per request or in batches as a JSON array or newline-delimited
+    JSON. Events that still fail after retries are written to AUDIT_SPILL_DIR, if set,
+    and sent again once the collector is back up. Otherwise they are dropped. At exit,
+    queued events are sent for up to AUDIT_TIMEOUT seconds and the rest are spilled.
+    """
+
+    def __init__(self, app: Flask) -> None:
+        self.app = app
+        self.url = app.config['AUDIT_URL']
+        self.format = app.config['AUDIT_URL_FORMAT']
+        self.batch_size = app.config['AUDIT_BATCH_SIZE'] if self.format != 'json' else 1
+        self.spill_dir = app.config['AUDIT_SPILL_DIR']
+
+        self.lock = threading.Lock()
+        self.pid: Optional[int] = None
+        self.queue = queue.Queue()  # type: queue.Queue
+        self.session = requests.Session()
+        self.stats: Dict[str, int] = dict()
+        atexit.register(self._drain_at_exit)
+
+    def put(self, event: str) -> None:
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    # threads and connections don't survive a fork so each worker process has its own
+                    self.queue = queue.Queue(self.app.config['AUDIT_QUEUE_SIZE'])
+                    self.session = requests.Session()
+                    self.stats = dict()
+                    threading.Thread(target=self._run, args=(self.queue,), name='audit', daemon=True).start()
+                    self.pid = os.getpid()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.app.logger.warning(f'Audit queue is full, event not sent to "{self.url}"')
+            self._count('dropped')
+
+    def _run(self, q: queue.Queue) -> None:
+        while True:
+            events = [q.get()]
+            while len(events) < self.batch_size:
+                try:
+                    events.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._ship(events)
+            except Exception as e:
+                self.app.logger.error(f'Failed to ship audit events - {str(e)}')
+            finally:
+                for _ in events:
+                    q.task_done()
+
+    def _ship(self, events: List[str]) -> None:
+        if self._send(events):
+            self._count('sent', len(events))
+            if self.spill_dir:
+                self._resend_spilled()
+        elif self.spill_dir:
+            self._spill(events)
+            self._count('spilled', len(events))
+        else:
+            self._count('dropped', len(events))
+
+    def _send(self, events: List[str]) -> bool:
+        if self.format == 'array':
+            body = '[' + ','.join(events) + ']'
+        else:
+            body = '\n'.join(events) + ('\n' if self.format == 'ndjson' else '')
+        headers = {'Content-Type': CONTENT_TYPES[self.format]}
+
+        attempts = self.app.config['AUDIT_RETRY_MAX_ATTEMPTS']
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            try:
+                r = self.session.post(self.url, data=body, headers=headers, timeout=self.app.config['AUDIT_TIMEOUT'])
+                r.raise_for_status()
+                return True
+            except Exception as e:
+                self.app.logger.warning(f'Failed to send audit log entry to "{self.url}" (attempt {attempt + 1}/{attempts}) - {str(e)}')
+        return False
+
+    def _spill(self, events: List[str]) -> None:
+        path = os.path.join(self.spill_dir, f'audit-{os.getpid()}.ndjson')
+        with open(path, 'a') as f:
+            f.writelines(event + '\n' for event in events)
+
+    def _resend_spilled(self) -> None:
+        for path in glob.glob(os.path.join(self.spill_dir, 'audit-*.ndjson')):
+            # claim the file so that other processes don't send the same events
+            claimed = f'{path}.{os.getpid()}'
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed) as f:
+                events = [line.rstrip('\n') for line in f if line.strip()]
+            os.remove(claimed)
+
+            for i in range(0, len(events), self.batch_size):
+                batch = events[i:i + self.batch_size]
+                if not self._send(batch):
+                    self._spill(events[i:])
+                    return
+                self._count('sent', len(batch))
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[stat] = self.stats.get(stat, 0) + n
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def join(self) -> None:
+        """Wait until all queued events have been sent, spilled or dropped."""
+        self.queue.join()
+
+    def _drain_at_exit(self) -> None:
+        # events queued by the parent process are not sent by a forked process
+        if self.pid != os.getpid():
+            return
+        q = self.queue
+        with q.all_tasks_done:
+            q.all_tasks_done.wait_for(lambda: not q.unfinished_tasks, timeout=self.app.config['AUDIT_TIMEOUT'])
+        events = list()
+        while True:
+            try:
+                events.append(q.get_nowait())
+            except queue.Empty:
+                break
+        if not events:
+            return
+        if self.spill_dir:
+            self._spill(events)
+            self._count('spilled', len(events))
+        else:
+            self.app.logger.warning(f'Audit events not sent to "{self.url}" at exit: {len(events)}')
+            self._count('dropped', len(events))
+
 
 class AuditTrail:
 
     def __init__(self, app: Flask = None) -> None:
         self.app = app
+        self.shipper: Optional[AuditShipper] = None
         if app is not None:
             self.init_app(app)
 
     def init_app(self, app: Flask) -> None:
         self.audit_url = app.config['AUDIT_URL']
+        self.shipper = AuditShipper(app) if self.audit_url else None
 
         if 'admin' in app.config['AUDIT_TRAIL']:
             if app.config['AUDIT_LOG']:
@@ -53,10 +215,8 @@ class AuditTrail:
     def _webhook_response(self, app: Flask, category: str, event: str, message: str, user: str, customers: List[str],
                           scopes: List[str], resource_id: str, type: str, request: Any, **extra: Any) -> None:
         payload = self._fmt(app, category, event, message, user, customers, scopes, resource_id, type, request, **extra)
-        try:
-            requests.post(self.audit_url, data=payload, timeout=2)
-        except Exception as e:
-            app.logger.warning(f'Failed to send audit log entry to "{self.audit_url}" - {str(e)}')
+        if self.shipper is not None:
+            self.shipper.put(payload)
 
     def admin_log_response(self, app: Flask, **kwargs):
         self._log_response(app, 'admin', **kwargs)
@@ -113,6 +273,6 @@ class AuditTrail:
                 'data': get_redacted_data(request),
                 'remoteIp': request.remote_addr,
                 'userAgent': request.headers.get('User-Agent')
-            },
+            } if request is not None else None,
             'extra': extra
         }, cls=CustomJSONEncoder)
@@ -0,0 +1,68 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from flask import Flask
+
+# expired entries are only removed once the cache reaches this size
+MAX_ENTRIES = 10000
+
+
+class AuthCache:
+    """
+    Short-lived in-memory cache of scopes and customers resolved for a login
+    and its roles or groups, and of successful password checks, so that
+    clients polling with Basic auth or through an auth proxy don't need a
+    database lookup and a password hash check on every request.
+
+    Cached scopes and customers are discarded when permissions or customer
+    lookups are created, updated or deleted by this process and after at most
+    AUTH_CACHE_TTL seconds. Set AUTH_CACHE_TTL to 0 to disable it.
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.ttl = 0
+        self.lock = threading.Lock()
+        self.salt = os.urandom(16)  # passwords are only kept as salted digests
+        self.cache: Dict[Hashable, Tuple[Any, float]] = dict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.ttl = app.config['AUTH_CACHE_TTL']
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.cache = dict()
+
+    def get_or_set(self, key: Hashable, lookup: Callable[[], Any]) -> Any:
+        if not self.ttl:
+            return lookup()
+        now = time.monotonic()
+        entry = self.cache.get(key)
+        if entry and now < entry[1]:
+            return entry[0]
+        value = lookup()
+        with self.lock:
+            if len(self.cache) >= MAX_ENTRIES:
+                self.cache = {k: v for k, v in self.cache.items() if now < v[1]}
+            self.cache[key] = (value, now + self.ttl)
+        return value
+
+    def check_password(self, user, password: str) -> bool:
+        if not self.ttl:
+            return user.verify_password(password)
+        # a changed password hash or id gives a different key
+        digest = hmac.new(self.salt, f'{user.id}:{user.password}:{password}'.encode('utf-8'), hashlib.sha256).digest()
+        key = ('password', digest)
+        entry = self.cache.get(key)
+        if entry and time.monotonic() < entry[1]:
+            return True
+        if not user.verify_password(password):
+            return False
+        self.get_or_set(key, lambda: True)
+        return True
@@ -0,0 +1,84 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import Flask, current_app
+
+# blackouts that ended recently are kept in the index so that alerts with
+# a create time slightly in the past can still be matched without a query
+EXPIRED_GRACE_PERIOD = 3600
+
+
+class BlackoutIndex:
+    """
+    In-memory index of blackout periods, by environment and then resource, used
+    to match received alerts without a database query.
+
+    The index is rebuilt after blackouts are created, updated or deleted by this
+    process and at least every BLACKOUT_CACHE_TTL seconds to pick up changes
+    made by other processes. Set BLACKOUT_CACHE_TTL to 0 to disable it.
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.ttl = 0
+        self.lock = threading.Lock()
+        self._state = None  # (index, since, expires)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.ttl = app.config['BLACKOUT_CACHE_TTL']
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        self._state = None
+
+    def _load(self):
+        from alerta.app import db
+        from alerta.models.blackout import Blackout
+
+        since = datetime.utcnow() - timedelta(seconds=EXPIRED_GRACE_PERIOD)
+        index = dict()
+        for blackout in [Blackout.from_db(b) for b in db.get_blackouts_ending_after(since)]:
+            index.setdefault(blackout.environment, dict()).setdefault(blackout.resource, []).append(blackout)
+        return index, since, time.monotonic() + self.ttl
+
+    def _get_state(self):
+        state = self._state
+        if state is None or time.monotonic() >= state[2]:
+            with self.lock:
+                state = self._state
+                if state is None or time.monotonic() >= state[2]:
+                    state = self._state = self._load()
+        return state
+
+    @staticmethod
+    def _matches(blackout, alert) -> bool:
+        return (
+            blackout.start_time <= alert.create_time < blackout.end_time
+            and (not blackout.service or set(blackout.service).issubset(alert.service))
+            and (blackout.event is None or blackout.event == alert.event)
+            and (blackout.group is None or blackout.group == alert.group)
+            and (not blackout.tags or set(blackout.tags).issubset(alert.tags))
+            and (blackout.origin is None or blackout.origin == alert.origin)
+            and (not current_app.config['CUSTOMER_VIEWS'] or blackout.customer is None or blackout.customer == alert.customer)
+        )
+
+    def is_blackout_period(self, alert) -> bool:
+        from alerta.app import db
+
+        if not self.ttl:
+            return db.is_blackout_period(alert)
+
+        index, since, _ = self._get_state()
+        if alert.create_time < since:
+            return db.is_blackout_period(alert)
+
+        by_resource = index.get(alert.environment)
+        if not by_resource:
+            return False
+        for blackout in by_resource.get(None, []) + by_resource.get(alert.resource, []):
+            if self._matches(blackout, alert):
+                return True
+        return False
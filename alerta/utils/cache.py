@@ -0,0 +1,151 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import Flask
+
+LOG = logging.getLogger('alerta.cache')
+
+# seconds a request waits for an identical request in progress before querying itself
+COALESCE_TIMEOUT = 30
+
+
+class MemoryStore:
+    """Least recently used responses of this process, each kept for at most ttl seconds."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            if time.monotonic() >= entry[1]:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisStore:
+    """Responses shared by all processes and nodes using Redis, which expires them."""
+
+    def __init__(self, url: str) -> None:
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('Must install redis to use a shared response cache')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = 'alerta:response:'
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.client.get(self.prefix + key)
+        except Exception as e:
+            LOG.warning('Failed to read response cache: %s', e)
+            return None
+        return json.loads(value) if value else None
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+        except Exception as e:
+            LOG.warning('Failed to write response cache: %s', e)
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """
+    Cache responses of expensive alert aggregate queries, like environments, services
+    and top 10 lists, for RESPONSE_CACHE_TTL seconds so that many clients polling the
+    same query cause only one database query. Responses are kept by each process, or
+    shared using RESPONSE_CACHE_URL, and identical requests that arrive while the query
+    is in progress wait for its response instead of repeating it.
+
+    Set RESPONSE_CACHE_TTL to 0 to disable it.
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.ttl = 0
+        self.store = None  # type: Any
+        self.lock = threading.Lock()
+        self.in_progress: Dict[str, threading.Event] = dict()
+        self.counters: Dict[str, Any] = dict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        from alerta.models.metrics import Counter
+
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        if app.config['RESPONSE_CACHE_URL']:
+            self.store = RedisStore(app.config['RESPONSE_CACHE_URL'])
+        else:
+            self.store = MemoryStore(app.config['RESPONSE_CACHE_MAX_SIZE'])
+        self.in_progress = dict()
+        self.counters = {
+            'hit': Counter('cache', 'hits', 'Response cache hits', 'Total number of queries answered from the response cache'),
+            'miss': Counter('cache', 'misses', 'Response cache misses', 'Total number of queries not found in the response cache'),
+            'coalesced': Counter('cache', 'coalesced', 'Coalesced queries',
+                                 'Total number of queries answered by an identical query in progress')
+        }
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def get_or_set(self, key: str, lookup: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """
+        Return the cached value for the key, or look it up and cache it unless it is None.
+        """
+        value = self.store.get(key)
+        if value is not None:
+            self.counters['hit'].inc()
+            return value
+
+        with self.lock:
+            event = self.in_progress.get(key)
+            if not event:
+                event = self.in_progress[key] = threading.Event()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            if event.wait(timeout=COALESCE_TIMEOUT):
+                value = self.store.get(key)
+                if value is not None:
+                    self.counters['coalesced'].inc()
+                    return value
+            self.counters['miss'].inc()
+            return lookup()
+
+        try:
+            self.counters['miss'].inc()
+            value = lookup()
+            if value is not None:
+                self.store.set(key, value, self.ttl)
+            return value
+        finally:
+            with self.lock:
+                del self.in_progress[key]
+            event.set()
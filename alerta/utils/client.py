@@ -25,8 +25,9 @@ class Client:
         key = key or os.environ.get('ALERTA_API_KEY', '')
         self.http = HTTPClient(self.endpoint, key, secret, token, username, password, timeout, ssl_verify, headers, debug)
 
-    def send_alert(self, resource, event, **kwargs):
-        data = {
+    @staticmethod
+    def alert_data(resource, event, **kwargs):
+        return {
             'id': kwargs.get('id'),
             'resource': resource,
             'event': event,
@@ -46,7 +47,12 @@ class Client:
             'rawData': kwargs.get('raw_data'),
             'customer': kwargs.get('customer')
         }
-        return self.http.post('/alert', data)
+
+    def send_alert(self, resource, event, **kwargs):
+        return self.http.post('/alert', self.alert_data(resource, event, **kwargs))
+
+    def send_alerts(self, alerts):
+        return self.http.post('/alerts/_bulk', [self.alert_data(**alert) for alert in alerts])
 
     def action(self, id, action, text='', timeout=None):
         data = {
@@ -153,6 +159,16 @@ class HTTPClient:
             raise
         return response
 
+    def request(self, method, path, data=None, headers=None):
+        """
+        Send a request with extra headers, and a new request id, so that one client can be
+        shared by many threads.
+        """
+        url = self.endpoint + path
+        headers = {**self.headers, 'X-Request-ID': str(uuid.uuid4()), **(headers or {})}
+        body = json.dumps(data, cls=CustomJsonEncoder) if data is not None else None
+        return self.session.request(method, url, data=body, headers=headers, auth=self.auth, timeout=self.timeout)
+
 
 class CustomJsonEncoder(json.JSONEncoder):
     def default(self, o):  # pylint: disable=method-hidden
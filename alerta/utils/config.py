@@ -39,6 +39,13 @@ class Config:
         config['DATABASE_URL'] = get_config('DATABASE_URL', default=database_url, type=str, config=config)
         config['DATABASE_NAME'] = get_config('DATABASE_NAME', default=None, type=str, config=config)
         config['DATABASE_SCHEMA'] = get_config('DATABASE_SCHEMA', default='public', type=str, config=config)
+        config['DATABASE_POOL_MIN_SIZE'] = get_config('DATABASE_POOL_MIN_SIZE', default=1, type=int, config=config)
+        config['DATABASE_POOL_MAX_SIZE'] = get_config('DATABASE_POOL_MAX_SIZE', default=10, type=int, config=config)
+        config['DATABASE_POOL_TIMEOUT'] = get_config('DATABASE_POOL_TIMEOUT', default=30, type=int, config=config)
+        config['DATABASE_POOL_MAX_AGE'] = get_config('DATABASE_POOL_MAX_AGE', default=3600, type=int, config=config)
+        config['DATABASE_POOL_CHECK_AFTER'] = get_config('DATABASE_POOL_CHECK_AFTER', default=60, type=int, config=config)
+        config['DATABASE_TRACE_QUERIES'] = get_config('DATABASE_TRACE_QUERIES', default=False, type=bool, config=config)
+        config['DATABASE_SLOW_QUERY_THRESHOLD'] = get_config('DATABASE_SLOW_QUERY_THRESHOLD', default=0, type=int, config=config)
 
         config['AUTH_REQUIRED'] = get_config('AUTH_REQUIRED', default=None, type=bool, config=config)
         config['AUTH_PROVIDER'] = get_config('AUTH_PROVIDER', default=None, type=str, config=config)
@@ -32,7 +32,7 @@ class HookTrigger:
         # not used
         pass
 
-    def process_status_change(self, alert, status, text):
+    def process_status_change(self, alert, status, text, persist=True):
         from alerta.utils.api import process_status
         try:
             alert, status, text = process_status(alert, status, text)
@@ -41,8 +41,9 @@ class HookTrigger:
         except Exception as e:
             raise ApiError(str(e), 500)
 
-        alert.tag(alert.tags)
-        alert.attributes = alert.update_attributes(alert.attributes)
+        if persist:
+            alert.tag(alert.tags)
+            alert.attributes = alert.update_attributes(alert.attributes)
 
         return alert, status, text
 
@@ -0,0 +1,167 @@
+import logging
+import time
+from typing import List, Optional, Set, Tuple  # noqa
+
+from flask import current_app, g, has_request_context, request
+
+from alerta.app import db
+from alerta.exceptions import RejectException
+from alerta.models.alert import Alert
+from alerta.models.metrics import Counter, Timer
+from alerta.utils.api import has_action_plugins, process_action
+from alerta.utils.audit import write_audit_trail
+
+LOG = logging.getLogger('alerta.housekeeping')
+
+LOCK_NAME = 'housekeeping'
+
+run_timer = Timer('housekeeping', 'runs', 'Housekeeping runs', 'Total time and number of housekeeping runs')
+expired_counter = Counter('housekeeping', 'expired', 'Expired alerts', 'Total number of alerts expired by housekeeping')
+unshelved_counter = Counter('housekeeping', 'unshelved', 'Unshelved alerts', 'Total number of alerts unshelved by housekeeping')
+unacked_counter = Counter('housekeeping', 'unacked', "Unack'ed alerts", "Total number of alerts unack'ed by housekeeping")
+incomplete_counter = Counter('housekeeping', 'incomplete', 'Incomplete housekeeping runs',
+                             'Total number of housekeeping runs stopped by the time budget')
+
+
+def _audit(event: str, alert: Alert, text: str) -> None:
+    # housekeeping is also run by the scheduler outside of a request
+    write_audit_trail.send(current_app._get_current_object(), event=event, message=text, user=g.login, customers=g.customers,  # type: ignore
+                           scopes=g.scopes, resource_id=alert.id, type='alert', request=request if has_request_context() else None)
+
+
+def _timeout_alert(alert: Alert, action: str) -> Optional[str]:
+    """
+    Expire or time out an alert, running action plugins before and after, and
+    return an error message if it was rejected by a plugin.
+    """
+    if action == 'expired':
+        event, rejected_event = 'alert-expired', 'alert-expire-rejected'
+    else:
+        event, rejected_event = 'alert-timeout', 'alert-timeout-rejected'
+    try:
+        # pre action
+        alert, _, text, timeout = process_action(alert, action=action, text='', timeout=None)
+        # update status
+        alert = alert.from_expired(text, timeout) if action == 'expired' else alert.from_timeout(text, timeout)
+        # post action
+        alert, _, text, timeout = process_action(alert, action=action, text=text, timeout=timeout, post_action=True)
+    except RejectException as e:
+        _audit(rejected_event, alert, alert.text)
+        return str(e)
+
+    _audit(event, alert, text)
+    return None
+
+
+def _timeout_alerts(todo: List[Tuple[str, Alert, List[Alert]]], errors: List[str]) -> int:
+    """
+    Expire or time out a batch of alerts using a single update, running action plugins before
+    and after only for alerts routed to plugins that implement them. Add each alert to its list
+    of processed alerts, or its error if rejected by a plugin, and return the number processed.
+    """
+
+    actions = []
+    processed_by_id = {}
+    for action, alert, processed in todo:
+        text, timeout = '', None
+        try:
+            if has_action_plugins(alert):
+                alert, action, text, timeout = process_action(alert, action=action, text=text, timeout=timeout)
+        except RejectException as e:
+            _audit('alert-expire-rejected' if action == 'expired' else 'alert-timeout-rejected', alert, alert.text)
+            errors.append(str(e))
+            continue
+        actions.append((alert, action, text, timeout))
+        processed_by_id[alert.id] = processed
+
+    # alerts that changed status since they were found are skipped
+    changed = {alert.id: alert for alert in Alert.from_actions(actions)}
+
+    done = 0
+    for alert, action, text, timeout in actions:
+        if alert.id not in changed:
+            continue
+        alert = changed[alert.id]
+        try:
+            if has_action_plugins(alert, post_action=True):
+                alert, _, text, timeout = process_action(alert, action=action, text=text, timeout=timeout, post_action=True)
+        except RejectException as e:
+            _audit('alert-expire-rejected' if action == 'expired' else 'alert-timeout-rejected', alert, alert.text)
+            errors.append(str(e))
+            continue
+        _audit('alert-expired' if action == 'expired' else 'alert-timeout', alert, text)
+        processed_by_id[alert.id].append(alert)
+        done += 1
+    return done
+
+
+def run_housekeeping(expired_threshold: int, info_threshold: int) -> Optional[Tuple[List[Alert], List[Alert], List[Alert], List[str]]]:
+    """
+    Delete old closed, expired and informational alerts then expire, unshelve and unack timed out
+    alerts, HOUSEKEEPING_BATCH_SIZE at a time, until there are none left or HOUSEKEEPING_TIME_BUDGET
+    seconds have passed. Any alerts left over are processed by the next run. If HOUSEKEEPING_BULK
+    is set, each batch is written using a single update.
+
+    Return the expired, unshelved and unack'ed alerts and errors, or None if housekeeping is
+    already being run by another process.
+    """
+    batch_size = current_app.config['HOUSEKEEPING_BATCH_SIZE'] or None
+    time_budget = current_app.config['HOUSEKEEPING_TIME_BUDGET']
+
+    # lock expires if it is never released (MongoDB only), eg. the process was killed
+    if not db.acquire_lock(LOCK_NAME, ttl=2 * time_budget if time_budget else 3600):
+        return None
+
+    try:
+        started = time.monotonic()
+        ts = run_timer.start_timer()
+
+        Alert.delete_expired(expired_threshold, info_threshold)
+
+        expired = []  # type: List[Alert]
+        unshelved = []  # type: List[Alert]
+        unacked = []  # type: List[Alert]
+        errors = []  # type: List[str]
+        seen = set()  # type: Set[str]
+        out_of_time = False
+        while not out_of_time:
+            # alerts rejected by a plugin or skipped are still timed out so are excluded from later batches
+            has_expired, shelve_timeout, ack_timeout = Alert.find_timed_out(limit=batch_size, exclude=list(seen))
+            todo = [
+                (action, a, processed) for action, alerts, processed in [
+                    ('expired', has_expired, expired), ('timeout', shelve_timeout, unshelved), ('timeout', ack_timeout, unacked)
+                ] for a in alerts
+            ]
+            seen.update(alert.id for _, alert, _ in todo)
+
+            if current_app.config['HOUSEKEEPING_BULK']:
+                out_of_time = bool(time_budget) and time.monotonic() - started > time_budget
+                if not out_of_time:
+                    _timeout_alerts(todo, errors)
+            else:
+                for action, alert, processed in todo:
+                    if time_budget and time.monotonic() - started > time_budget:
+                        out_of_time = True
+                        break
+                    error = _timeout_alert(alert, action)
+                    if error:
+                        errors.append(error)
+                    else:
+                        processed.append(alert)
+
+            # stop when there were no more alerts to fetch
+            if not batch_size or not todo or all(len(r) < batch_size for r in (has_expired, shelve_timeout, ack_timeout)):
+                break
+
+        if out_of_time:
+            LOG.warning('Housekeeping stopped after %s seconds, remaining alerts are processed by next run', time_budget)
+            incomplete_counter.inc()
+    finally:
+        db.release_lock(LOCK_NAME)
+
+    run_timer.stop_timer(ts)
+    for counter, alerts in [(expired_counter, expired), (unshelved_counter, unshelved), (unacked_counter, unacked)]:
+        if alerts:
+            counter.inc(len(alerts))
+
+    return expired, unshelved, unacked, errors
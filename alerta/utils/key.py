@@ -1,13 +1,21 @@
+import atexit
 import base64
 import hashlib
 import hmac
+import logging
 import os
-from typing import List
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
 from flask import Flask
 
 from alerta.models.enums import ADMIN_SCOPES, Scope
 
+LOG = logging.getLogger('alerta.auth')
+
 
 class ApiKeyHelper:
 
@@ -41,3 +49,119 @@ class ApiKeyHelper:
         if key_type == 'read-only':
             return [Scope.read]
         return []
+
+
+class ApiKeyCache:
+    """
+    In-memory LRU cache of verified API keys, with usage counts and last used
+    times coalesced in memory and written to the database in a single batch at
+    most once every API_KEY_USAGE_FLUSH_INTERVAL seconds, and at exit.
+
+    Keys updated or deleted by this process are removed from the cache at once,
+    changes made by other processes are picked up after API_KEY_CACHE_TTL
+    seconds. Set API_KEY_CACHE_TTL to 0 to disable it.
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.app: Optional[Flask] = None
+        self.ttl = 0
+        self.size = 0
+        self.flush_interval = 0
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.cache: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        self.usage: Dict[str, Tuple[int, datetime]] = dict()
+        self.last_flush = time.monotonic()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        atexit.register(self._flush_at_exit)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        self.ttl = app.config['API_KEY_CACHE_TTL']
+        self.size = app.config['API_KEY_CACHE_SIZE']
+        self.flush_interval = app.config['API_KEY_USAGE_FLUSH_INTERVAL']
+        with self.lock:
+            self.cache.clear()
+            self.usage = dict()
+
+    def _check_pid(self) -> None:
+        # cached keys and usage recorded before a fork belong to the parent process
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.cache.clear()
+            self.usage = dict()
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.ttl:
+            return None
+        with self.lock:
+            self._check_pid()
+            entry = self.cache.get(key)
+            if entry and time.monotonic() < entry[1]:
+                self.cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+            if entry:
+                del self.cache[key]
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key: str, key_info: Any) -> None:
+        if not self.ttl:
+            return
+        with self.lock:
+            self._check_pid()
+            self.cache[key] = (key_info, time.monotonic() + self.ttl)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, key_info: Any) -> None:
+        with self.lock:
+            for k in [k for k, (v, _) in self.cache.items() if v.id == key_info.id]:
+                del self.cache[k]
+            self.usage.pop(key_info.key, None)
+
+    def used(self, key: str) -> None:
+        from alerta.app import db
+
+        if not self.flush_interval:
+            db.update_key_last_used(key)
+            return
+        with self.lock:
+            self._check_pid()
+            count, _ = self.usage.get(key, (0, None))
+            self.usage[key] = (count + 1, datetime.utcnow())
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def _flush_at_exit(self) -> None:
+        # usage recorded by a forked process that never used any keys belongs to the parent
+        if self.app is not None and self.pid == os.getpid():
+            with self.app.app_context():
+                self.flush()
+
+    def flush(self) -> None:
+        from alerta.app import db
+
+        with self.lock:
+            self._check_pid()
+            usage, self.usage = self.usage, dict()
+            self.last_flush = time.monotonic()
+        if not usage:
+            return
+        try:
+            db.update_keys_last_used([
+                {'key': key, 'count': count, 'last_used_time': last_used_time}
+                for key, (count, last_used_time) in usage.items()
+            ])
+        except Exception as e:
+            LOG.warning('Failed to write usage of %d API keys: %s', len(usage), e)
+            with self.lock:
+                for key, (count, last_used_time) in usage.items():
+                    pending_count, pending_time = self.usage.get(key, (0, last_used_time))
+                    self.usage[key] = (pending_count + count, max(pending_time, last_used_time))
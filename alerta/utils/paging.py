@@ -1,7 +1,13 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+
 from flask import current_app
 from werkzeug.datastructures import MultiDict
 
 from alerta.exceptions import ApiError
+from alerta.utils.format import DateTime
 
 
 class Page:
@@ -31,3 +37,82 @@ class Page:
     @property
     def has_more(self) -> bool:
         return self.page < self.pages
+
+
+class Cursor:
+    """
+    Opaque keyset pagination cursor holding the sort order and the sort key of
+    the last item returned, so the next page can be found without an offset.
+    """
+
+    def __init__(self, sort_by: List[str], after: Optional[List[Any]] = None, page_size: Optional[int] = None) -> None:
+
+        self.sort_by = sort_by
+        self.after = after
+        self.page_size = page_size or current_app.config['DEFAULT_PAGE_SIZE']
+
+    @staticmethod
+    def from_params(params: MultiDict) -> Optional['Cursor']:
+        # cursor (empty for first page), page-size, limit (deprecated)
+        if 'cursor' not in params:
+            return None
+        limit = params.get('limit', 0, int)
+        page_size = params.get('page-size', limit, int)
+        sort_by = params.getlist('sort-by')
+
+        token = params['cursor']
+        if not token:
+            return Cursor(sort_by, None, page_size)
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode('utf-8')))
+            after = data['after']
+        except Exception:
+            raise ApiError('invalid cursor', 400)
+        if data.get('sortBy') != sort_by or not isinstance(after, list):
+            raise ApiError('cursor does not match sort order', 400)
+        return Cursor(sort_by, after, page_size)
+
+    def next(self, after: Optional[List[Any]]) -> Optional[str]:
+        if after is None:
+            return None
+        data = json.dumps({'sortBy': self.sort_by, 'after': after}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('utf-8')
+
+
+class UpdatedSince:
+    """
+    Opaque token for fetching only the alerts changed since a previous query, holding
+    the time of that query less UPDATED_SINCE_MARGIN seconds so that changes still being
+    written when it ran are not missed.
+    """
+
+    def __init__(self, since: Optional[datetime] = None) -> None:
+
+        self.since = since
+
+    @staticmethod
+    def from_params(params: MultiDict) -> Optional['UpdatedSince']:
+        # updated-since (empty for all alerts)
+        if 'updated-since' not in params:
+            return None
+
+        token = params['updated-since']
+        if not token:
+            return UpdatedSince()
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode('utf-8')))
+            since = DateTime.parse(data['since'])
+        except Exception:
+            raise ApiError('invalid updated-since token', 400)
+        return UpdatedSince(since)
+
+    @property
+    def has_expired(self) -> bool:
+        # ids of alerts deleted before then are no longer known
+        max_age = current_app.config['TOMBSTONE_MAX_AGE']
+        return self.since is not None and bool(max_age) and self.since < datetime.utcnow() - timedelta(seconds=max_age)
+
+    def next(self, query_time: datetime) -> str:
+        since = query_time - timedelta(seconds=current_app.config['UPDATED_SINCE_MARGIN'])
+        data = json.dumps({'since': DateTime.iso8601(since)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('utf-8')
@@ -1,15 +1,26 @@
+import copy
+import inspect
 import logging
+import os
+import queue
+import sys
+import threading
 from collections import OrderedDict
 from importlib.metadata import PackageNotFoundError
 from importlib.metadata import entry_points as _entry_points
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
 
-from flask import Config, Flask
+from flask import Config, Flask, current_app, has_request_context, request
 
 from alerta.plugins import app
 
 LOG = logging.getLogger('alerta.plugins')
 
+# seconds a request waits for space in a full queue, if ASYNC_PLUGIN_QUEUE_FULL is "block"
+BLOCK_TIMEOUT = 30
+
+HOOKS = ['pre_receive', 'post_receive', 'status_change', 'take_action', 'post_action', 'take_note', 'delete']
+
 if TYPE_CHECKING:
     from typing import Iterable, Tuple  # noqa
 
@@ -17,11 +28,51 @@ if TYPE_CHECKING:
     from alerta.plugins import PluginBase  # noqa
 
 
+def accepts_config(method: Callable) -> bool:
+    try:
+        sig = inspect.signature(method)
+        params = sig.parameters
+        return 'config' in params or any(
+            p.kind == inspect.Parameter.VAR_KEYWORD for p in params.values()
+        )
+    except (ValueError, TypeError):
+        return False
+
+
+def accepts_kwargs(method: Callable) -> bool:
+    try:
+        return any(p.kind == inspect.Parameter.VAR_KEYWORD for p in inspect.signature(method).parameters.values())
+    except (ValueError, TypeError):
+        return False
+
+
+def is_stub(plugin: 'PluginBase', hook: str) -> bool:
+    """
+    Return True if the plugin does not implement the hook, or marked it as a stub.
+    """
+    from alerta.plugins import PluginBase
+
+    method = getattr(type(plugin), hook, None)
+    return method is None or method is getattr(PluginBase, hook, None) or getattr(method, '__stub__', False)
+
+
 class Plugins:
+    """
+    Plugins are loaded once, when they are registered, and so is a dispatch table of the
+    hooks each plugin implements, so that hooks a plugin does not override or marks with
+    @stub are not called and the signature of each hook is inspected only once.
+
+    If the routing rules module also defines routing_key(alert), the plugins and config
+    returned by the rules are cached for alerts with the same routing key.
+    """
 
     def __init__(self) -> None:
         self.plugins = OrderedDict()  # type: OrderedDict[str, PluginBase]
+        self.hooks = dict()  # type: Dict[PluginBase, Dict[str, bool]]
         self.rules = None  # entry point
+        self.routing_key = None  # type: Optional[Callable[[Alert], Any]]
+        self.routes = OrderedDict()  # type: OrderedDict[Any, Tuple[Iterable[PluginBase], Config]]
+        self.lock = threading.Lock()
 
         self.config = Config('/')
 
@@ -29,6 +80,8 @@ class Plugins:
 
     def register(self, app: Flask) -> None:
         self.config = app.config
+        self.hooks = dict()
+        self.routes = OrderedDict()
 
         try:
             all_eps = _entry_points(group='alerta.plugins')
@@ -43,11 +96,16 @@ class Plugins:
             try:
                 plugin = ep_map[name].load()
                 if plugin:
+                    replaced = self.plugins.get(name)
                     self.plugins[name] = plugin()
+                    if replaced is not None:
+                        replaced.close()
                     LOG.info(f"Server plugin '{name}' loaded.")
             except Exception as e:
                 LOG.error(f"Failed to load plugin '{name}': {str(e)}")
         LOG.info(f"All server plugins enabled: {', '.join(self.plugins.keys())}")
+        for plugin in self.plugins.values():
+            self.hooks_of(plugin)
         try:
             try:
                 routing_eps = _entry_points(group='alerta.routing', name='rules')
@@ -55,27 +113,199 @@ class Plugins:
                 routing_eps = [ep for ep in _entry_points().get('alerta.routing', []) if ep.name == 'rules']
             if routing_eps:
                 self.rules = routing_eps[0].load()  # type: ignore
+                self.routing_key = getattr(sys.modules.get(self.rules.__module__), 'routing_key', None)
             else:
                 raise ImportError('No routing entry point found')
         except (PackageNotFoundError, ImportError):
             LOG.info('No plugin routing rules found. All plugins will be evaluated.')
 
+    def hooks_of(self, plugin: 'PluginBase') -> Dict[str, bool]:
+        """
+        Return the hooks implemented by the plugin, and whether each accepts config.
+        """
+        hooks = self.hooks.get(plugin)
+        if hooks is None:
+            hooks = self.hooks[plugin] = {
+                hook: accepts_config(getattr(plugin, hook)) for hook in HOOKS if not is_stub(plugin, hook)
+            }
+            LOG.debug(f"Server plugin '{type(plugin).__name__}' implements {', '.join(hooks) or 'no hooks'}")
+        return hooks
+
+    def dispatch(self, hook: str, wanted_plugins: 'Iterable[PluginBase]') -> 'List[Tuple[PluginBase, bool]]':
+        """
+        Return the wanted plugins that implement the hook, and whether it accepts config.
+        """
+        dispatch = list()
+        for plugin in wanted_plugins:
+            hooks = self.hooks_of(plugin)
+            if hook in hooks:
+                dispatch.append((plugin, hooks[hook]))
+        return dispatch
+
+    def _routing_key(self, alert: 'Alert') -> Any:
+        if not self.routing_key:
+            return None
+        try:
+            return self.routing_key(alert)
+        except Exception as e:
+            LOG.warning(f'Plugin routing key failed: {e}')
+            return None
+
     def routing(self, alert: 'Alert') -> 'Tuple[Iterable[PluginBase], Config]':
         try:
             if self.plugins and self.rules:
+                key = self._routing_key(alert)
+                if key is not None:
+                    with self.lock:
+                        route = self.routes.get(key)
+                        if route:
+                            self.routes.move_to_end(key)
+                            return route
+
                 try:
                     r = self.rules(alert, self.plugins, config=self.config)
                 except TypeError:
                     r = self.rules(alert, self.plugins)
 
                 if isinstance(r, list):
-                    return r, self.config
+                    route = r, self.config
                 else:
                     plugins, config = r
-                    return plugins, Config('/', {**self.config, **config})
+                    route = plugins, Config('/', {**self.config, **config})
+
+                if key is not None:
+                    with self.lock:
+                        self.routes[key] = route
+                        while len(self.routes) > self.config['PLUGINS_ROUTING_CACHE_SIZE']:
+                            self.routes.popitem(last=False)
+                return route
 
         except Exception as e:
             LOG.warning(f'Plugin routing rules failed: {e}')
 
         # default when no routing rules defined
         return self.plugins.values(), self.config
+
+
+class PluginExecutor:
+    """
+    Run post_receive() and post_action() hooks of asynchronous plugins in the background
+    so that slow integrations don't delay responses. Plugins are asynchronous if they set
+    "asynchronous = True" or are listed in ASYNC_PLUGINS, and anything their hooks return
+    is ignored.
+
+    Each process queues the hooks of each plugin for ASYNC_PLUGIN_CONCURRENCY threads,
+    so one slow plugin can't hold up the others, or sends them to Celery workers if
+    ASYNC_PLUGIN_EXECUTOR is "celery". When the queue of a plugin is full, hooks are
+    dropped, or requests wait for space if ASYNC_PLUGIN_QUEUE_FULL is "block".
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.app = None  # type: Optional[Flask]
+        self.lock = threading.Lock()
+        self.pid = None  # type: Optional[int]
+        self.stopped = threading.Event()
+        self.queues = dict()  # type: Dict[str, queue.Queue]
+        self.stats = dict()  # type: Dict[str, int]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.stop()
+        self.app = app
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.pid = None
+        self.queues = dict()
+
+    def name_of(self, plugin: 'PluginBase') -> Optional[str]:
+        from alerta.app import plugins
+        return next((name for name, p in plugins.plugins.items() if p is plugin), None)
+
+    def is_async(self, plugin: 'PluginBase') -> bool:
+        if getattr(plugin, 'asynchronous', False):
+            return True
+        return self.app is not None and self.name_of(plugin) in self.app.config['ASYNC_PLUGINS']
+
+    def submit(self, plugin: 'PluginBase', hook: str, alert: 'Alert', *args: Any, **kwargs: Any) -> bool:
+        """
+        Run the hook of the plugin in the background and return False if it was dropped.
+        """
+        name = self.name_of(plugin) or plugin.name
+
+        # hooks run outside of the request so they are passed what forwarding needs from it
+        if has_request_context() and accepts_kwargs(getattr(plugin, hook)):
+            from alerta.utils.response import base_url
+            kwargs.update(x_loop=request.headers.get('X-Alerta-Loop'), base_url=base_url())
+
+        if current_app.config['ASYNC_PLUGIN_EXECUTOR'] == 'celery':
+            from alerta.tasks import run_plugin
+            with_config = kwargs.pop('config', None) is not None
+            run_plugin.delay(name, hook, alert.id, list(args), kwargs, with_config)
+            return True
+
+        # hooks must not see later changes to the alert
+        task = (plugin, hook, copy.deepcopy(alert), args, kwargs)
+        try:
+            if current_app.config['ASYNC_PLUGIN_QUEUE_FULL'] == 'block':
+                self._queue(name).put(task, timeout=BLOCK_TIMEOUT)
+            else:
+                self._queue(name).put_nowait(task)
+        except queue.Full:
+            LOG.warning(f"Queue of plugin '{name}' is full, {hook} hook for alert {alert.id} dropped")
+            self._count('dropped')
+            return False
+        self._count('submitted')
+        return True
+
+    def _queue(self, name: str) -> queue.Queue:
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    # threads don't survive a fork so they are started by each worker process
+                    self.pid = os.getpid()
+                    self.stopped = threading.Event()
+                    self.queues = dict()
+                    self.stats = dict()
+        q = self.queues.get(name)
+        if q is None:
+            with self.lock:
+                q = self.queues.get(name)
+                if q is None:
+                    q = self.queues[name] = queue.Queue(current_app.config['ASYNC_PLUGIN_QUEUE_SIZE'])
+                    app = current_app._get_current_object()  # type: ignore
+                    for i in range(current_app.config['ASYNC_PLUGIN_CONCURRENCY']):
+                        threading.Thread(target=self._run, args=(app, q, self.stopped), name=f'plugin-{name}-{i}', daemon=True).start()
+        return q
+
+    def _run(self, app: Flask, q: queue.Queue, stopped: threading.Event) -> None:
+        while not stopped.is_set():
+            try:
+                plugin, hook, alert, args, kwargs = q.get(timeout=1)
+            except queue.Empty:
+                continue
+            self._count('running')
+            try:
+                with app.app_context():
+                    getattr(plugin, hook)(alert, *args, **kwargs)
+                self._count('completed')
+            except Exception as e:
+                LOG.error(f"Error while running {hook.replace('_', '-')} plugin '{plugin.name}': {str(e)}")
+                self._count('failed')
+            finally:
+                self._count('running', -1)
+                q.task_done()
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[stat] = self.stats.get(stat, 0) + n
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(q.qsize() for q in list(self.queues.values()))
+
+    def join(self) -> None:
+        """Wait until all queued hooks have run."""
+        for q in list(self.queues.values()):
+            q.join()
@@ -1,7 +1,9 @@
+import hashlib
+import json
 from functools import wraps
 from urllib.parse import urljoin
 
-from flask import current_app, request
+from flask import current_app, g, make_response, request
 
 
 def jsonp(func):
@@ -19,6 +21,75 @@ def jsonp(func):
     return decorated
 
 
+def etag(func):
+    """
+    Answer conditional requests for alert queries with "304 Not Modified" if no alerts
+    visible to the user have changed. The ETag is derived from the change sequence, which
+    is read before the query, the query parameters and the user's customers and scopes.
+    """
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        if not current_app.config['ETAG_ENABLED'] or request.method != 'GET':
+            return func(*args, **kwargs)
+
+        from alerta.models.alert import Alert
+        customers = g.get('customers', None)
+        g.change_sequence = Alert.get_change_sequence(customers)
+        key = [
+            g.change_sequence,
+            request.path,
+            sorted(request.args.items(multi=True)),
+            sorted(customers or []),
+            sorted(str(s) for s in g.get('scopes', None) or [])
+        ]
+        tag = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+        if request.if_none_match.contains_weak(tag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(func(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(tag, weak=True)
+        return response
+    return decorated
+
+
+def cached(func):
+    """
+    Cache successful responses using the response cache, keyed by the path, query
+    parameters and the user's customers and scopes. Responses are not reused after alerts change
+    if the change sequence is known, so they are never stale for a new ETag.
+    """
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        from alerta.app import response_cache
+        if not response_cache.ttl or request.method != 'GET':
+            return func(*args, **kwargs)
+
+        key = [
+            request.path,
+            sorted(request.args.items(multi=True)),
+            sorted(g.get('customers', None) or []),
+            sorted(str(s) for s in g.get('scopes', None) or []),
+            g.get('change_sequence', None)
+        ]
+
+        def lookup():
+            response = make_response(func(*args, **kwargs))
+            if response.status_code != 200:
+                g.uncached_response = response
+                return None
+            return [response.get_data(as_text=True), response.mimetype]
+
+        value = response_cache.get_or_set(hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest(), lookup)
+        if value is None:
+            return g.pop('uncached_response')
+        data, mimetype = value
+        return current_app.response_class(data, mimetype=mimetype)
+    return decorated
+
+
 def absolute_url(path: str = '') -> str:
     try:
         base_url = current_app.config['BASE_URL'] or request.url_root
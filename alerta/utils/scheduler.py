@@ -0,0 +1,77 @@
+import logging
+import os
+import threading
+from typing import Optional  # noqa
+
+from flask import Flask, g
+
+LOG = logging.getLogger('alerta.housekeeping')
+
+
+class HousekeepingScheduler:
+    """
+    Run housekeeping in a background thread of every worker process each
+    HOUSEKEEPING_INTERVAL seconds. A database lock makes sure that only one
+    process, on any node, runs it at a time. Set HOUSEKEEPING_INTERVAL to 0 to
+    disable it and run housekeeping using the management API or CLI instead.
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.app = None  # type: Optional[Flask]
+        self.interval = 0
+        self.lock = threading.Lock()
+        self.pid = None  # type: Optional[int]
+        self.stopped = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.stop()
+        self.app = app
+        self.interval = app.config['HOUSEKEEPING_INTERVAL']
+        if self.interval:
+            # threads don't survive a fork so one is started by each worker process on its first request
+            app.before_request(self.start)
+
+    def start(self) -> None:
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.stopped = threading.Event()
+            threading.Thread(target=self._run, args=(self.stopped,), name='housekeeping', daemon=True).start()
+            LOG.info('Housekeeping scheduled every %s seconds (pid=%s)', self.interval, self.pid)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.pid = None
+
+    def _run(self, stopped: threading.Event) -> None:
+        while not stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                LOG.error('Housekeeping failed: %s', e)
+
+    def run_once(self):
+        """
+        Run housekeeping using the configured thresholds and return the expired, unshelved
+        and unack'ed alerts and errors, or None if another process is running it.
+        """
+        from alerta.utils.housekeeping import run_housekeeping
+
+        # there is no request so audit events and plugins only see the housekeeping user
+        with self.app.app_context():
+            g.login = None
+            g.customers = []
+            g.scopes = []
+            result = run_housekeeping(self.app.config['DELETE_EXPIRED_AFTER'], self.app.config['DELETE_INFO_AFTER'])
+
+        if result:
+            expired, unshelved, unacked, errors = result
+            LOG.info('Housekeeping expired %d, unshelved %d and unacked %d alerts', len(expired), len(unshelved), len(unacked))
+            for error in errors:
+                LOG.warning('Housekeeping: %s', error)
+        return result
@@ -0,0 +1,194 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from flask import Flask, current_app
+
+LOG = logging.getLogger('alerta.stream')
+
+# if an alert changes more than once between checks, only the most significant change is sent
+PRIORITY = {'update': 0, 'status': 1, 'create': 2, 'delete': 3}
+
+# number of alerts removed from a client's result that are remembered so they are only removed once
+REMOVED_MAXSIZE = 10000
+
+
+class Subscription:
+
+    def __init__(self, maxsize: int) -> None:
+        self.changes = queue.Queue(maxsize)  # type: queue.Queue
+        self.stale = False
+
+    def put(self, changes: List[Tuple[str, str, Optional[str]]]) -> None:
+        try:
+            self.changes.put_nowait(changes)
+        except queue.Full:
+            # changes were missed so the client must reload alerts
+            self.stale = True
+
+
+class AlertStream:
+    """
+    Push changes to alerts to clients using server-sent events. Changes are notified
+    by the database to one listener thread in each worker process, started by the first
+    client, which fans them out to all clients connected to that process.
+    """
+
+    def __init__(self, app: Optional[Flask] = None) -> None:
+        self.app = None  # type: Optional[Flask]
+        self.lock = threading.Lock()
+        self.pid = None  # type: Optional[int]
+        self.stopped = threading.Event()
+        self.listening = threading.Event()
+        self.subscriptions: Set[Subscription] = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        self.stop()
+        self.app = app
+
+    def start(self) -> None:
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # threads don't survive a fork so one is started by each worker process
+            self.pid = os.getpid()
+            self.stopped = threading.Event()
+            self.listening = threading.Event()
+            threading.Thread(target=self._run, args=(self.stopped, self.listening), name='stream', daemon=True).start()
+            LOG.info('Alert stream listener started (pid=%s)', self.pid)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.pid = None
+
+    def subscribe(self) -> Subscription:
+        self.start()
+        # changes made before the listener is ready would be missed
+        if not self.listening.wait(timeout=5):
+            LOG.warning('Alert stream listener is not ready')
+        subscription = Subscription(current_app.config['STREAM_QUEUE_SIZE'])
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, changes: List[Tuple[str, str, Optional[str]]]) -> None:
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.put(changes)
+
+    def _run(self, stopped: threading.Event, listening: threading.Event) -> None:
+        from alerta.app import db
+
+        while not stopped.is_set():
+            listener = db.listen_alerts(timeout=1)
+            try:
+                for changes in listener:
+                    listening.set()
+                    if stopped.is_set():
+                        break
+                    if changes:
+                        self.publish(changes)
+            except Exception as e:
+                LOG.error('Alert stream listener failed: %s', e)
+                listening.clear()
+                with self.lock:
+                    for subscription in self.subscriptions:
+                        subscription.stale = True
+                stopped.wait(5)
+            finally:
+                listener.close()
+
+    def events(self, query, customers: List[str]) -> Iterator[str]:
+        """
+        Yield server-sent events for alerts that match the query when they are created,
+        updated, change status or are deleted, and "remove" events for alerts that no longer
+        match the query after they changed. Changes are checked against the query at most
+        once every STREAM_INTERVAL seconds. A "reset" event means changes were missed and
+        alerts must be reloaded.
+
+        The previous state of an alert is unknown so a "remove" event is sent the first time
+        a changed alert does not match, even if it never did, and clients must ignore ids of
+        alerts they don't have. It is not sent again until the alert matches again.
+        """
+        from alerta.app import db
+
+        interval = current_app.config['STREAM_INTERVAL']
+        keepalive = current_app.config['STREAM_KEEPALIVE']
+
+        removed = OrderedDict()  # type: OrderedDict[str, None]
+        subscription = self.subscribe()
+        try:
+            # the request's database connection is not needed while waiting for changes
+            db.teardown_db(None)
+            yield ': connected\n\n'
+
+            while True:
+                try:
+                    changes = list(subscription.changes.get(timeout=keepalive))
+                except queue.Empty:
+                    if not subscription.stale:
+                        yield ':\n\n'
+                        continue
+                    changes = []
+
+                time.sleep(interval)
+                while True:
+                    try:
+                        changes.extend(subscription.changes.get_nowait())
+                    except queue.Empty:
+                        break
+
+                if subscription.stale:
+                    subscription.stale = False
+                    yield self._event('reset', {})
+                    continue
+
+                for event, data in self._match(changes, query, customers, removed):
+                    yield self._event(event, data)
+                db.teardown_db(None)
+        finally:
+            self.unsubscribe(subscription)
+
+    @staticmethod
+    def _match(changes: List[Tuple[str, str, Optional[str]]], query, customers: List[str],
+               removed: 'OrderedDict[str, None]') -> Iterator[Tuple[str, Dict[str, Any]]]:
+        from alerta.models.alert import Alert
+
+        latest = OrderedDict()  # type: Dict[str, Tuple[str, Optional[str]]]
+        for change, id, customer in changes:
+            if id not in latest or PRIORITY[change] >= PRIORITY[latest[id][0]]:
+                latest[id] = change, customer
+
+        # never send ids of alerts that belong to other customers
+        visible = [(id, change) for id, (change, customer) in latest.items() if not customers or customer in customers]
+
+        ids = [id for id, change in visible if change != 'delete']
+        alerts = {alert.id: alert for alert in Alert.find_by_ids(ids, query)} if ids else {}
+        for id, change in visible:
+            if id in alerts:
+                removed.pop(id, None)
+                yield change, alerts[id].serialize
+            elif change == 'delete':
+                removed.pop(id, None)
+                yield 'delete', {'id': id}
+            elif change != 'create' and id not in removed:
+                removed[id] = None
+                if len(removed) > REMOVED_MAXSIZE:
+                    removed.popitem(last=False)
+                yield 'remove', {'id': id}
+
+    def _event(self, event: str, data: Dict[str, Any]) -> str:
+        return f'event: {event}\ndata: {current_app.json.dumps(data)}\n\n'
@@ -17,6 +17,8 @@ except ImportError:
 @api.before_request
 def before_request():
     if request.method in ['POST', 'PUT'] and not request.is_json:
+        if request.endpoint == 'api.bulk_receive' and request.mimetype == 'application/x-ndjson':
+            return
         raise ApiError("POST and PUT requests must set 'Content-type' to 'application/json'", 415)
 
 
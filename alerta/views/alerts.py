@@ -1,9 +1,10 @@
 from datetime import datetime
 
-from flask import current_app, g, jsonify, request
+from flask import (Response, current_app, g, jsonify, request,
+                   stream_with_context)
 from flask_cors import cross_origin
 
-from alerta.app import qb
+from alerta.app import alert_stream, qb
 from alerta.auth.decorators import permission
 from alerta.exceptions import (AlertaException, ApiError, BlackoutPeriod,
                                ForwardingLoop, HeartbeatReceived,
@@ -16,8 +17,8 @@ from alerta.models.switch import Switch
 from alerta.utils.api import (assign_customer, process_action, process_alert,
                               process_delete, process_note, process_status)
 from alerta.utils.audit import write_audit_trail
-from alerta.utils.paging import Page
-from alerta.utils.response import absolute_url, jsonp
+from alerta.utils.paging import Cursor, Page, UpdatedSince
+from alerta.utils.response import absolute_url, cached, etag, jsonp
 
 from . import api
 
@@ -309,28 +310,63 @@ def delete_alert(alert_id):
 @api.route('/alerts', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(gets_timer)
 @jsonp
 def search_alerts():
     query_time = datetime.utcnow()
     query = qb.alerts.from_params(request.args, customers=g.customers, query_time=query_time)
+    updated_since = UpdatedSince.from_params(request.args)
+    if updated_since and updated_since.has_expired:
+        raise ApiError('updated-since token has expired, alerts must be reloaded', 410)
     show_raw_data = request.args.get('show-raw-data', default=False, type=lambda x: x.lower() in ['true', 't', '1', 'yes', 'y', 'on'])
     show_history = request.args.get('show-history', default=False, type=lambda x: x.lower() in ['true', 't', '1', 'yes', 'y', 'on'])
-    severity_count = Alert.get_counts_by_severity(query)
-    status_count = Alert.get_counts_by_status(query)
 
-    total = sum(severity_count.values())
-    paging = Page.from_params(request.args, total)
+    # count=exact (default), estimate or none
+    count = request.args.get('count', default='exact')
+    if count == 'exact':
+        severity_count, status_count = Alert.get_counts_by_severity_and_status(query)
+        total = sum(severity_count.values())
+    elif count == 'estimate':
+        severity_count, status_count = dict(), dict()
+        total = Alert.get_count_estimate(query)
+    elif count == 'none':
+        severity_count, status_count = dict(), dict()
+        total = None
+    else:
+        raise ApiError(f"Invalid count parameter '{count}', must be one of 'exact', 'estimate' or 'none'", 400)
+    exact = count == 'exact'
+
+    paging = Page.from_params(request.args, total if exact else 0)
+    cursor = Cursor.from_params(request.args)
+
+    if cursor:
+        try:
+            alerts, next_key = Alert.find_after(query, cursor.after, raw_data=show_raw_data, history=show_history,
+                                                page_size=cursor.page_size)
+        except ValueError as e:
+            raise ApiError(str(e), 400)
+        paging = Page(1, cursor.page_size, total if exact else 0)
+        page_info = dict(more=next_key is not None, nextCursor=cursor.next(next_key))
+    else:
+        alerts = Alert.find_all(query, raw_data=show_raw_data, history=show_history, page=paging.page, page_size=paging.page_size)
+        page_info = dict(more=paging.has_more if exact else len(alerts) == paging.page_size)
 
-    alerts = Alert.find_all(query, raw_data=show_raw_data, history=show_history, page=paging.page, page_size=paging.page_size)
+    # updated-since (alerts changed since the previous query, and ids of alerts to remove)
+    if updated_since:
+        removed, deleted = Alert.find_changes(query, updated_since.since, g.customers) if updated_since.since else ([], [])
+        changes_info = dict(removed=removed, deleted=deleted, nextUpdatedSince=updated_since.next(query_time))
+    else:
+        changes_info = dict()
 
     if alerts:
         return jsonify(
             status='ok',
             page=paging.page,
             pageSize=paging.page_size,
-            pages=paging.pages,
-            more=paging.has_more,
+            pages=paging.pages if exact else None,
+            **page_info,
+            **changes_info,
             alerts=[alert.serialize for alert in alerts],
             total=total,
             statusCounts=status_count,
@@ -346,6 +382,7 @@ def search_alerts():
             pageSize=paging.page_size,
             pages=0,
             more=False,
+            **changes_info,
             alerts=[],
             total=0,
             severityCounts=severity_count,
@@ -355,6 +392,21 @@ def search_alerts():
         )
 
 
+@api.route('/alerts/stream', methods=['OPTIONS', 'GET'])
+@cross_origin()
+@permission(Scope.read_alerts)
+def stream_alerts():
+    if not current_app.config['STREAM_ENABLED']:
+        raise ApiError('alert stream is not enabled', 404)
+
+    query = qb.alerts.from_params(request.args, customers=g.customers)
+    return Response(
+        stream_with_context(alert_stream.events(query, g.customers)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @api.route('/alerts/history', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
@@ -363,13 +415,24 @@ def search_alerts():
 def history():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     paging = Page.from_params(request.args, items=0)
-    history = Alert.get_history(query, paging.page, paging.page_size)
+    cursor = Cursor.from_params(request.args)
+
+    if cursor:
+        try:
+            history, next_key = Alert.get_history_after(query, cursor.after, cursor.page_size)
+        except ValueError as e:
+            raise ApiError(str(e), 400)
+        page_info = dict(more=next_key is not None, nextCursor=cursor.next(next_key))
+    else:
+        history = Alert.get_history(query, paging.page, paging.page_size)
+        page_info = dict()
 
     if history:
         return jsonify(
             status='ok',
             history=[h.serialize for h in history],
-            total=len(history)
+            total=len(history),
+            **page_info
         )
     else:
         return jsonify(
@@ -385,12 +448,12 @@ def history():
 @api.route('/alerts/count', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(count_timer)
 @jsonp
 def get_counts():
     query = qb.alerts.from_params(request.args, customers=g.customers)
-    severity_count = Alert.get_counts_by_severity(query)
-    status_count = Alert.get_counts_by_status(query)
+    severity_count, status_count = Alert.get_counts_by_severity_and_status(query)
 
     return jsonify(
         status='ok',
@@ -406,8 +469,10 @@ def get_counts():
 @api.route('/alerts/topn/count', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(count_timer)
 @jsonp
+@cached
 def get_topn_count():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     paging = Page.from_params(request.args, 1)
@@ -433,8 +498,10 @@ def get_topn_count():
 @api.route('/alerts/topn/flapping', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(count_timer)
 @jsonp
+@cached
 def get_topn_flapping():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     paging = Page.from_params(request.args, 1)
@@ -460,8 +527,10 @@ def get_topn_flapping():
 @api.route('/alerts/topn/standing', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(count_timer)
 @jsonp
+@cached
 def get_topn_standing():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     paging = Page.from_params(request.args, 1)
@@ -486,8 +555,10 @@ def get_topn_standing():
 @api.route('/environments', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(gets_timer)
 @jsonp
+@cached
 def get_environments():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     total = Alert.get_environments_count(query)
@@ -521,8 +592,10 @@ def get_environments():
 @api.route('/services', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(gets_timer)
 @jsonp
+@cached
 def get_services():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     services = Alert.get_services(query)
@@ -546,8 +619,10 @@ def get_services():
 @api.route('/alerts/groups', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(gets_timer)
 @jsonp
+@cached
 def get_groups():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     groups = Alert.get_groups(query)
@@ -571,8 +646,10 @@ def get_groups():
 @api.route('/alerts/tags', methods=['OPTIONS', 'GET'])
 @cross_origin()
 @permission(Scope.read_alerts)
+@etag
 @timer(gets_timer)
 @jsonp
+@cached
 def get_tags():
     query = qb.alerts.from_params(request.args, customers=g.customers)
     tags = Alert.get_tags(query)
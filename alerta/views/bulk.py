@@ -1,16 +1,24 @@
-from flask import g, jsonify, request
+import json
+
+from flask import current_app, g, jsonify, request
 from flask_cors import cross_origin
 
 from alerta.app import qb
 from alerta.auth.decorators import permission
-from alerta.exceptions import ApiError, RejectException
+from alerta.exceptions import (AlertaException, ApiError, BlackoutPeriod,
+                               ForwardingLoop, HeartbeatReceived, RateLimit,
+                               RejectException)
 from alerta.models.alert import Alert
 from alerta.models.enums import Scope
 from alerta.models.metrics import timer
-from alerta.utils.api import process_status
+from alerta.utils.api import (assign_customer, post_receive_alert,
+                              pre_receive_alert, process_alerts,
+                              process_status)
+from alerta.utils.audit import write_audit_trail
 from alerta.utils.response import absolute_url, jsonp
-from alerta.views.alerts import (attrs_timer, delete_timer, status_timer,
-                                 tag_timer)
+from alerta.views.alerts import (attrs_timer, blackout_counter, delete_timer,
+                                 ratelimit_counter, receive_timer,
+                                 reject_counter, status_timer, tag_timer)
 
 from . import api
 
@@ -27,6 +35,101 @@ def task_status(task_id):
     return jsonify(status=task.status.lower(), id=task.id)
 
 
+@api.route('/alerts/_bulk', methods=['OPTIONS', 'POST'])
+@cross_origin()
+@permission(Scope.write_alerts)
+@jsonp
+def bulk_receive():
+    ts = receive_timer.start_timer()
+
+    if request.mimetype == 'application/x-ndjson':
+        try:
+            docs = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError as e:
+            raise ApiError(f'invalid NDJSON: {str(e)}', 400)
+    else:
+        docs = request.json
+
+    if not isinstance(docs, list):
+        raise ApiError('must supply alerts as json list or newline-delimited json', 400)
+    if not docs:
+        raise ApiError('no alerts supplied', 400)
+    if len(docs) > current_app.config['BULK_QUERY_LIMIT']:
+        raise ApiError(f"too many alerts, limit is {current_app.config['BULK_QUERY_LIMIT']}", 400)
+
+    def audit_trail_alert(alert: Alert, event: str):
+        write_audit_trail.send(current_app._get_current_object(), event=event, message=alert.text, user=g.login,  # type: ignore
+                               customers=g.customers, scopes=g.scopes, resource_id=alert.id, type='alert', request=request)
+
+    results = [None] * len(docs)
+    received = []
+
+    for i, doc in enumerate(docs):
+        try:
+            if not isinstance(doc, dict):
+                raise ValueError('alert must be a json object')
+            alert = Alert.parse(doc)
+            alert.customer = assign_customer(wanted=alert.customer)
+        except ValueError as e:
+            results[i] = dict(status='error', code=400, message=str(e))
+            continue
+        except ApiError as e:
+            results[i] = dict(status='error', code=e.code, message=e.message)
+            continue
+
+        try:
+            alert, skip_plugins = pre_receive_alert(alert)
+        except RejectException as e:
+            reject_counter.inc()
+            audit_trail_alert(alert, event='alert-rejected')
+            results[i] = dict(status='error', code=403, message=str(e), id=alert.id)
+        except RateLimit as e:
+            ratelimit_counter.inc()
+            audit_trail_alert(alert, event='alert-rate-limited')
+            results[i] = dict(status='error', code=429, message=str(e), id=alert.id)
+        except HeartbeatReceived as heartbeat:
+            audit_trail_alert(alert, event='alert-heartbeat')
+            results[i] = dict(status='ok', code=202, message=str(heartbeat), id=heartbeat.id)
+        except BlackoutPeriod as e:
+            blackout_counter.inc()
+            audit_trail_alert(alert, event='alert-blackout')
+            results[i] = dict(status='ok', code=202, message=str(e), id=alert.id)
+        except ForwardingLoop as e:
+            results[i] = dict(status='ok', code=202, message=str(e))
+        except AlertaException as e:
+            results[i] = dict(status='error', code=e.code, message=e.message, errors=e.errors)
+        except Exception as e:
+            results[i] = dict(status='error', code=500, message=str(e))
+        else:
+            received.append((i, alert, skip_plugins))
+
+    if received:
+        try:
+            alerts = process_alerts([alert for _, alert, _ in received])
+        except Exception as e:
+            for i, alert, _ in received:
+                results[i] = dict(status='error', code=500, message=str(e), id=alert.id)
+            alerts = []
+
+        for (i, _, skip_plugins), alert in zip(received, alerts):
+            try:
+                alert = post_receive_alert(alert, skip_plugins)
+            except AlertaException as e:
+                results[i] = dict(status='error', code=e.code, message=e.message, errors=e.errors, id=alert.id)
+                continue
+            except Exception as e:
+                results[i] = dict(status='error', code=500, message=str(e), id=alert.id)
+                continue
+
+            audit_trail_alert(alert, event='alert-received')
+            results[i] = dict(status='ok', code=201, id=alert.id, alert=alert.serialize)
+
+    receive_timer.stop_timer(ts, count=len(docs))
+
+    errors = len([r for r in results if r['status'] == 'error'])
+    return jsonify(status='ok', results=results, total=len(results), errors=errors)
+
+
 @api.route('/_bulk/alerts/status', methods=['OPTIONS', 'PUT'])
 @cross_origin()
 @permission(Scope.write_alerts)
@@ -1,8 +1,10 @@
 import json
 import unittest
+from datetime import datetime, timedelta
 from uuid import uuid4
 
 from alerta.app import alarm_model, create_app, db, plugins
+from alerta.models.alert import Alert
 
 
 class ActionsTestCase(unittest.TestCase):
@@ -242,3 +244,47 @@ class ActionsTestCase(unittest.TestCase):
         response = self.client.get('/alert/' + alert_id)
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['alert']['status'], 'open')
+
+    def test_unack_restores_previous_status(self):
+        """Test that unack restores the status and timeout before the ack even when it is no longer in history."""
+
+        # HISTORY_LIMIT is 5 in test config
+
+        # create alert
+        response = self.client.post('/alert', data=json.dumps(dict(self.major_alert, timeout=600)), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        alert_id = data['id']
+
+        # ack alert
+        response = self.client.put('/alert/' + alert_id + '/action',
+                                   data=json.dumps({'action': 'ack', 'timeout': 300}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.test_request_context('/'):
+            alert = Alert.find_by_id(alert_id)
+            self.assertEqual(alert.status, 'ack')
+            self.assertEqual(alert.previous_status, 'open')
+            self.assertEqual(alert.previous_timeout, 600)
+            self.assertAlmostEqual(alert.status_expire_time, datetime.utcnow() + timedelta(seconds=300), delta=timedelta(seconds=10))
+
+        # send enough duplicates to push the ack entry out of history
+        for i in range(10):
+            alert = dict(self.major_alert, timeout=600)
+            alert['value'] = str(i)
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        # unack should restore the status and timeout from before the ack
+        response = self.client.put('/alert/' + alert_id + '/action',
+                                   data=json.dumps({'action': 'unack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/alert/' + alert_id)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alert']['status'], 'open')
+        self.assertEqual(data['alert']['history'][0]['timeout'], 600)
+
+        with self.app.test_request_context('/'):
+            alert = Alert.find_by_id(alert_id)
+            self.assertIsNone(alert.previous_status)
+            self.assertIsNone(alert.status_expire_time)
@@ -1,9 +1,13 @@
+import base64
 import json
+import time
 import unittest
 from datetime import datetime
 from uuid import uuid4
 
 from alerta.app import alarm_model, create_app, db, plugins
+from alerta.commands import history as history_cmd
+from alerta.commands import summary as summary_cmd
 from alerta.models.alert import Alert
 from alerta.plugins import PluginBase
 from alerta.utils.api import process_alert
@@ -785,6 +789,238 @@ class AlertsTestCase(unittest.TestCase):
         self.assertEqual(data['alerts'][0]['rawData'], None)
         self.assertEqual(len(data['alerts'][0]['history']), 1)
 
+    def test_alerts_cursor(self):
+        # create alerts, some without a value
+        for i, severity in enumerate(['major', 'minor', 'major', 'critical', 'warning', 'minor', 'major']):
+            alert = {
+                'event': 'node_marginal',
+                'resource': f'{self.resource}-{i}',
+                'environment': 'Production',
+                'service': ['Network'],
+                'severity': severity,
+                'value': str(i % 3) if i % 2 else None,
+                'attributes': {'region': f'EU{i % 2}'}
+            }
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        for sort_by, sort_key in [
+            ('', None),
+            ('&sort-by=severity&sort-by=-value', lambda a: (a['severity'], a['value'])),
+            ('&sort-by=-lastReceiveTime', lambda a: a['lastReceiveTime']),
+            ('&sort-by=value&sort-by=attributes.region', lambda a: (a['value'], a['attributes']['region']))
+        ]:
+            response = self.client.get('/alerts?page-size=100' + sort_by)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            expected = data['alerts']
+            self.assertEqual(len(expected), 7)
+
+            alerts = []
+            cursor = ''
+            while cursor is not None:
+                response = self.client.get(f'/alerts?page-size=3&cursor={cursor}' + sort_by)
+                self.assertEqual(response.status_code, 200)
+                data = json.loads(response.data.decode('utf-8'))
+                self.assertEqual(data['total'], 7)
+                self.assertEqual(data['more'], data['nextCursor'] is not None)
+                alerts.extend(data['alerts'])
+                cursor = data['nextCursor']
+            self.assertEqual(sorted(a['id'] for a in alerts), sorted(a['id'] for a in expected))
+            if sort_key:
+                self.assertEqual([sort_key(a) for a in alerts], [sort_key(a) for a in expected])
+
+        response = self.client.get('/alerts/history?page-size=4&cursor=')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 4)
+        self.assertTrue(data['more'])
+        history = data['history']
+
+        response = self.client.get('/alerts/history?page-size=4&cursor=' + data['nextCursor'])
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 3)
+        self.assertFalse(data['more'])
+        history.extend(data['history'])
+        self.assertEqual(len({h['href'] for h in history}), 7)
+
+        # cursor must be valid and match the sort order
+        response = self.client.get('/alerts?cursor=foo')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/alerts?page-size=3&cursor=')
+        cursor = json.loads(response.data.decode('utf-8'))['nextCursor']
+        response = self.client.get('/alerts?sort-by=severity&cursor=' + cursor)
+        self.assertEqual(response.status_code, 400)
+
+    def test_alerts_count(self):
+        # create alerts
+        for i, severity in enumerate(['critical', 'minor', 'normal']):
+            alert = {
+                'event': 'node_marginal',
+                'resource': f'{self.resource}-{i}',
+                'environment': 'Production',
+                'service': ['Network'],
+                'severity': severity
+            }
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/alerts?count=exact&page-size=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['pages'], 2)
+        self.assertEqual(data['more'], True)
+        self.assertEqual(data['severityCounts'], {'critical': 1, 'minor': 1, 'normal': 1})
+        self.assertEqual(data['statusCounts'], {'open': 2, 'closed': 1})
+
+        response = self.client.get('/alerts/count')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['severityCounts'], {'critical': 1, 'minor': 1, 'normal': 1})
+        self.assertEqual(data['statusCounts'], {'open': 2, 'closed': 1})
+
+        response = self.client.get('/alerts?count=estimate&page-size=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertIsInstance(data['total'], int)
+        self.assertEqual(data['pages'], None)
+        self.assertEqual(data['more'], True)
+        self.assertEqual(data['severityCounts'], {})
+        self.assertEqual(len(data['alerts']), 2)
+
+        response = self.client.get('/alerts?count=none&page=2&page-size=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], None)
+        self.assertEqual(data['more'], False)
+        self.assertEqual(data['statusCounts'], {})
+        self.assertEqual(len(data['alerts']), 1)
+
+        response = self.client.get('/alerts?count=foo')
+        self.assertEqual(response.status_code, 400)
+
+    def test_alerts_updated_since(self):
+
+        self.app.config['UPDATED_SINCE_MARGIN'] = 0
+
+        alert_ids = []
+        for i, severity in enumerate(['critical', 'major', 'minor']):
+            alert = {
+                'event': 'node_marginal',
+                'resource': f'{self.resource}-{i}',
+                'environment': 'Production',
+                'service': ['Network'],
+                'severity': severity
+            }
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            alert_ids.append(json.loads(response.data.decode('utf-8'))['id'])
+
+        time.sleep(0.1)
+
+        # empty token returns all alerts
+        response = self.client.get('/alerts?status=open&updated-since=')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['alerts']), 3)
+        self.assertListEqual(data['removed'], [])
+        self.assertListEqual(data['deleted'], [])
+        token = data['nextUpdatedSince']
+
+        time.sleep(0.1)
+
+        response = self.client.put(f'/alert/{alert_ids[0]}/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/alert', data=json.dumps({
+            'event': 'node_marginal',
+            'resource': f'{self.resource}-1',
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'major',
+            'value': 'changed'
+        }), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.delete(f'/alert/{alert_ids[2]}')
+        self.assertEqual(response.status_code, 200)
+
+        # only changes since then
+        response = self.client.get(f'/alerts?status=open&updated-since={token}')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([a['id'] for a in data['alerts']], [alert_ids[1]])
+        self.assertEqual(data['alerts'][0]['value'], 'changed')
+        self.assertListEqual(data['removed'], [alert_ids[0]])
+        self.assertListEqual(data['deleted'], [alert_ids[2]])
+        token = data['nextUpdatedSince']
+
+        time.sleep(0.1)
+
+        response = self.client.get(f'/alerts?status=open&updated-since={token}')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual(data['alerts'], [])
+        self.assertListEqual(data['removed'], [])
+        self.assertListEqual(data['deleted'], [])
+
+        response = self.client.get('/alerts?updated-since=foo')
+        self.assertEqual(response.status_code, 400)
+
+        # deleted alerts are only known for TOMBSTONE_MAX_AGE seconds
+        token = base64.urlsafe_b64encode(b'{"since":"2000-01-01T00:00:00.000Z"}').decode('utf-8')
+        response = self.client.get(f'/alerts?updated-since={token}')
+        self.assertEqual(response.status_code, 410)
+
+    def test_alerts_etag(self):
+
+        self.app = create_app({
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'ETAG_ENABLED': True
+        })
+        self.client = self.app.test_client()
+
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        for url in ['/alerts?status=open', '/alerts/count', '/alerts/top10/count', '/environments', '/services', '/alerts/tags']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            self.assertTrue(etag.startswith('W/'))
+
+            # unchanged
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.headers['ETag'], etag)
+            self.assertEqual(response.data, b'')
+
+            # different query
+            response = self.client.get(url + ('&' if '?' in url else '?') + 'environment=Production', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/alerts?status=open')
+        etag = response.headers['ETag']
+
+        # changed by tag
+        response = self.client.put(f'/alert/{alert_id}/tag', data=json.dumps({'tags': ['bar']}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/alerts?status=open', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        etag = response.headers['ETag']
+
+        # changed by delete
+        response = self.client.delete(f'/alert/{alert_id}')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/alerts?status=open', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['total'], 0)
+
     def test_get_body(self):
         from flask import g
         with self.app.test_request_context('/'):
@@ -821,6 +1057,173 @@ class AlertsTestCase(unittest.TestCase):
             self.assertEqual(type(body['updateTime']), str)
 
 
+class AlertsSingleLookupTestCase(AlertsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('single lookup ingest only supported by postgres')
+        self.app.config['INGEST_SINGLE_LOOKUP'] = True
+
+
+class AlertsHistoryTableTestCase(AlertsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('history table only supported by postgres')
+        self.app.config['HISTORY_TABLE'] = True
+
+    def history_count(self, alert_id):
+        with self.app.test_request_context('/'):
+            cursor = db.get_db().cursor()
+            cursor.execute('SELECT COUNT(*) FROM alert_history WHERE alert_id=%s', (alert_id,))
+            return cursor.fetchone()[0]
+
+    def test_history_migration(self):
+
+        # create alert and history using history array
+        self.app.config['HISTORY_TABLE'] = False
+        response = self.client.post('/alert', data=json.dumps(self.fatal_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+        response = self.client.put('/alert/' + alert_id + '/status',
+                                   data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/alert/' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        history = json.loads(response.data.decode('utf-8'))['alert']['history']
+        self.assertEqual(len(history), 3)
+        self.assertEqual(self.history_count(alert_id), 0)
+
+        # move history to history table
+        result = self.app.test_cli_runner().invoke(history_cmd)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Moved history of 1 alerts', result.output)
+        self.assertEqual(self.history_count(alert_id), 3)
+
+        self.app.config['HISTORY_TABLE'] = True
+        response = self.client.get('/alert/' + alert_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['alert']['history'], history)
+
+        # history entries over the limit are deleted by housekeeping
+        for value in ['101', '102', '103']:
+            self.major_alert['value'] = value
+            response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([h['value'] for h in data['alert']['history']], [None, None, '101', '102', '103'])
+        self.assertEqual(self.history_count(alert_id), 6)
+
+        response = self.client.get('/management/housekeeping')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.history_count(alert_id), 5)
+        response = self.client.get('/alert/' + alert_id)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['alert']['history'], data['alert']['history'])
+
+        # only alerts with new history entries are checked by the next run
+        self.major_alert['value'] = '104'
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.history_count(alert_id), 6)
+        response = self.client.get('/management/housekeeping')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.history_count(alert_id), 5)
+
+
+class AlertsSummaryTestCase(AlertsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('alert summary only supported by postgres')
+        self.app = create_app({
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'ALERT_TIMEOUT': 120,
+            'HISTORY_LIMIT': 5,
+            'ALERT_SUMMARY': True
+        })
+        self.client = self.app.test_client()
+
+    def summary(self):
+        with self.app.test_request_context('/'):
+            cursor = db.get_db().cursor()
+            cursor.execute('SELECT environment, service, severity, status, count FROM alert_summary ORDER BY 1, 2, 3, 4')
+            return [tuple(r) for r in cursor.fetchall()]
+
+    def test_alert_summary(self):
+
+        response = self.client.post('/alert', data=json.dumps(self.fatal_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+        response = self.client.post('/alert', data=json.dumps(self.ok2_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/alert', data=json.dumps(dict(self.ok2_alert, environment='Development')), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        # duplicates don't change counts
+        response = self.client.post('/alert', data=json.dumps(self.fatal_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertListEqual(self.summary(), [
+            ('Development', ['Network'], 'ok', 'closed', 1),
+            ('Production', ['Network'], 'ok', 'closed', 1),
+            ('Production', ['Network', 'Shared'], 'critical', 'open', 1)
+        ])
+
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.put(f'/alert/{alert_id}/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(self.summary(), [
+            ('Development', ['Network'], 'ok', 'closed', 1),
+            ('Production', ['Network'], 'ok', 'closed', 1),
+            ('Production', ['Network', 'Shared'], 'major', 'ack', 1)
+        ])
+
+        response = self.client.get('/alerts/count?environment=Production')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 2)
+        self.assertDictEqual(data['severityCounts'], {'major': 1, 'ok': 1})
+        self.assertDictEqual(data['statusCounts'], {'ack': 1, 'closed': 1})
+
+        response = self.client.get('/alerts/count?service=Shared&status!=closed')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 1)
+
+        response = self.client.get('/services?environment=Production')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(
+            sorted((s['environment'], s['service'], s['count']) for s in data['services']),
+            [('Development', 'Network', 0), ('Production', 'Network', 2), ('Production', 'Shared', 1)]
+        )
+
+        # deleted alerts are no longer counted
+        response = self.client.delete(f'/alert/{alert_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(self.summary(), [
+            ('Development', ['Network'], 'ok', 'closed', 1),
+            ('Production', ['Network'], 'ok', 'closed', 1)
+        ])
+
+        # rebuild summary
+        with self.app.test_request_context('/'):
+            cursor = db.get_db().cursor()
+            cursor.execute('UPDATE alert_summary SET count = 5')
+            db.get_db().commit()
+        result = self.app.test_cli_runner().invoke(summary_cmd)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Rebuilt alert summary with 2 groups', result.output)
+        self.assertEqual(self.summary()[0][4], 1)
+
+
 class DummyRemoteIPPlugin(PluginBase):
 
     def pre_receive(self, alert, **kwargs):
@@ -4,7 +4,7 @@ import unittest
 
 from mohawk import Sender
 
-from alerta.app import create_app, db, plugins
+from alerta.app import create_app, db, key_cache, plugins
 from alerta.models.enums import Scope
 from alerta.models.key import ApiKey
 from alerta.models.token import Jwt
@@ -588,3 +588,100 @@ class AuthTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 201)
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['alert']['event'], 'Foo')
+
+
+class ApiKeyCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': True,
+            'ADMIN_USERS': ['admin@alerta.io'],
+            'API_KEY_CACHE_TTL': 60,
+            'API_KEY_USAGE_FLUSH_INTERVAL': 3600
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        with self.app.test_request_context('/'):
+            self.app.preprocess_request()
+            self.api_key = ApiKey(
+                user='admin@alerta.io',
+                scopes=[Scope.admin, Scope.read, Scope.write],
+                text='Demo API key - not for production use',
+                key='demo-key'
+            )
+            self.api_key.create()
+
+        self.headers = {
+            'Authorization': f'Key {self.api_key.key}',
+            'Content-type': 'application/json'
+        }
+
+    def tearDown(self):
+        db.destroy()
+
+    def test_cached_key_usage(self):
+
+        for _ in range(3):
+            response = self.client.get('/alerts', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+
+        # buffered usage is written before keys are listed
+        response = self.client.get('/key/' + self.api_key.key, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['key']['count'], 4)
+        self.assertIsNotNone(data['key']['lastUsedTime'])
+
+        response = self.client.get('/management/status', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        metrics = {m['name']: m for m in data['metrics'] if m['group'] == 'auth'}
+        self.assertEqual(metrics['key_cache_size']['value'], 1)
+        self.assertGreaterEqual(metrics['key_cache_hits']['count'], 4)
+        self.assertGreaterEqual(metrics['key_cache_misses']['count'], 1)
+
+    def test_key_usage_at_exit(self):
+
+        response = self.client.get('/alerts', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        # buffered usage is written when the process exits
+        key_cache._flush_at_exit()
+        self.assertEqual(key_cache.usage, {})
+        with self.app.app_context():
+            self.assertEqual(ApiKey.find_by_id(self.api_key.key).count, 1)
+
+    def test_revoked_key(self):
+
+        payload = {
+            'user': 'rw-demo-key-user',
+            'type': 'read-write'
+        }
+        response = self.client.post('/key', data=json.dumps(payload), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        rw_headers = {'Authorization': 'Key ' + data['key']}
+
+        response = self.client.get('/alerts', headers=rw_headers)
+        self.assertEqual(response.status_code, 200)
+
+        # expired keys are rejected even if cached
+        update = {'expireTime': '2022-12-31T23:59:59.999Z'}
+        response = self.client.put('/key/' + data['key'], data=json.dumps(update), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/alerts', headers=rw_headers)
+        self.assertEqual(response.status_code, 401)
+
+        # deleted keys are removed from the cache
+        response = self.client.get('/alerts', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.delete('/key/' + self.api_key.key, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/alerts', headers=self.headers)
+        self.assertEqual(response.status_code, 401)
@@ -4,8 +4,10 @@ import time
 import unittest
 from datetime import datetime, timedelta
 
-from alerta.app import create_app, db, plugins
+from alerta.app import blackout_index, create_app, db, plugins
 from alerta.exceptions import BlackoutPeriod
+from alerta.models.alert import Alert
+from alerta.models.blackout import Blackout as BlackoutPeriodModel
 from alerta.models.key import ApiKey
 from alerta.plugins import PluginBase
 from alerta.utils.format import DateTime
@@ -902,6 +904,44 @@ class BlackoutsTestCase(unittest.TestCase):
         self.assertIsInstance(DateTime.parse(data['blackout']['createTime']), datetime)
         self.assertEqual(data['blackout']['text'], 'administratively down')
 
+    def test_blackout_index(self):
+
+        with self.app.test_request_context('/'):
+            self.app.preprocess_request()
+
+            prod_alert = Alert.parse(self.prod_alert)
+            dev_alert = Alert.parse(self.dev_alert)
+            self.assertFalse(prod_alert.is_blackout())
+
+            # index is rebuilt when blackout is created by this process
+            start_time = datetime.utcnow() - timedelta(minutes=1)
+            blackout = BlackoutPeriodModel(environment='Production', service=['Web'], start_time=start_time).create()
+            self.assertTrue(prod_alert.is_blackout())
+            self.assertFalse(dev_alert.is_blackout())
+
+            # blackout created by another process is not seen until index is refreshed
+            db.create_blackout(BlackoutPeriodModel(environment='Development', start_time=start_time))
+            if self.app.config['BLACKOUT_CACHE_TTL']:
+                self.assertFalse(dev_alert.is_blackout())
+            blackout_index.invalidate()
+            self.assertTrue(dev_alert.is_blackout())
+
+            # alerts created before the blackout started are not suppressed
+            prod_alert.create_time = datetime.utcnow() - timedelta(minutes=5)
+            self.assertFalse(prod_alert.is_blackout())
+
+            blackout.delete()
+            prod_alert.create_time = datetime.utcnow()
+            self.assertFalse(prod_alert.is_blackout())
+
+
+class BlackoutsNoIndexTestCase(BlackoutsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['BLACKOUT_CACHE_TTL'] = 0
+        blackout_index.init_app(self.app)
+
 
 class Blackout(PluginBase):
 
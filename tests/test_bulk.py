@@ -0,0 +1,173 @@
+import json
+import unittest
+from uuid import uuid4
+
+from alerta.app import create_app, db
+from alerta.models.alert import Alert
+
+
+class BulkReceiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'HISTORY_LIMIT': 5
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('bulk receive only tested against postgres')
+
+        self.resource = str(uuid4()).upper()[:8]
+
+        self.major_alert = {
+            'event': 'node_marginal',
+            'resource': self.resource,
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'major',
+            'correlate': ['node_down', 'node_marginal', 'node_up'],
+            'value': '95%',
+            'tags': ['foo']
+        }
+        self.critical_alert = {
+            'event': 'node_down',
+            'resource': self.resource,
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'critical',
+            'correlate': ['node_down', 'node_marginal', 'node_up'],
+            'tags': ['bar']
+        }
+        self.other_alert = {
+            'event': 'disk_full',
+            'resource': str(uuid4()).upper()[:8],
+            'environment': 'Development',
+            'service': ['Storage'],
+            'severity': 'minor'
+        }
+        self.rejected_alert = {
+            'event': 'node_down',
+            'resource': self.resource,
+            'environment': 'Testing',  # environment not allowed
+            'service': ['Network'],
+            'severity': 'critical'
+        }
+        self.heartbeat_alert = {
+            'event': 'Heartbeat',
+            'resource': 'net01',
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'informational',
+            'origin': 'test/bulk',
+            'timeout': 600
+        }
+
+        self.headers = {
+            'Content-type': 'application/json'
+        }
+
+    def tearDown(self):
+        db.destroy()
+
+    def test_bulk_receive(self):
+
+        # create, duplicate and correlate in a single batch
+        alerts = [self.major_alert, self.other_alert, self.major_alert, self.critical_alert]
+        response = self.client.post('/alerts/_bulk', data=json.dumps(alerts), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(data['errors'], 0)
+        self.assertEqual([r['code'] for r in data['results']], [201, 201, 201, 201])
+
+        created, other, duplicate, correlated = [r['alert'] for r in data['results']]
+        self.assertEqual(created['duplicateCount'], 0)
+        self.assertEqual(created['repeat'], False)
+        self.assertEqual(duplicate['id'], created['id'])
+        self.assertEqual(duplicate['duplicateCount'], 1)
+        self.assertEqual(duplicate['repeat'], True)
+        self.assertNotEqual(other['id'], created['id'])
+        self.assertEqual(correlated['id'], created['id'])
+        self.assertEqual(correlated['event'], 'node_down')
+        self.assertEqual(correlated['severity'], 'critical')
+        self.assertEqual(correlated['previousSeverity'], 'major')
+        self.assertEqual(correlated['trendIndication'], 'moreSevere')
+        self.assertEqual(correlated['duplicateCount'], 0)
+        self.assertEqual(sorted(correlated['tags']), ['bar', 'foo'])
+        self.assertEqual([h['type'] for h in correlated['history']], ['new', 'severity'])
+
+        # duplicate of an existing alert
+        response = self.client.post('/alerts/_bulk', data=json.dumps([self.critical_alert]), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['results'][0]['id'], created['id'])
+        self.assertEqual(data['results'][0]['alert']['duplicateCount'], 1)
+
+        response = self.client.get('/alert/' + created['id'])
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alert']['severity'], 'critical')
+        self.assertEqual(data['alert']['duplicateCount'], 1)
+
+    def test_bulk_receive_ndjson(self):
+
+        body = '\n'.join(json.dumps(a) for a in [self.major_alert, self.other_alert]) + '\n'
+        response = self.client.post('/alerts/_bulk', data=body, headers={'Content-type': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([r['code'] for r in data['results']], [201, 201])
+
+        # ndjson is only accepted by the bulk endpoint
+        response = self.client.post('/alert', data=body, headers={'Content-type': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 415)
+
+    def test_bulk_receive_partial(self):
+
+        alerts = [self.rejected_alert, {'event': 'no_resource'}, self.heartbeat_alert, self.major_alert]
+        response = self.client.post('/alerts/_bulk', data=json.dumps(alerts), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['errors'], 2)
+        self.assertEqual([r['code'] for r in data['results']], [403, 400, 202, 201])
+        self.assertEqual(data['results'][0]['status'], 'error')
+        self.assertEqual(data['results'][2]['status'], 'ok')
+
+        response = self.client.get('/alerts?resource=' + self.resource)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 1)
+
+        response = self.client.get('/heartbeats')
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['total'], 1)
+
+    def test_bulk_receive_failed(self):
+
+        # timeout is too big for the database so the whole batch fails
+        alerts = [self.other_alert, dict(self.major_alert, timeout=2 ** 40)]
+        response = self.client.post('/alerts/_bulk', data=json.dumps(alerts), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([r['code'] for r in data['results']], [500, 500])
+
+        # connection is not left in a failed transaction
+        with self.app.test_request_context('/'):
+            with self.assertRaises(Exception):
+                Alert.ingest_many([Alert.parse(a) for a in alerts])
+            cursor = db.get_db().cursor()
+            cursor.execute('SELECT COUNT(*) FROM alerts')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_bulk_receive_invalid(self):
+
+        response = self.client.post('/alerts/_bulk', data=json.dumps(self.major_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/alerts/_bulk', data=json.dumps([]), headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/alerts/_bulk', data='{"foo":\n', headers={'Content-type': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 400)
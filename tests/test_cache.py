@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+import unittest
+from uuid import uuid4
+
+from flask import g
+
+from alerta.app import create_app, db, response_cache
+from alerta.utils.response import cached
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'RESPONSE_CACHE_TTL': 1
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        self.alert = {
+            'event': 'node_down',
+            'resource': str(uuid4()).upper()[:8],
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'major'
+        }
+
+        self.headers = {
+            'Content-type': 'application/json'
+        }
+
+    def tearDown(self):
+        db.destroy()
+
+    def test_cached_response(self):
+
+        response = self.client.post('/alert', data=json.dumps(self.alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get('/environments')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([e['environment'] for e in data['environments']], ['Production'])
+
+        response = self.client.post('/alert', data=json.dumps(dict(self.alert, environment='Development')), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+        # cached until it expires
+        hits = response_cache.counters['hit'].count
+        response = self.client.get('/environments')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([e['environment'] for e in data['environments']], ['Production'])
+        self.assertEqual(response_cache.counters['hit'].count, hits + 1)
+
+        # different query
+        response = self.client.get('/environments?status=open')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['environments']), 2)
+
+        time.sleep(1.1)
+
+        response = self.client.get('/environments')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(data['environments']), 2)
+
+    def test_cached_scopes(self):
+
+        lookups = []
+
+        @cached
+        def view():
+            lookups.append(g.scopes)
+            return {'status': 'ok'}
+
+        # responses are not shared by users with different scopes
+        for scopes in [['read:alerts'], ['read:alerts'], ['read:alerts', 'admin:alerts']]:
+            with self.app.test_request_context('/scopes-test'):
+                g.customers = []
+                g.scopes = scopes
+                view()
+
+        self.assertListEqual(lookups, [['read:alerts'], ['read:alerts', 'admin:alerts']])
+
+    def test_coalesced_queries(self):
+
+        lookups = []
+        results = []
+
+        def lookup():
+            lookups.append(1)
+            time.sleep(0.5)
+            return ['data', 'application/json']
+
+        def query():
+            with self.app.app_context():
+                results.append(response_cache.get_or_set('coalesce-test', lookup))
+
+        coalesced = response_cache.counters['coalesced'].count
+        threads = [threading.Thread(target=query) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(lookups), 1)
+        self.assertListEqual(results, [['data', 'application/json']] * 5)
+        self.assertEqual(response_cache.counters['coalesced'].count, coalesced + 4)
@@ -1,8 +1,10 @@
 import unittest
 
 from alerta.commands import create_app
+from alerta.commands import housekeeping as housekeeping_cmd
 from alerta.commands import key as key_cmd
 from alerta.commands import keys as keys_cmd
+from alerta.commands import triggers as triggers_cmd
 from alerta.commands import user as user_cmd
 from alerta.commands import users as users_cmd
 
@@ -41,3 +43,18 @@ class CommandsTestCase(unittest.TestCase):
         result = self.runner.invoke(users_cmd)
         self.assertEqual(result.exit_code, 0)
         self.assertIn('me@work.com', result.output.strip())
+
+    def test_housekeeping_cmd(self):
+
+        result = self.runner.invoke(housekeeping_cmd)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Expired 0, unshelved 0 and unacked 0 alerts', result.output.strip())
+
+    def test_triggers_cmd(self):
+
+        result = self.runner.invoke(triggers_cmd, ['--drop', 'stream'])
+        if self.app.config['DATABASE_URL'].startswith('mongodb'):
+            self.assertEqual(result.exit_code, 2)
+        else:
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('Dropped 3 stream triggers', result.output.strip())
@@ -1,12 +1,16 @@
 import json
+import os
+import tempfile
+import time
 import unittest
 from uuid import uuid4
 
 import requests_mock
 
-from alerta.app import create_app, db, plugins
+from alerta.app import create_app, db, plugin_executor, plugins
 from alerta.models.enums import Scope
 from alerta.models.key import ApiKey
+from alerta.plugins.forwarder import Forward
 from alerta.utils.response import base_url
 
 
@@ -126,8 +130,7 @@ class ForwarderTestCase(unittest.TestCase):
         self.assertEqual(data['status'], 'ok')
 
         history = m.request_history
-        self.assertEqual(history[0].port, 9000)
-        self.assertEqual(history[1].port, 9003)
+        self.assertCountEqual([h.port for h in history], [9000, 9003])
 
     @requests_mock.mock()
     def test_forward_action(self, m):
@@ -165,12 +168,10 @@ class ForwarderTestCase(unittest.TestCase):
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(data['status'], 'ok')
 
+        # remotes are sent requests at the same time
         history = m.request_history
-        self.assertEqual(history[0].port, 9000)
-        self.assertEqual(history[1].port, 9003)
-        self.assertEqual(history[2].port, 9000)
-        self.assertEqual(history[3].port, 9001)
-        self.assertEqual(history[4].port, 9003)
+        self.assertCountEqual([h.port for h in history[:2]], [9000, 9003])
+        self.assertCountEqual([h.port for h in history[2:]], [9000, 9001, 9003])
 
     @requests_mock.mock()
     def test_forward_delete(self, m):
@@ -207,10 +208,164 @@ class ForwarderTestCase(unittest.TestCase):
         self.assertEqual(data['status'], 'ok')
 
         history = m.request_history
-        self.assertEqual(history[0].port, 9000)
-        self.assertEqual(history[1].port, 9003)
-        self.assertEqual(history[2].port, 9002)
-        self.assertEqual(history[3].port, 9003)
+        self.assertCountEqual([h.port for h in history[:2]], [9000, 9003])
+        self.assertCountEqual([h.port for h in history[2:]], [9002, 9003])
+
+    @requests_mock.mock()
+    def test_forward_async(self, m):
+
+        self.app.config['ASYNC_PLUGINS'] = ['forwarder']
+
+        ok_response = """
+        {"status": "ok"}
+        """
+        m.post('http://localhost:9000/alert', text=ok_response)
+        m.post('http://localhost:9003/alert', text=ok_response)
+
+        headers = {
+            'Authorization': f'Key {self.api_key.key}',
+            'Content-type': 'application/json',
+            'X-Alerta-Loop': 'http://localhost:9003'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        plugin_executor.join()
+
+        # forwarded in the background using the loop header and base url of the request
+        self.assertEqual(plugin_executor.stats.get('failed', 0), 0)
+        self.assertEqual([h.port for h in m.request_history], [9000])
+        self.assertEqual(m.request_history[0].headers['X-Alerta-Loop'], 'http://localhost:9003,http://localhost:8080')
+
+    @requests_mock.mock()
+    def test_forward_batch(self, m):
+
+        self.app.config['FWD_BATCH_SIZE'] = 2
+        self.app.config['FWD_DESTINATIONS'] = [
+            ('http://localhost:9000', {'username': 'user', 'password': 'pa55w0rd'}, ['alerts', 'bulk']),
+            ('http://localhost:9003', {'token': 'bearer-token'}, ['*']),
+        ]
+
+        ok_response = """
+        {"status": "ok"}
+        """
+        m.post('http://localhost:9000/alerts/_bulk', text=ok_response)
+        m.post('http://localhost:9003/alert', text=ok_response)
+
+        headers = {
+            'Authorization': f'Key {self.api_key.key}',
+            'Content-type': 'application/json'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/alert', data=json.dumps(dict(self.normal_alert, resource='other')), headers=headers)
+        self.assertEqual(response.status_code, 201)
+
+        bulk = [h for h in m.request_history if h.port == 9000]
+        self.assertEqual(len(bulk), 1)
+        self.assertEqual(bulk[0].path, '/alerts/_bulk')
+        self.assertListEqual([a['resource'] for a in bulk[0].json()], [self.resource, 'other'])
+        self.assertEqual(bulk[0].headers['X-Alerta-Loop'], 'http://localhost:8080')
+        self.assertEqual(len([h for h in m.request_history if h.port == 9003]), 2)
+
+    @requests_mock.mock()
+    def test_forward_retry(self, m):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.app.config['FWD_RETRY_QUEUE'] = os.path.join(tmpdir, 'forwarder.db')
+            self.app.config['FWD_RETRY_INTERVAL'] = 0
+
+            ok_response = """
+            {"status": "ok"}
+            """
+            m.post('http://localhost:9000/alert', [{'status_code': 503}, {'status_code': 201, 'text': ok_response}])
+            m.post('http://localhost:9003/alert', text=ok_response)
+
+            headers = {
+                'Authorization': f'Key {self.api_key.key}',
+                'Content-type': 'application/json'
+            }
+            response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+            self.assertEqual(response.status_code, 201)
+
+            # failed forward is retried in the background
+            for _ in range(50):
+                if len([h for h in m.request_history if h.port == 9000]) == 2:
+                    break
+                time.sleep(0.1)
+            retries = [h for h in m.request_history if h.port == 9000]
+            self.assertEqual(len(retries), 2)
+            self.assertEqual(retries[0].json(), retries[1].json())
+            self.assertEqual(retries[1].headers['X-Alerta-Loop'], 'http://localhost:8080')
+            self.assertEqual(len([h for h in m.request_history if h.port == 9003]), 1)
+
+    @requests_mock.mock()
+    def test_forward_batch_close(self, m):
+
+        self.app.config['FWD_BATCH_SIZE'] = 2
+        self.app.config['FWD_BATCH_INTERVAL'] = 60
+        self.app.config['FWD_DESTINATIONS'] = [
+            ('http://localhost:9000', {'username': 'user', 'password': 'pa55w0rd'}, ['alerts', 'bulk']),
+        ]
+
+        m.post('http://localhost:9000/alerts/_bulk', text='{"status": "ok"}')
+
+        headers = {
+            'Authorization': f'Key {self.api_key.key}',
+            'Content-type': 'application/json'
+        }
+        response = self.client.post('/alert', data=json.dumps(self.major_alert), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(m.request_history), 0)
+
+        # alerts waiting for a batch are sent when the plugin is closed
+        plugins.plugins['forwarder'].close()
+        self.assertEqual(len(m.request_history), 1)
+        self.assertEqual(m.request_history[0].path, '/alerts/_bulk')
+        self.assertListEqual([a['resource'] for a in m.request_history[0].json()], [self.resource])
+
+    @requests_mock.mock()
+    def test_forward_retry_auth(self, m):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.app.config['FWD_RETRY_QUEUE'] = os.path.join(tmpdir, 'forwarder.db')
+            self.app.config['FWD_RETRY_INTERVAL'] = 0
+
+            m.post('http://localhost:9004/alert', [{'status_code': 503}, {'status_code': 201, 'text': '{"status": "ok"}'}])
+
+            # remotes added by routing rules are not in FWD_DESTINATIONS so retries use the auth of the forward
+            forwarder = plugins.plugins['forwarder']
+            with self.app.app_context():
+                forwarder._setup(config=self.app.config)
+                forwarder._forward([Forward('http://localhost:9004', 'post', '/alert', {'resource': self.resource},
+                                            {'X-Alerta-Loop': 'http://localhost:8080'}, {'key': 'rule-key'})])
+
+            for _ in range(50):
+                if len(m.request_history) == 2:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(m.request_history), 2)
+            self.assertEqual(m.request_history[1].headers['Authorization'], 'Key rule-key')
+            forwarder.close()
+
+    def test_forward_clients(self):
+
+        self.app.config['FWD_BATCH_SIZE'] = 2
+        forwarder = plugins.plugins['forwarder']
+        with self.app.app_context():
+            forwarder._setup(config=self.app.config)
+
+            # clients are not shared by remotes with different credentials
+            client = forwarder._client('http://localhost:9000')
+            self.assertIs(forwarder._client('http://localhost:9000', {'username': 'user', 'password': 'pa55w0rd', 'timeout': 10}), client)
+            self.assertIsNot(forwarder._client('http://localhost:9000', {'username': 'other', 'password': 'pa55w0rd'}), client)
+
+        # background worker and thread pool are stopped when plugins are registered again
+        create_app({'TESTING': True, 'PLUGINS': ['forwarder']})
+        self.assertIsNot(plugins.plugins['forwarder'], forwarder)
+        forwarder.worker.join(timeout=5)
+        self.assertFalse(forwarder.worker.is_alive())
+        with self.assertRaises(RuntimeError):
+            forwarder.executor.submit(time.sleep, 0)
 
     @requests_mock.mock()
     def test_forward_heartbeat(self, m):
@@ -797,6 +797,15 @@ class Isa182TestCase(unittest.TestCase):
         self.assertEqual(data['alert']['trendIndication'], 'lessSevere')
 
 
+class Isa182SingleLookupTestCase(Isa182TestCase):
+
+    def setUp(self):
+        super().setUp()
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('single lookup ingest only supported by postgres')
+        self.app.config['INGEST_SINGLE_LOOKUP'] = True
+
+
 class NotificationBlackout(PluginBase):
 
     def pre_receive(self, alert, **kwargs):
@@ -1,9 +1,11 @@
 import json
+import os
+import tempfile
 import unittest
 
 import requests_mock
 
-from alerta.app import create_app, db
+from alerta.app import audit, create_app, db
 
 
 class LoggingTestCase(unittest.TestCase):
@@ -46,6 +48,9 @@ class LoggingTestCase(unittest.TestCase):
         response = self.client.delete('/blackout/' + blackout_id, content_type='application/json')
         self.assertEqual(response.status_code, 200)
 
+        # audit events are sent in the background
+        audit.shipper.join()
+
         create_blackout_request = json.loads(m.request_history[0].text)
 
         self.assertEqual(create_blackout_request['event'], 'blackout-created')
@@ -66,3 +71,112 @@ class LoggingTestCase(unittest.TestCase):
         self.assertTrue(delete_blackout_request['request']['url'].startswith('http://localhost/blackout/'))
         self.assertEqual(delete_blackout_request['request']['data'], None)
         self.assertTrue(delete_blackout_request['request']['userAgent'].startswith('Werkzeug/'), delete_blackout_request)
+
+
+class AuditShippingTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.spill_dir = tempfile.TemporaryDirectory()
+
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'AUDIT_TRAIL': ['write'],
+            'AUDIT_URL': 'https://logs.alerta.dev',
+            'AUDIT_URL_FORMAT': 'ndjson',
+            'AUDIT_RETRY_MAX_ATTEMPTS': 1,
+            'AUDIT_SPILL_DIR': self.spill_dir.name
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.destroy()
+        self.spill_dir.cleanup()
+
+    @requests_mock.mock()
+    def test_audit_spill(self, m):
+
+        # collector is down
+        m.post('https://logs.alerta.dev', status_code=503)
+
+        response = self.client.post('/blackout', json={'environment': 'Production'})
+        self.assertEqual(response.status_code, 201)
+        audit.shipper.join()
+
+        self.assertEqual(audit.shipper.stats['spilled'], 1)
+        self.assertEqual(len(os.listdir(self.spill_dir.name)), 1)
+
+        # collector is back up
+        m.post('https://logs.alerta.dev', status_code=200)
+
+        response = self.client.post('/blackout', json={'environment': 'Development'})
+        self.assertEqual(response.status_code, 201)
+        audit.shipper.join()
+
+        self.assertEqual(audit.shipper.stats['sent'], 2)
+        self.assertEqual(os.listdir(self.spill_dir.name), [])
+
+        events = [json.loads(line) for h in m.request_history[1:] for line in h.text.splitlines()]
+        self.assertEqual(m.request_history[-1].headers['Content-Type'], 'application/x-ndjson')
+        self.assertCountEqual([json.loads(e['request']['data'])['environment'] for e in events], ['Development', 'Production'])
+
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('alerta_audit_sent_total 2', response.data.decode('utf-8'))
+
+    def test_audit_spill_at_exit(self):
+
+        # events still queued when the process exits are spilled, eg. the collector is slow
+        shipper = audit.shipper
+        shipper.pid = os.getpid()
+        shipper.queue.put_nowait(json.dumps({'event': 'blackout-created'}))
+        shipper.app.config['AUDIT_TIMEOUT'] = 0.1
+        shipper._drain_at_exit()
+
+        self.assertEqual(shipper.stats['spilled'], 1)
+        self.assertEqual(shipper.queue_depth, 0)
+        with open(os.path.join(self.spill_dir.name, os.listdir(self.spill_dir.name)[0])) as f:
+            self.assertEqual(json.loads(f.read())['event'], 'blackout-created')
+
+
+class QueryTracingTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'DATABASE_TRACE_QUERIES': True,
+            'DATABASE_TRACE_STATEMENT_LENGTH': 40
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('query tracing only supported by postgres')
+
+    def tearDown(self):
+        db.destroy()
+
+    def test_trace_queries(self):
+
+        with self.assertLogs(self.app.logger, level='INFO') as cm:
+            response = self.client.get('/alerts')
+            self.assertEqual(response.status_code, 200)
+
+        traced = [r.getMessage() for r in cm.records if r.getMessage().startswith('Query took')]
+        self.assertTrue(traced)
+        self.assertRegex(traced[0], r'^Query took \d+\.\dms \(\d+ rows\): SELECT')
+        self.assertTrue(traced[0].endswith('...'))
+
+    def test_slow_query(self):
+
+        db.slow_query_threshold = 1
+
+        with self.assertLogs(self.app.logger, level='WARNING') as cm:
+            with self.app.app_context():
+                db._fetchone('SELECT pg_sleep(0.01)', {})
+
+        self.assertRegex(cm.output[0], r'Slow query took \d+\.\dms \(1 rows\): SELECT pg_sleep')
@@ -1,9 +1,12 @@
 import json
+import threading
 import time
 import unittest
 from uuid import uuid4
 
-from alerta.app import create_app, db
+from alerta.app import audit, create_app, db, plugins, scheduler
+from alerta.exceptions import RejectException
+from alerta.plugins import PluginBase
 from tests.helpers.utils import mod_env
 
 
@@ -309,6 +312,22 @@ class ManagementTestCase(unittest.TestCase):
             if metric['name'] == 'total':
                 self.assertGreaterEqual(metric['value'], 1)
 
+    def test_status_pool_metrics(self):
+
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('connection pool statistics only supported by postgres')
+
+        for _ in range(3):
+            response = self.client.get('/management/status', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+
+        pool = {m['name']: m for m in data['metrics'] if m['group'] == 'database'}
+        self.assertEqual(pool['pool_checked_out']['value'], 1)  # connection used by this request
+        self.assertEqual(pool['pool_waiting']['value'], 0)
+        self.assertGreaterEqual(pool['pool_created']['count'], 1)
+        self.assertLessEqual(pool['pool_created']['count'], 2)  # connections reused across requests
+
     def test_housekeeping_not_capped_by_page_size(self):
         """Test that housekeeping expires all alerts, not just DEFAULT_PAGE_SIZE. Fixes #1553."""
 
@@ -340,7 +359,175 @@ class ManagementTestCase(unittest.TestCase):
         expired_count = len(data.get('expired', []))
         self.assertGreaterEqual(expired_count, 10, f'Expected >= 10 expired, got {expired_count}. DEFAULT_PAGE_SIZE cap still active.')
 
+    def test_housekeeping_batches(self):
+
+        self.app.config['HOUSEKEEPING_BATCH_SIZE'] = 3
+
+        for i in range(7):
+            alert = dict(self.expired_alert, resource=f'res-{uuid4().hex[:8]}', timeout=1)
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        time.sleep(2)
+
+        # no time left to process any alerts
+        self.app.config['HOUSEKEEPING_TIME_BUDGET'] = 0.000001
+        response = self.client.get('/management/housekeeping', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 0)
+
+        # only one process runs housekeeping at a time
+        self.app.config['HOUSEKEEPING_TIME_BUDGET'] = 50
+        locked, done = threading.Event(), threading.Event()
+
+        def hold_lock():
+            with self.app.app_context():
+                if db.acquire_lock('housekeeping', ttl=60):
+                    locked.set()
+                    done.wait(10)
+                    db.release_lock('housekeeping')
+
+        t = threading.Thread(target=hold_lock)
+        t.start()
+        self.assertTrue(locked.wait(10))
+        response = self.client.get('/management/housekeeping', headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+        done.set()
+        t.join()
+
+        # remaining alerts processed in batches by the scheduler
+        result = scheduler.run_once()
+        self.assertEqual(len(result[0]), 7)
+        self.assertListEqual(result[3], [])
+
+        response = self.client.get('/management/status', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        metrics = {m['name']: m for m in data['metrics'] if m['group'] == 'housekeeping'}
+        self.assertGreaterEqual(metrics['runs']['count'], 2)
+        self.assertGreaterEqual(metrics['expired']['count'], 7)
+        self.assertGreaterEqual(metrics['incomplete']['count'], 1)
+
+    def test_housekeeping_lock(self):
+
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('lock is held by the process (MongoDB only)')
+
+        def try_lock():
+            result = []
+
+            def lock():
+                with self.app.app_context():
+                    result.append(db.acquire_lock('housekeeping', ttl=60))
+                    if result[0]:
+                        db.release_lock('housekeeping')
+
+            t = threading.Thread(target=lock)
+            t.start()
+            t.join()
+            return result[0]
+
+        # lock is not held by the pooled connection returned at the end of the request
+        with self.app.app_context():
+            self.assertTrue(db.acquire_lock('housekeeping', ttl=60))
+        self.assertFalse(try_lock())
+
+        with self.app.app_context():
+            self.assertTrue(db.release_lock('housekeeping'))
+        self.assertTrue(try_lock())
+
+    def test_housekeeping_rejected(self):
+
+        self.app.config['HOUSEKEEPING_BATCH_SIZE'] = 2
+        self.app.config['AUDIT_TRAIL'] = ['write']
+        self.app.config['AUDIT_LOG'] = True
+        audit.init_app(self.app)
+        plugins.plugins['reject_expire'] = RejectExpire()
+
+        # more alerts are rejected than fit in a batch
+        for tags in [['reject'], ['reject'], ['reject'], [], []]:
+            alert = dict(self.expired_alert, resource=f'res-{uuid4().hex[:8]}', tags=tags, timeout=1)
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        time.sleep(2)
+
+        # alerts rejected by a plugin are only tried once by each run, outside of a request
+        try:
+            with self.assertLogs(self.app.logger, level='INFO') as logs:
+                result = scheduler.run_once()
+        finally:
+            del plugins.plugins['reject_expire']
+        self.assertEqual(len(result[0]), 2)
+        self.assertListEqual(result[3], ['expire rejected'] * 3)
+        events = [json.loads(r.getMessage()) for r in logs.records if r.getMessage().startswith('{')]
+        self.assertCountEqual([e['event'] for e in events], ['alert-expire-rejected'] * 3 + ['alert-expired'] * 2)
+        self.assertIsNone(events[0]['request'])
+
+    def test_housekeeping_bulk(self):
+
+        self.app.config['HOUSEKEEPING_BATCH_SIZE'] = 2
+        self.app.config['HOUSEKEEPING_BULK'] = True
+
+        for i in range(3):
+            alert = dict(self.expired_alert, resource=f'res-{uuid4().hex[:8]}', timeout=1)
+            response = self.client.post('/alert', data=json.dumps(alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+
+        ids = {}
+        for action in ['ack', 'shelve']:
+            response = self.client.post('/alert', data=json.dumps(self.shelved_alert), headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+            alert_id = json.loads(response.data.decode('utf-8'))['id']
+            response = self.client.put(f'/alert/{alert_id}/action', data=json.dumps({'action': action, 'timeout': 1}),
+                                       headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            ids[action] = alert_id
+            self.shelved_alert['resource'] = f'res-{uuid4().hex[:8]}'
+
+        time.sleep(2)
+
+        response = self.client.get('/management/housekeeping', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(len(data['expired']), 3)
+        self.assertListEqual(data['unshelve'], [ids['shelve']])
+        self.assertListEqual(data['unack'], [ids['ack']])
+
+        for alert_id in ids.values():
+            response = self.client.get(f'/alert/{alert_id}', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(data['alert']['status'], 'open')
+            self.assertEqual(data['alert']['history'][-1]['type'], 'timeout')
+            self.assertEqual(data['alert']['history'][-1]['status'], 'open')
+
+        # nothing left to do
+        response = self.client.get('/management/housekeeping', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['count'], 0)
+
     def test_prometheus(self):
 
         response = self.client.get('/management/metrics')
         self.assertEqual(response.status_code, 200)
+
+
+class RejectExpire(PluginBase):
+
+    def pre_receive(self, alert, **kwargs):
+        return alert
+
+    def post_receive(self, alert, **kwargs):
+        return
+
+    def status_change(self, alert, status, text, **kwargs):
+        return
+
+    def take_action(self, alert, action, text, **kwargs):
+        if action == 'expired' and 'reject' in alert.tags:
+            raise RejectException('expire rejected')
+        return alert, action, text
@@ -1,8 +1,9 @@
+import json
 import time
 import unittest
 
 from alerta.app import create_app, db
-from alerta.models.metrics import Gauge, Timer
+from alerta.models.metrics import Counter, Gauge, Timer, metrics_buffer
 
 
 class MetricsTestCase(unittest.TestCase):
@@ -42,3 +43,91 @@ class MetricsTestCase(unittest.TestCase):
         data = response.data.decode('utf-8')
         self.assertRegex(data, r'alerta_alerts_total \d+')
         self.assertRegex(data, r'alerta_uptime_msecs \d+')
+
+    def test_timer_histogram(self):
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+
+            test_timer = Timer(group='test', name='histogram', title='Test histogram',
+                               description='time to process timed events')
+            test_timer.stop_timer(test_timer.start_timer())
+            test_timer.stop_timer(test_timer.start_timer() - 300)
+            test_timer.stop_timer(test_timer.start_timer() - 60000)
+
+            timer = [t for t in Timer.find_all() if t.title == 'Test histogram'][0]
+            self.assertEqual(timer.count, 3)
+            self.assertEqual(sum(timer.buckets), 2)
+
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+
+        data = response.data.decode('utf-8')
+        self.assertIn('# TYPE alerta_test_histogram histogram', data)
+        self.assertIn('alerta_test_histogram_bucket{le="5"} 1', data)
+        self.assertIn('alerta_test_histogram_bucket{le="500"} 2', data)
+        self.assertIn('alerta_test_histogram_bucket{le="10000"} 2', data)
+        self.assertIn('alerta_test_histogram_bucket{le="+Inf"} 3', data)
+        self.assertIn('alerta_test_histogram_count 3', data)
+
+
+class BufferedMetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'METRICS_FLUSH_INTERVAL': 3600
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        metrics_buffer.pending.clear()
+        db.destroy()
+
+    def test_buffered_metrics(self):
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+
+            test_counter = Counter(group='test', name='buffered', title='Test counter',
+                                   description='number of buffered events')
+            for _ in range(5):
+                test_counter.inc()
+            test_timer = Timer(group='test', name='buffered', title='Test timer',
+                               description='time to process buffered events')
+            test_timer.stop_timer(test_timer.start_timer(), count=10)
+
+            self.assertEqual(test_counter.count, 5)
+            self.assertEqual(db.get_metrics(type='counter'), [])
+
+        response = self.client.get('/management/status')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+
+        counter = [m for m in data['metrics'] if m['group'] == 'test' and m['type'] == 'counter'][0]
+        self.assertEqual(counter['count'], 5)
+        timer = [m for m in data['metrics'] if m['group'] == 'test' and m['type'] == 'timer'][0]
+        self.assertEqual(timer['count'], 10)
+        self.assertEqual(timer['buckets'][0], {'le': 5, 'count': 10})
+
+    def test_flush_buffered_metrics(self):
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+
+            test_counter = Counter(group='test', name='flushed', title='Test counter',
+                                   description='number of flushed events')
+            test_counter.inc()
+
+            # buffered updates are written at exit
+            self.assertEqual(db.get_metrics(type='counter'), [])
+            metrics_buffer._flush_at_exit()
+            self.assertEqual(db.get_metrics(type='counter')[0].count, 1)
+
+            # and by a background thread every flush interval
+            self.app.config['METRICS_FLUSH_INTERVAL'] = 0.1
+            test_counter.inc()
+            for _ in range(50):
+                if db.get_metrics(type='counter')[0].count == 2:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(db.get_metrics(type='counter')[0].count, 2)
@@ -1,14 +1,18 @@
 import json
 import os
+import threading
+import time
 import unittest
 from typing import Any
 from uuid import uuid4
 
-from alerta.app import create_app, db, plugins
+from alerta.app import create_app, db, plugin_executor, plugins
 from alerta.exceptions import AlertaException, InvalidAction
 from alerta.models.alert import Alert
 from alerta.models.enums import Status
-from alerta.plugins import PluginBase
+from alerta.plugins import PluginBase, stub
+from alerta.plugins.reject import RejectPolicy
+from alerta.plugins.timeout import TimeoutPolicy
 
 
 class PluginsTestCase(unittest.TestCase):
@@ -460,6 +464,114 @@ class PluginsTestCase(unittest.TestCase):
 
         del plugins.plugins['ack1']
 
+    def test_async_plugins(self):
+
+        self.app.config['ASYNC_PLUGIN_CONCURRENCY'] = 1
+        self.app.config['ASYNC_PLUGIN_QUEUE_SIZE'] = 1
+        plugins.plugins['slow'] = SlowNotifyPlugin()
+
+        # post-receive hook runs in the background and can't change the alert
+        response = self.client.post('/alert', json=self.critical_alert, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertNotIn('notified', data['alert']['attributes'])
+        alert_id = data['id']
+
+        for _ in range(50):
+            if plugin_executor.stats.get('running'):
+                break
+            time.sleep(0.1)
+
+        # one hook is queued and the next is dropped
+        response = self.client.post('/alert', json=dict(self.critical_alert, resource='net02'), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id2 = json.loads(response.data.decode('utf-8'))['id']
+        response = self.client.post('/alert', json=dict(self.critical_alert, resource='net03'), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(plugin_executor.stats['dropped'], 1)
+
+        response = self.client.get('/management/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('alerta_plugins_queued 1', response.data.decode('utf-8'))
+
+        plugins.plugins['slow'].release.set()
+        plugin_executor.join()
+        self.assertListEqual(plugins.plugins['slow'].received, [alert_id, alert_id2])
+
+        response = self.client.put('/alert/' + alert_id + '/action', json={'action': 'ack'}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        plugin_executor.join()
+        self.assertListEqual(plugins.plugins['slow'].actions, [(alert_id, 'ack')])
+
+        # plugins can also be made asynchronous using config
+        plugins.plugins['test1'] = CustPlugin1()
+        self.assertFalse(plugin_executor.is_async(plugins.plugins['test1']))
+        self.app.config['ASYNC_PLUGINS'] = ['test1']
+        self.assertTrue(plugin_executor.is_async(plugins.plugins['test1']))
+
+    def test_dispatch_table(self):
+
+        plugins.plugins['stub'] = StubPlugin()
+        plugins.plugins['old1'] = OldPlugin1()
+
+        self.assertDictEqual(plugins.hooks_of(plugins.plugins['stub']), {'post_receive': False})
+        self.assertDictEqual(plugins.hooks_of(plugins.plugins['old1']),
+                             {'pre_receive': True, 'post_receive': False, 'status_change': False})
+        self.assertListEqual(plugins.dispatch('take_note', plugins.plugins.values()), [])
+
+        response = self.client.post('/alert', data=json.dumps(self.accept_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alert']['attributes']['stub'], 'post1')
+        self.assertEqual(data['alert']['attributes']['old'], 'post1')
+
+        # stub hooks are not called
+        response = self.client.put('/alert/' + data['id'] + '/note', data=json.dumps({'text': 'a note'}), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+
+    def test_cached_config(self):
+
+        plugins.plugins['reject'] = RejectPolicy()
+
+        response = self.client.post('/alert', data=json.dumps(self.accept_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/alert', data=json.dumps(self.accept_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(plugins.plugins['reject']._config_cache), 1)
+
+        # policy is compiled again when config changes
+        os.environ['ALLOWED_ENVIRONMENTS'] = 'Production,Development'
+        response = self.client.post('/alert', data=json.dumps(self.accept_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(plugins.plugins['reject']._config_cache), 2)
+
+        os.environ['ALLOWED_ENVIRONMENTS'] = 'Production,Staging,Development'
+
+        # and for config passed by routing rules
+        reject = plugins.plugins['reject']
+        config = {'ORIGIN_BLACKLIST': ['foo/.*']}
+        blacklist, _, _ = reject.cached_config(['ORIGIN_BLACKLIST'], reject.compile_policy, config=config)
+        self.assertListEqual([r.pattern for r in blacklist], ['foo/.*'])
+        self.assertIs(reject.cached_config(['ORIGIN_BLACKLIST'], reject.compile_policy, config=dict(config))[0], blacklist)
+
+    def test_timeout_policy(self):
+
+        policy = TimeoutPolicy()
+        with self.app.test_request_context():
+            alert = Alert(resource=self.resource, event='node_down')
+
+            # server timeouts come from the environment, not the config passed to the plugin
+            _, _, text, timeout = policy.take_action(alert, 'ack', '', timeout=60, config={'ACK_TIMEOUT': 60})
+            self.assertIsNone(timeout)
+
+            os.environ['SHELVE_TIMEOUT'] = '600'
+            try:
+                _, _, text, timeout = policy.take_action(alert, 'shelve', '', timeout=60, config={'SHELVE_TIMEOUT': 60})
+            finally:
+                del os.environ['SHELVE_TIMEOUT']
+            self.assertEqual(timeout, '600')
+            self.assertEqual(text, ' (using server timeout value)')
+
 
 class PluginTypeErrorTestCase(unittest.TestCase):
     """Test that TypeError raised inside a plugin is not swallowed by
@@ -600,6 +712,52 @@ class OldStylePlugin(PluginBase):
         return alert, status, text
 
 
+class SlowNotifyPlugin(PluginBase):
+
+    asynchronous = True
+
+    def __init__(self, name=None):
+        super().__init__(name)
+        self.release = threading.Event()
+        self.received = []
+        self.actions = []
+
+    def pre_receive(self, alert, **kwargs):
+        return alert
+
+    def post_receive(self, alert, **kwargs):
+        self.release.wait(5)
+        self.received.append(alert.id)
+        alert.attributes['notified'] = True
+        return alert
+
+    def status_change(self, alert, status, text, **kwargs):
+        return
+
+    def post_action(self, alert, action, text, **kwargs):
+        self.actions.append((alert.id, action))
+
+
+class StubPlugin(PluginBase):
+
+    @stub
+    def pre_receive(self, alert, **kwargs):
+        return alert
+
+    def post_receive(self, alert):
+        alert.attributes['stub'] = 'post1'
+        return alert
+
+    @stub
+    def status_change(self, alert, status, text, **kwargs):
+        return
+
+    @stub
+    def take_note(self, alert, text, **kwargs):
+        """Notes are not supported."""
+        raise NotImplementedError('take_note() not supported')
+
+
 class OldPlugin1(PluginBase):
 
     def pre_receive(self, alert, **kwargs):
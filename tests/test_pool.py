@@ -0,0 +1,147 @@
+import threading
+import time
+import unittest
+
+from alerta.app import create_app, db
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_config = {
+            'TESTING': True,
+            'DATABASE_POOL_MIN_SIZE': 1,
+            'DATABASE_POOL_MAX_SIZE': 2,
+            'DATABASE_POOL_TIMEOUT': 1
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('connection pool only supported by postgres')
+
+    def tearDown(self):
+        db.destroy()
+
+    def test_pool_reuse(self):
+        for _ in range(5):
+            with self.app.app_context():
+                self.assertTrue(db.is_alive)
+
+        stats = db.get_pool_stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['checkedOut'], 0)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_pool_exhausted(self):
+        from alerta.database.backends.postgres.pool import PoolTimeout
+
+        conn1 = db.connect()
+        conn2 = db.connect()
+        self.assertEqual(db.get_pool_stats()['checkedOut'], 2)
+
+        with self.assertRaises(PoolTimeout):
+            db.connect()
+
+        db.close(conn1)
+        conn3 = db.connect()
+        self.assertIs(conn3, conn1)
+
+        db.close(conn2)
+        db.close(conn3)
+        self.assertEqual(db.get_pool_stats()['idle'], 2)
+
+    def test_pool_recycle(self):
+        conn = db.connect()
+        conn.close()  # eg. server terminated connection
+        db.close(conn)
+
+        stats = db.get_pool_stats()
+        self.assertEqual(stats['recycled'], 1)
+        self.assertEqual(stats['size'], 0)
+
+        with self.app.app_context():
+            self.assertTrue(db.is_alive)
+
+    def test_pool_max_size(self):
+        from alerta.database.backends.postgres.pool import (ConnectionPool,
+                                                            PoolTimeout)
+
+        class FakeConn:
+            closed = False
+
+        def connect():
+            time.sleep(0.1)  # slow connect so that callers overlap
+            return FakeConn()
+
+        pool = ConnectionPool(connect, min_size=0, max_size=2, timeout=0.5)
+        conns = []
+
+        def getconn():
+            try:
+                conns.append(pool.getconn())
+            except PoolTimeout:
+                pass
+
+        threads = [threading.Thread(target=getconn) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(conns), 2)
+        self.assertEqual(pool.created, 2)
+
+    def test_pool_after_fork(self):
+        conn = db.connect()
+        db.close(conn)
+        pool = db.pool
+
+        pool.pid = -1  # simulate a forked worker process
+        self.assertEqual(db.get_pool_stats(), {})
+
+        conn = db.connect()
+        self.assertIsNot(db.pool, pool)
+        self.assertEqual(db.get_pool_stats()['checkedOut'], 1)
+        db.close(conn)
+
+
+class MongoClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        test_config = {
+            'TESTING': True,
+            'DATABASE_POOL_MAX_SIZE': 2
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        if not self.app.config['DATABASE_URL'].startswith('mongodb'):
+            self.skipTest('shared client only used by mongodb')
+
+    def tearDown(self):
+        db.destroy()
+
+    def test_client_reuse(self):
+        clients = set()
+        for _ in range(5):
+            with self.app.app_context():
+                self.assertTrue(db.is_alive)
+                clients.add(id(db.get_db().client))
+        self.assertEqual(len(clients), 1)
+
+        stats = db.get_pool_stats()
+        self.assertEqual(stats['checkedOut'], 0)
+        self.assertGreaterEqual(stats['servers'], 1)
+
+    def test_client_after_fork(self):
+        with self.app.app_context():
+            self.assertTrue(db.is_alive)
+        client = db.client
+
+        db.client_pid = -1  # simulate a forked worker process
+        self.assertEqual(db.get_pool_stats(), {})
+
+        with self.app.app_context():
+            self.assertTrue(db.is_alive)
+        self.assertIsNot(db.client, client)
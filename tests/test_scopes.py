@@ -153,6 +153,53 @@ class ScopesTestCase(unittest.TestCase):
         self.assertEqual(data['permission']['scopes'], [Scope.write, Scope.read])
         self.assertEqual(data['permission']['match'], 'read-write')
 
+    def test_cached_lookup(self):
+
+        headers = {
+            'Authorization': f"Key {self.api_keys_scopes['admin']}",
+            'Content-type': 'application/json'
+        }
+
+        login = 'user@alerta.io'
+        roles = ['web', 'dba']
+
+        with self.app.test_request_context():
+            self.assertEqual(Permission.lookup(login, roles), [])
+
+        payload = {
+            'scopes': [Scope.read, Scope.write_alerts],
+            'match': 'web'
+        }
+        response = self.client.post('/perm', data=json.dumps(payload), headers=headers)
+        self.assertEqual(response.status_code, 201)
+        web_id = json.loads(response.data.decode('utf-8'))['id']
+
+        payload = {
+            'scopes': [Scope.read, Scope.admin_keys],
+            'match': 'dba'
+        }
+        response = self.client.post('/perm', data=json.dumps(payload), headers=headers)
+        self.assertEqual(response.status_code, 201)
+
+        # scopes are resolved again after permissions are changed
+        with self.app.test_request_context():
+            self.assertEqual(Permission.lookup(login, roles), [Scope.admin_keys, Scope.read, Scope.write_alerts])
+
+        update = {
+            'scopes': [Scope.read]
+        }
+        response = self.client.put('/perm/' + web_id, data=json.dumps(update), headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.test_request_context():
+            self.assertEqual(Permission.lookup(login, roles), [Scope.admin_keys, Scope.read])
+
+        response = self.client.delete('/perm/' + web_id, headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.test_request_context():
+            self.assertEqual(Permission.lookup(login, ['web']), [])
+
     def test_custom_scopes(self):
 
         headers = {
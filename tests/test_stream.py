@@ -0,0 +1,108 @@
+import json
+import unittest
+from uuid import uuid4
+
+from alerta.app import alert_stream, create_app, db
+
+
+class AlertStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        test_config = {
+            'TESTING': True,
+            'AUTH_REQUIRED': False,
+            'STREAM_ENABLED': True,
+            'STREAM_INTERVAL': 0,
+            'STREAM_KEEPALIVE': 1
+        }
+        self.app = create_app(test_config)
+        self.client = self.app.test_client()
+
+        if not self.app.config['DATABASE_URL'].startswith('postgres'):
+            self.skipTest('alert stream tests need postgres')
+
+        self.alert = {
+            'event': 'node_down',
+            'resource': str(uuid4()).upper()[:8],
+            'environment': 'Production',
+            'service': ['Network'],
+            'severity': 'major'
+        }
+
+        self.headers = {
+            'Content-type': 'application/json'
+        }
+
+    def tearDown(self):
+        alert_stream.stop()
+        db.destroy()
+
+    def next_event(self, events):
+        # skip keep-alive comments
+        chunk = next(events).decode('utf-8')
+        while chunk.startswith(':'):
+            chunk = next(events).decode('utf-8')
+        event, data = chunk.strip().split('\n')
+        return event[len('event: '):], json.loads(data[len('data: '):])
+
+    def test_stream_disabled(self):
+
+        self.app.config['STREAM_ENABLED'] = False
+        response = self.client.get('/alerts/stream')
+        self.assertEqual(response.status_code, 404)
+
+    def test_alert_stream(self):
+
+        response = self.client.get('/alerts/stream?environment=Production', buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = iter(response.response)
+        self.assertEqual(next(events), b': connected\n\n')
+
+        # alerts that do not match the filter are not sent
+        response = self.client.post('/alert', data=json.dumps(dict(self.alert, environment='Development')), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        other_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.post('/alert', data=json.dumps(self.alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        alert_id = json.loads(response.data.decode('utf-8'))['id']
+
+        event, data = self.next_event(events)
+        self.assertEqual(event, 'create')
+        self.assertEqual(data['id'], alert_id)
+        self.assertEqual(data['environment'], 'Production')
+
+        # alerts that do not match the filter after they changed are removed only once
+        for tag in ['foo', 'bar']:
+            response = self.client.put(f'/alert/{other_id}/tag', data=json.dumps({'tags': [tag]}), headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+
+        event, data = self.next_event(events)
+        self.assertEqual(event, 'remove')
+        self.assertEqual(data['id'], other_id)
+
+        response = self.client.put(f'/alert/{alert_id}/status', data=json.dumps({'status': 'ack'}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        event, data = self.next_event(events)
+        self.assertEqual(event, 'status')
+        self.assertEqual(data['status'], 'ack')
+
+        response = self.client.put(f'/alert/{alert_id}/tag', data=json.dumps({'tags': ['foo']}), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        event, data = self.next_event(events)
+        self.assertEqual(event, 'update')
+        self.assertListEqual(data['tags'], ['foo'])
+
+        response = self.client.delete(f'/alert/{alert_id}')
+        self.assertEqual(response.status_code, 200)
+
+        event, data = self.next_event(events)
+        self.assertEqual(event, 'delete')
+        self.assertEqual(data['id'], alert_id)
+
+        events.close()
+        self.assertEqual(len(alert_stream.subscriptions), 0)
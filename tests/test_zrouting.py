@@ -194,6 +194,30 @@ class RoutingTestCase(unittest.TestCase):
         self.assertEqual(data['alert']['attributes']['precedence']['var2'], 'setting2')
         self.assertEqual(data['alert']['attributes']['precedence']['var3'], 'default3')
 
+    def test_routing_key(self):
+
+        def routing_key(alert):
+            return alert.customer, alert.repeat is None
+
+        # only this test caches routes, the others call the rules for every alert
+        plugins.routes.clear()
+        self.addCleanup(plugins.routes.clear)
+        patcher = patch.object(plugins, 'routing_key', routing_key)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        response = self.client.post('/alert', data=json.dumps(self.tier1_tc_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/alert', data=json.dumps(self.tier1_tc_alert), headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['alert']['attributes']['API_KEY'], 'tc-key')
+
+        # one route for pre-receive, one for post-receive
+        self.assertListEqual(list(plugins.routes), [('Tyrell Corporation', True), ('Tyrell Corporation', False)])
+        _, config = plugins.routes[('Tyrell Corporation', True)]
+        self.assertEqual(config['HOOK'], 'pre-receive')
+
     def test_routing(self):
 
         # create alert (pagerduty key for Tyrell Corporation)